@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.contrib import admin
 from django.core.mail import send_mail
-from blurber.models import Review, Song, ScheduledWeek
+from blurber.models import Review, Song, ScheduledWeek, PublishJob
 
 
 def send_email_if_blurb_removed(obj, user):
@@ -41,7 +41,19 @@ class SongAdmin(admin.ModelAdmin):
     search_reviews_link.short_description = ''
     search_reviews_link.allow_tags = True
 
-    list_display = ['artist', 'title', 'status', 'publish_date']
+    def blurbs(self, obj):
+        return obj.blurb_count
+    blurbs.admin_order_field = 'saved_blurb_count'
+
+    def average(self, obj):
+        return round(obj.average, 2)
+    average.admin_order_field = 'average'
+
+    def controversy(self, obj):
+        return round(obj.controversy, 2)
+    controversy.admin_order_field = 'controversy'
+
+    list_display = ['artist', 'title', 'status', 'publish_date', 'blurbs', 'average', 'controversy']
     list_filter = ['status']
     ordering = ['-publish_date']
     search_fields = ['artist', 'title']
@@ -59,6 +71,10 @@ class SongAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Stats are worked out in the changelist query, so the columns can be sorted on
+        return super(SongAdmin, self).get_queryset(request).with_stats()
+
 
 class ReviewAdmin(admin.ModelAdmin):
 
@@ -77,6 +93,17 @@ class ReviewAdmin(admin.ModelAdmin):
 
         obj.save()
 
+
+class PublishJobAdmin(admin.ModelAdmin):
+
+    list_display = ['song', 'status', 'run_after', 'finished', 'requested_by']
+    list_filter = ['status']
+    ordering = ['-create_date']
+    readonly_fields = ['song', 'requested_by', 'create_date', 'started', 'finished', 'error', 'public_post']
+    fields = ('song', 'status', 'run_after', 'requested_by', 'create_date', 'started', 'finished', 'error', 'public_post')
+
+
 admin.site.register(Review, ReviewAdmin)
 admin.site.register(Song, SongAdmin)
 admin.site.register(ScheduledWeek, ScheduledWeekAdmin)
+admin.site.register(PublishJob, PublishJobAdmin)
@@ -0,0 +1,91 @@
+"""
+Streaming export of the archive, for backups (see export_archive).
+
+Rows are read in primary key order, chunk_size rows per query, and
+written out as they arrive, so memory use stays the same however big
+the archive gets. Passwords and derived columns (song score stats,
+prev/next post links) are left out; the rebuild commands recreate the
+latter after an import.
+"""
+import csv
+import gzip
+import json
+from datetime import date, datetime
+
+from blurber.models import Song, Review
+from tsj.models import PublicPost, Comment
+from writers.models import Writer
+
+# (file name, model, columns to leave out)
+ARCHIVE_TABLES = (
+    ('writers', Writer, ('password',)),
+    ('songs', Song, Song.SCORE_STATS_FIELDS),
+    ('reviews', Review, ()),
+    ('public_posts', PublicPost, ('previous_post', 'next_post')),
+    ('comments', Comment, ()),
+)
+
+FORMATS = ('ndjson', 'csv')
+
+
+def export_fields(model, exclude=()):
+    # Column names as stored, e.g. song_id rather than song; the primary key comes first
+    return [field.attname for field in model._meta.concrete_fields if field.name not in exclude]
+
+
+def iter_rows(queryset, fields, chunk_size=2000):
+    """
+    Yield value tuples for the queryset in primary key order, fetching
+    chunk_size rows at a time by seeking past the last key seen.
+    fields[0] must be the primary key.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list(*fields)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def open_output(path, compress=False):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_rows(out, rows, fields, fmt):
+    """Write the rows as NDJSON (one object per line) or CSV with a header. Returns the row count."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for row in rows:
+            # CSV has no null: empty cells are None or ''
+            writer.writerow(['' if value is None else export_value(value) for value in row])
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(dict(zip(fields, (export_value(value) for value in row)))))
+            out.write('\n')
+            count += 1
+    return count
+
+
+def export_table(model, exclude, path, fmt='ndjson', compress=False, since=None, chunk_size=2000):
+    """Export one table to path, only rows changed since the given datetime if there is one."""
+    queryset = model._default_manager.all()
+    if since is not None:
+        queryset = queryset.filter(last_modified__gte=since)
+    fields = export_fields(model, exclude)
+    with open_output(path, compress) as out:
+        return write_rows(out, iter_rows(queryset, fields, chunk_size), fields, fmt)
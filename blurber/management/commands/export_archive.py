@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blurber.archive import ARCHIVE_TABLES, FORMATS, export_table
+
+
+class Command(BaseCommand):
+    help = "Stream writers, songs, reviews, public posts and comments to one NDJSON or CSV file per table, " \
+           "optionally only the rows changed since a watermark."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='.', help="Directory to write the files to (default: current).")
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', dest='fmt')
+        parser.add_argument('--gzip', action='store_true', dest='compress', help="Gzip each file.")
+        parser.add_argument('--since', help="Only export rows changed at or after this ISO 8601 time.")
+        parser.add_argument(
+            '--watermark',
+            help="File holding the time of the last export. Rows changed since then are exported "
+                 "(everything if the file doesn't exist yet) and the file is updated afterwards."
+        )
+        parser.add_argument('--tables', nargs='+', choices=[name for name, model, exclude in ARCHIVE_TABLES],
+                            help="Only export these tables.")
+        parser.add_argument('--chunk-size', type=int, default=2000, dest='chunk_size',
+                            help="Rows fetched per query (default 2000).")
+
+    def handle(self, *args, **options):
+        since = self.parse_since(options['since'])
+        watermark = options['watermark']
+        if watermark and since is None and os.path.exists(watermark):
+            with open(watermark) as f:
+                since = self.parse_since(f.read().strip())
+
+        os.makedirs(options['output'], exist_ok=True)
+        # Anything changed while we export is picked up again next time
+        started = timezone.now()
+        extension = options['fmt'] + ('.gz' if options['compress'] else '')
+
+        for name, model, exclude in ARCHIVE_TABLES:
+            if options['tables'] and name not in options['tables']:
+                continue
+            path = os.path.join(options['output'], '%s.%s' % (name, extension))
+            count = export_table(
+                model, exclude, path, fmt=options['fmt'], compress=options['compress'],
+                since=since, chunk_size=options['chunk_size']
+            )
+            self.stdout.write("Exported %s %s to %s" % (count, name, path))
+
+        if watermark:
+            with open(watermark, 'w') as f:
+                f.write(started.isoformat())
+
+    @staticmethod
+    def parse_since(value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError("Can't read %r as a date and time, use ISO 8601." % value)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
@@ -0,0 +1,47 @@
+from math import isclose
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blurber.models import Song
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored score stats for every song and verify them against the reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true', dest='check',
+            help="Only report songs whose stored stats are out of date, don't rebuild them."
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        stale, failed, total = 0, 0, 0
+
+        for song in Song.objects.order_by('pk').iterator():
+            total += 1
+            if not self.stats_match(song):
+                stale += 1
+                self.stdout.write("Stale stats for song %s: %s" % (song.pk, song))
+            if check_only:
+                continue
+
+            song.refresh_score_stats()
+            if not self.stats_match(song):
+                failed += 1
+                self.stderr.write("Stats still differ after rebuild for song %s" % song.pk)
+
+        self.stdout.write("Checked %s songs, %s had stale stats." % (total, stale))
+        if failed:
+            raise CommandError("%s songs failed verification after rebuild." % failed)
+        if check_only and stale:
+            raise CommandError("%s songs have stale stats." % stale)
+
+    @staticmethod
+    def stats_match(song):
+        count, score_total, deviation_total = song.live_score_stats()
+        return (
+            song.saved_blurb_count == count and
+            song.score_total == score_total and
+            isclose(song.score_deviation_total, deviation_total, abs_tol=1e-9)
+        )
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blurber import publishing
+
+
+class Command(BaseCommand):
+    help = "Run queued publish jobs as they fall due. Runs until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', dest='once',
+            help="Run the jobs that are due now and exit."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=30,
+            help="Seconds to wait between checks for due jobs (default 30)."
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Maximum number of jobs to run per check."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in publishing.run_due_jobs(limit=options['limit']):
+                if job.status == 'done':
+                    self.stdout.write("Published %s" % job.song)
+                else:
+                    self.stderr.write("Failed to publish %s:\n%s" % (job.song, job.error))
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_score_stats(apps, schema_editor):
+    Song = apps.get_model('blurber', 'Song')
+    Review = apps.get_model('blurber', 'Review')
+
+    for song in Song.objects.all():
+        scores = list(
+            Review.objects.filter(song=song, status__in=['saved', 'published'])
+                .order_by('-create_date').values_list('score', flat=True)
+        )
+        if not scores:
+            continue
+        avg_score = round(sum(scores) / len(scores), 2)
+        Song.objects.filter(pk=song.pk).update(
+            saved_blurb_count=len(scores),
+            score_total=sum(scores),
+            score_deviation_total=sum(abs(avg_score - score) for score in scores)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blurber', '0009_auto_20181228_1637'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='saved_blurb_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='score_deviation_total',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='score_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_score_stats, migrations.RunPython.noop),
+    ]
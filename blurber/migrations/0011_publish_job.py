@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:42
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0008_publicpost_neighbour_links'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blurber', '0010_song_score_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('public_post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tsj.PublicPost')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-create_date'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='publish_date',
+            field=models.DateTimeField(blank=True, help_text='Schedule a publish time here (leave blank to publish straight away)', null=True),
+        ),
+        migrations.AddField(
+            model_name='publishjob',
+            name='song',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='publish_jobs', to='blurber.Song'),
+        ),
+        migrations.AddIndex(
+            model_name='publishjob',
+            index=models.Index(fields=['status', 'run_after'], name='blurber_publishjob_due'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:49
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blurber', '0012_review_writer_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['song', 'status', 'sort_order'], name='blurber_review_song_status'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['status', 'upload_date'], name='blurber_song_status_upload'),
+        ),
+    ]
@@ -1,9 +1,11 @@
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import models, transaction
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 
 from writers.models import Writer
+from blurber.signals import song_reviews_changed
 
 SONG_STATUS_CHOICES = (
     ('open', 'Open'),
@@ -12,6 +14,13 @@ SONG_STATUS_CHOICES = (
     ('removed', 'Removed'),
 )
 
+PUBLISH_JOB_STATUS_CHOICES = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
 BLURB_STATUS_CHOICES = (
     ('', 'N/A'),
     ('draft', 'Draft'),
@@ -21,6 +30,67 @@ BLURB_STATUS_CHOICES = (
 )
 
 
+class SongQuerySet(models.QuerySet):
+
+    def open(self):
+        """Songs writers can blurb."""
+        return self.filter(status='open')
+
+    def editable_by(self, user):
+        """The songs user can work on: open songs, plus closed ones (to order and publish) for editors."""
+        if user.is_staff:
+            return self.filter(status__in=Song.IN_PROGRESS_STATUSES)
+        return self.open()
+
+    def for_schedule(self, user):
+        """The schedule's song list for user, with `blurbed` set on the songs they have a review of."""
+        user_reviews = Review.objects.filter(song=models.OuterRef('pk'), writer=user).values('id')
+        return self.editable_by(user).annotate(blurbed=models.Exists(user_reviews))
+
+    def with_stats(self):
+        """
+        Annotate each song with `average` (as Song.average_score(), before
+        rounding) and `controversy` (see with_controversy()) from the stored
+        score stats, so listings can be sorted and filtered by them.
+        """
+        average = models.Case(
+            models.When(saved_blurb_count__lt=1, then=models.Value(0.0)),
+            default=models.ExpressionWrapper(
+                models.F('score_total') * models.Value(1.0) / models.F('saved_blurb_count'),
+                output_field=models.FloatField()
+            ),
+            output_field=models.FloatField()
+        )
+        return self.with_controversy().annotate(average=average)
+
+    def with_controversy(self):
+        """
+        Annotate each song with `controversy`, the same value as
+        Song.controversy_index(), worked out by the database from the
+        stored score stats so whole querysets can be ordered/filtered by it.
+
+        No index can cover an expression, so ordering or filtering by it
+        reads every song in the queryset. Filter by status first (the
+        status index narrows it down); a scan of the whole song table, as
+        the admin changelist does, is accepted: it is one row per song,
+        with no joins.
+        """
+        multiplier = models.Case(
+            models.When(saved_blurb_count__lt=9, then=models.Value(1.0)),
+            default=models.Value(1.0) + (models.F('saved_blurb_count') - 8) * models.Value(0.02),
+            output_field=models.FloatField()
+        )
+        avg_deviation = models.ExpressionWrapper(
+            models.F('score_deviation_total') / models.F('saved_blurb_count'),
+            output_field=models.FloatField()
+        )
+        return self.annotate(controversy=models.Case(
+            models.When(saved_blurb_count__lt=1, then=models.Value(0.0)),
+            default=multiplier * avg_deviation,
+            output_field=models.FloatField()
+        ))
+
+
 class Song(models.Model):
 
     artist = models.CharField(max_length=256)
@@ -46,8 +116,45 @@ class Song(models.Model):
     tagline = models.CharField(max_length=255, null=True, blank=True,
                                help_text="Will appear on published post and in search results.")
 
-    publish_date = models.DateTimeField(help_text="Schedule a publish time here (TODO)", null=True, blank=True)
+    publish_date = models.DateTimeField(help_text="Schedule a publish time here (leave blank to publish straight away)",
+                                        null=True, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
+    # For incremental exports (see blurber.archive)
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Aggregates over saved/published reviews, maintained by Review.save() and
+    # the review post_delete receiver
+    # so the schedule and post templates don't have to query for them.
+    saved_blurb_count = models.IntegerField(default=0, editable=False)
+    score_total = models.IntegerField(default=0, editable=False)
+    score_deviation_total = models.FloatField(default=0, editable=False)
+
+    SCORE_STATS_FIELDS = ('saved_blurb_count', 'score_total', 'score_deviation_total')
+
+    # Still on the schedule: open for blurbs, or closed and waiting to be published
+    IN_PROGRESS_STATUSES = ('open', 'closed')
+    # No longer taking blurbs
+    CLOSED_STATUSES = ('closed', 'published')
+
+    objects = SongQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        song = super(Song, cls).from_db(db, field_names, values)
+        # The status as loaded, so receivers can tell when it changes
+        song._loaded_status = song.__dict__.get('status')
+        return song
+
+    def save(self, *args, **kwargs):
+        # Never write back score stats from a possibly stale instance:
+        # they are only updated through refresh_score_stats()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.SCORE_STATS_FIELDS
+            ]
+        super(Song, self).save(*args, **kwargs)
+        self._loaded_status = self.status
 
     def saved_reviews(self):
         return self.review_set.filter(song=self, status__in=['saved', 'published'])
@@ -55,13 +162,44 @@ class Song(models.Model):
     def published_reviews(self):
         return self.review_set.filter(song=self, status__in=['published']).order_by('sort_order')
 
+    def live_score_stats(self):
+        """
+        Count, total and total absolute deviation (from the rounded average)
+        of the saved review scores, read straight from the reviews table.
+        """
+        return self.score_stats(list(self.saved_reviews().values_list('score', flat=True)))
+
+    @staticmethod
+    def score_stats(scores):
+        # The stored stats for a list of saved review scores
+        if not scores:
+            return 0, 0, 0
+
+        avg_score = round(sum(scores) / len(scores), 2)
+        running_deviation = 0
+        for score in scores:
+            running_deviation += abs(avg_score - score)
+        return len(scores), sum(scores), running_deviation
+
+    def refresh_score_stats(self):
+        # Called from Review.save() and publishing, which already have a
+        # transaction: like Model.save(), don't add a savepoint of our own
+        with transaction.atomic(savepoint=False):
+            # Lock the song row so concurrent review saves are applied in turn
+            Song.objects.select_for_update().filter(pk=self.pk).exists()
+            self.saved_blurb_count, self.score_total, self.score_deviation_total = self.live_score_stats()
+            Song.objects.filter(pk=self.pk).update(
+                **{field: getattr(self, field) for field in self.SCORE_STATS_FIELDS}
+            )
+            song_reviews_changed.send(sender=Song, song=self)
+
     @property
     def blurb_count(self):
-        return self.saved_reviews().count()
+        return self.saved_blurb_count
 
     @property
     def css_class(self):
-        if self.status in ['published', 'closed']:
+        if self.closed:
             return 'dead'
         if self.blurb_count == 0:
             return 'new'
@@ -73,12 +211,11 @@ class Song(models.Model):
 
     @property
     def closed(self):
-        return True if self.status in ['published', 'closed'] else False
+        return self.status in self.CLOSED_STATUSES
 
     def average_score(self):
         if self.blurb_count > 0:
-            score_avg = self.saved_reviews().aggregate(models.Avg('score'))
-            return round(score_avg.get('score__avg', 0), 2)
+            return round(self.score_total / self.blurb_count, 2)
         return 0
 
     def controversy_index(self):
@@ -90,16 +227,12 @@ class Song(models.Model):
         if there are nine voters he multiplies by 1.02, if there are ten he
         multiplies by 1.04, eleven by 1.06, and so on.
         """
-        avg_score = self.average_score()
         review_count = self.blurb_count
         # Return zero for a song with no reviews.
         if review_count < 1:
             return 0
 
-        running_deviation = 0
-        for bl in self.saved_reviews():
-            running_deviation += abs(avg_score - bl.score)
-        avg_deviation = running_deviation / review_count
+        avg_deviation = self.score_deviation_total / review_count
 
         return self.multiplier * avg_deviation
 
@@ -128,6 +261,35 @@ class Song(models.Model):
         permissions = (
             ("can_edit_overall_score", "Editor can edit overall score"),
         )
+        indexes = [
+            # Schedule page: open/closed songs, newest first
+            models.Index(fields=['status', 'upload_date'], name='blurber_song_status_upload'),
+        ]
+
+
+class ReviewQuerySet(models.QuerySet):
+
+    # What the post, the reviews page and blurb listings show of each review
+    DISPLAY_FIELDS = (
+        'id', 'song', 'writer', 'blurb', 'score', 'sort_order', 'status', 'create_date',
+        'song__artist', 'song__title', 'song__status',
+        'writer__first_name', 'writer__last_name', 'writer__bio_link',
+    )
+
+    def for_display(self):
+        """Only load the columns the review listings use, leaving out e.g. blurb backups and password hashes."""
+        return self.only(*self.DISPLAY_FIELDS)
+
+    def for_post(self, song):
+        """A song's saved and published reviews in post order."""
+        return self.filter(song=song, status__in=['saved', 'published']).order_by('sort_order').for_display()
+
+
+class ReviewManager(models.Manager.from_queryset(ReviewQuerySet)):
+
+    def get_queryset(self):
+        # Review.__str__ and every page listing reviews show their song and writer
+        return super(ReviewManager, self).get_queryset().select_related('song', 'writer')
 
 
 class Review(models.Model):
@@ -143,15 +305,45 @@ class Review(models.Model):
     status = models.CharField(choices=BLURB_STATUS_CHOICES, max_length=20, default='draft')
 
     create_date = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ReviewManager()
 
     def __str__(self):
         return "%s - %s: %s" % (self.song.artist, self.song.title, self.writer.initials())
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super(Review, cls).from_db(db, field_names, values)
+        # As loaded, so moving the review to another song (or writer or month)
+        # refreshes the stats of both without querying for the old values
+        review._loaded_song_id = review.__dict__.get('song_id')
+        review._loaded_writer_id = review.__dict__.get('writer_id')
+        review._loaded_create_date = review.__dict__.get('create_date')
+        return review
+
+    def save(self, *args, **kwargs):
+        # Deletes are handled by a post_delete receiver in blurber.signals
+        with transaction.atomic(savepoint=False):
+            super(Review, self).save(*args, **kwargs)
+            self.song.refresh_score_stats()
+            previous_song_id = getattr(self, '_loaded_song_id', None)
+            if previous_song_id and previous_song_id != self.song_id:
+                Song.objects.get(pk=previous_song_id).refresh_score_stats()
+        self._loaded_song_id, self._loaded_writer_id, self._loaded_create_date = \
+            self.song_id, self.writer_id, self.create_date
+
     class Meta:
         ordering = ['-create_date']
         permissions = (
             ("can_edit_blurb", "Editor can edit blurb"),
         )
+        indexes = [
+            # A song's saved/published reviews in post order (reviews page, preview, publishing)
+            models.Index(fields=['song', 'status', 'sort_order'], name='blurber_review_song_status'),
+            # A writer's blurbs by date (schedule page, my blurbs, writer list)
+            models.Index(fields=['writer', 'create_date'], name='blurber_review_writer_date'),
+        ]
 
 
 class ScheduledWeek(models.Model):
@@ -170,6 +362,9 @@ class ScheduledWeek(models.Model):
     week_info = models.TextField(max_length=4000)
     current_week = models.BooleanField(help_text="Show as the current scheduled week", default=False)
 
+    # The days shown on the schedule page, for prefetch_related()
+    SCHEDULE_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+
     def __str__(self):
         return self.week_beginning.strftime("%D/%M/%Y")
 
@@ -227,3 +422,42 @@ class ScheduledWeek(models.Model):
 
     class Meta:
         ordering = ['-week_beginning']
+
+
+class PublishJobQuerySet(models.QuerySet):
+
+    def pending(self):
+        return self.filter(status__in=['queued', 'running'])
+
+    def due(self, now=None):
+        return self.filter(status='queued', run_after__lte=now or timezone.now()).order_by('run_after', 'id')
+
+
+class PublishJob(models.Model):
+    """
+    A queued request to publish a song, picked up by the
+    run_publish_jobs worker once run_after has passed.
+    """
+    song = models.ForeignKey(Song, related_name='publish_jobs')
+    requested_by = models.ForeignKey(Writer, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(choices=PUBLISH_JOB_STATUS_CHOICES, max_length=20, default='queued')
+
+    run_after = models.DateTimeField(default=timezone.now)
+    create_date = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    error = models.TextField(blank=True)
+    public_post = models.ForeignKey('tsj.PublicPost', null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name='+')
+
+    objects = PublishJobQuerySet.as_manager()
+
+    def __str__(self):
+        return "%s: %s" % (self.song, self.get_status_display())
+
+    class Meta:
+        ordering = ['-create_date']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='blurber_publishjob_due'),
+        ]
@@ -0,0 +1,96 @@
+"""
+Database-backed publishing queue.
+
+The publish view only records a PublishJob; the run_publish_jobs
+command picks up jobs once they are due, marks the reviews and song
+as published and stores the rendered post as a PublicPost. Saving the
+PublicPost reindexes it and invalidates the cached public pages (see
+tsj.signals).
+"""
+import traceback
+
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from blurber.models import PublishJob, Review, Song
+from tsj.models import PublicPost
+
+
+def enqueue_publish(song, requested_by=None):
+    """
+    Queue a song for publishing at its publish_date (or straight
+    away), reusing any job that is already waiting for it.
+    """
+    existing = song.publish_jobs.pending().first()
+    if existing is not None:
+        return existing
+
+    now = timezone.now()
+    run_after = song.publish_date if song.publish_date and song.publish_date > now else now
+    return PublishJob.objects.create(song=song, requested_by=requested_by, run_after=run_after)
+
+
+def render_song_post(song):
+    # The same markup as the editors' source view, rendered without a request
+    return render_to_string('preview_source.html', {
+        'reviews': Review.objects.for_post(song), 'song': song, 'show_admin_links': False}
+    )
+
+
+def claim_job(job):
+    """
+    Move a queued job to running. Returns False if another worker got
+    there first, so jobs run at most once without needing row locks.
+    """
+    now = timezone.now()
+    claimed = PublishJob.objects.filter(pk=job.pk, status='queued').update(status='running', started=now)
+    if claimed:
+        job.status, job.started = 'running', now
+    return bool(claimed)
+
+
+def publish_song(job):
+    with transaction.atomic():
+        # Lock the song while its reviews and status change
+        song = Song.objects.select_for_update().get(pk=job.song_id)
+        if song.status != 'closed':
+            raise ValueError("Only closed songs can be published (song is %s)." % song.status)
+
+        Review.objects.filter(song=song, status='saved').update(status='published', last_modified=timezone.now())
+        song.status = 'published'
+        # Just the status, so the search index doesn't follow it as a song edit (see tsj.signals)
+        # The bulk update skipped Review.save(), but the status change refreshes
+        # the reviewers' stats anyway (see writers.signals)
+        song.save(update_fields=['status', 'last_modified'])
+
+        return PublicPost.objects.create(
+            song=song,
+            html_content=render_song_post(song),
+            # When the worker actually ran, not when the job fell due: a
+            # late worker would otherwise backdate the post
+            published_on=timezone.now()
+        )
+
+
+def run_job(job):
+    if not claim_job(job):
+        return False
+
+    try:
+        job.public_post = publish_song(job)
+        job.status = 'done'
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+    job.finished = timezone.now()
+    job.save()
+    return True
+
+
+def run_due_jobs(limit=None, now=None):
+    """Run queued jobs that are due, oldest first. Returns the jobs that were run."""
+    jobs = PublishJob.objects.due(now).select_related('song')
+    if limit is not None:
+        jobs = jobs[:limit]
+    return [job for job in jobs if run_job(job)]
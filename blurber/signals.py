@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver, Signal
+
+# Sent once a song's reviews have changed (saved, deleted, published, ...)
+# and its stored score stats are up to date. Receivers get the song.
+song_reviews_changed = Signal(providing_args=['song'])
+
+
+# blurber.models imports this module, so the model is named rather than imported
+@receiver(post_delete, sender='blurber.Review')
+def refresh_deleted_review_song(sender, instance, **kwargs):
+    # Also sent for queryset deletes and cascades (e.g. deleting a writer)
+    instance.song.refresh_score_stats()
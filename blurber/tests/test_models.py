@@ -1,9 +1,28 @@
-from datetime import datetime, timezone
+import csv
+import gzip
+import json
+import os
+import random
+import re
+from unittest import skipUnless
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from tempfile import TemporaryDirectory
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as dj_timezone
 
 from writers.models import Writer
-from tsj.models import PublicPost
-from blurber.models import Song, Review, ScheduledWeek
+from tsj.models import PublicPost, Comment
+from tsj.search import search
+from tsj.views import get_recent_comments
+from writers.views import get_reviews_by_status_and_year, get_year_index
+from blurber.models import Song, Review, ScheduledWeek, PublishJob
+from blurber import publishing
+from blurber.archive import export_fields, iter_rows
 
 
 class SongTestBase(TestCase):
@@ -293,3 +312,419 @@ class ScheduledWeekTests(TestCase):
         )
         for i in range(1, 5):
             self.assertQuerysetEqual(actual[i]['songs'], [])
+
+
+class ScoreStatsTests(SongTestBase):
+
+    def assert_stats_are_live(self, song):
+        song.refresh_from_db()
+        self.assertEqual(
+            (song.saved_blurb_count, song.score_total, song.score_deviation_total),
+            song.live_score_stats()
+        )
+
+    def test_new_review_updates_stats(self):
+        self.generate_additional_review(self.song, 3)
+
+        self.assertEqual(self.song.blurb_count, 2)
+        self.assertEqual(self.song.average_score(), 4)
+        self.assert_stats_are_live(self.song)
+
+    def test_rescoring_review_updates_stats(self):
+        self.saved_review.score = 9
+        self.saved_review.save()
+
+        self.song.refresh_from_db()
+        self.assertEqual(self.song.average_score(), 9)
+        self.assert_stats_are_live(self.song)
+
+    def test_removing_or_deleting_review_updates_stats(self):
+        r = self.generate_additional_review(self.song, 3)
+        r.status = 'removed'
+        r.save()
+        self.assertEqual(self.song.blurb_count, 1)
+
+        self.saved_review.delete()
+        self.song.refresh_from_db()
+        self.assertEqual(self.song.blurb_count, 0)
+        self.assertEqual(self.song.controversy_index(), 0)
+
+    def test_queryset_and_cascade_deletes_update_stats(self):
+        other_writer_review = self.generate_additional_review(self.song, 3)
+
+        Review.objects.filter(pk=self.saved_review.pk).delete()
+        self.assert_stats_are_live(self.song)
+        self.assertEqual(self.song.blurb_count, 1)
+
+        other_writer_review.writer.delete()
+        self.assert_stats_are_live(self.song)
+        self.assertEqual(self.song.blurb_count, 0)
+
+    def test_moving_review_to_another_song_updates_both(self):
+        review = Review.objects.get(pk=self.saved_review.pk)
+        review.song = self.new_song
+        review.save()
+
+        self.assert_stats_are_live(self.song)
+        self.assert_stats_are_live(self.new_song)
+        self.assertEqual((self.song.blurb_count, self.new_song.blurb_count), (0, 1))
+
+    def test_song_save_does_not_overwrite_stats_from_stale_instance(self):
+        stale_song = Song.objects.get(pk=self.song.pk)
+        self.generate_additional_review(self.song, 3)
+
+        stale_song.tagline = 'Fishing for compliments'
+        stale_song.save()
+        self.assert_stats_are_live(stale_song)
+
+    def test_rebuild_command_fixes_stale_stats(self):
+        Song.objects.filter(pk=self.song.pk).update(saved_blurb_count=0, score_total=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_song_stats', check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_song_stats', stdout=out)
+
+        self.assertIn("had stale stats", out.getvalue())
+        self.assert_stats_are_live(self.song)
+        call_command('rebuild_song_stats', check=True, stdout=StringIO())
+
+
+class ControversyAnnotationTests(TestCase):
+
+    @staticmethod
+    def reference_controversy_index(scores):
+        # The original per-review loop from Song.controversy_index()
+        if not scores:
+            return 0
+        avg_score = round(sum(scores) / len(scores), 2)
+        running_deviation = 0
+        for score in scores:
+            running_deviation += abs(avg_score - score)
+        multiplier = 1 if len(scores) < 9 else 1 + (len(scores) - 8) * 0.02
+        return multiplier * running_deviation / len(scores)
+
+    def test_annotation_matches_python_result_for_random_songs(self):
+        rng = random.Random(1998)
+        writers = [
+            Writer.objects.create(username=i, email=i, first_name=i, last_name=i)
+            for i in range(25)
+        ]
+        expected = {}
+        for i in range(60):
+            song = Song.objects.create(artist='Artist %s' % i, title='Title %s' % i)
+            scores = []
+            for writer in rng.sample(writers, rng.randint(0, len(writers))):
+                status = rng.choice(['saved', 'saved', 'published', 'draft', 'removed'])
+                score = rng.randint(0, 10)
+                Review.objects.create(song=song, writer=writer, blurb='-', score=score, status=status)
+                if status in ['saved', 'published']:
+                    scores.append(score)
+            expected[song.pk] = self.reference_controversy_index(scores)
+
+        for song in Song.objects.with_controversy():
+            self.assertAlmostEqual(song.controversy, expected[song.pk], places=2)
+            self.assertAlmostEqual(song.controversy, song.controversy_index(), places=2)
+
+    def test_songs_can_be_ordered_by_controversy(self):
+        writers = [
+            Writer.objects.create(username=i, email=i, first_name=i, last_name=i)
+            for i in range(4)
+        ]
+        calm = Song.objects.create(artist='Calm', title='Consensus')
+        divisive = Song.objects.create(artist='Divisive', title='Split')
+        silent = Song.objects.create(artist='Silent', title='Nobody')
+        for writer, calm_score, divisive_score in zip(writers, [5, 6, 5, 6], [0, 10, 1, 9]):
+            Review.objects.create(song=calm, writer=writer, blurb='-', score=calm_score, status='saved')
+            Review.objects.create(song=divisive, writer=writer, blurb='-', score=divisive_score, status='saved')
+
+        self.assertEqual(
+            list(Song.objects.with_controversy().order_by('-controversy')),
+            [divisive, calm, silent]
+        )
+        self.assertEqual(
+            list(Song.objects.with_controversy().filter(controversy__gt=1)),
+            [divisive]
+        )
+
+
+class SongQuerySetTests(SongTestBase):
+
+    def test_open(self):
+        self.assertEqual(set(Song.objects.open()), {self.song, self.new_song})
+
+    def test_editable_by_writers_and_editors(self):
+        editor = Writer.objects.create(username='editor', email='editor', is_staff=True)
+        self.assertEqual(set(Song.objects.editable_by(self.writer)), {self.song, self.new_song})
+        self.assertEqual(set(Song.objects.editable_by(editor)), {self.song, self.new_song, self.closed_song})
+
+    def test_with_stats(self):
+        self.generate_additional_review(self.song, 8)
+        self.generate_additional_review(self.song, 3, status='draft')
+
+        songs = {song: song for song in Song.objects.with_stats()}
+        self.assertEqual(songs[self.song].average, 6.5)
+        self.assertAlmostEqual(songs[self.song].controversy, self.song.controversy_index(), places=2)
+        self.assertEqual(songs[self.new_song].average, 0)
+        self.assertEqual(songs[self.new_song].controversy, 0)
+        self.assertEqual(list(Song.objects.with_stats().filter(average__gt=6)), [self.song])
+
+    def test_for_schedule_marks_songs_the_user_has_blurbed(self):
+        self.generate_additional_review(self.new_song, 1)
+
+        with self.assertNumQueries(1):
+            blurbed = {song: song.blurbed for song in Song.objects.for_schedule(self.writer)}
+        self.assertEqual(blurbed, {self.song: True, self.new_song: False})
+
+
+class ReviewQuerySetTests(SongTestBase):
+
+    def test_reviews_come_with_song_and_writer(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([str(r) for r in Review.objects.all()], ['Roisín Murphy - Gone Fishing: MW'])
+
+    def test_for_post_in_sort_order_without_unused_columns(self):
+        self.generate_additional_review(self.closed_song, 2)
+        self.generate_additional_review(self.closed_song, 1)
+        self.generate_additional_review(self.closed_song, 3, status='draft')
+
+        with self.assertNumQueries(1):
+            reviews = list(Review.objects.for_post(self.closed_song))
+            self.assertEqual([(r.writer.get_full_name(), r.blurb, r.score) for r in reviews], [
+                ('1 1', 'blurb 1', 1), ('2 2', 'blurb 2', 2)
+            ])
+        self.assertEqual(reviews[0].get_deferred_fields(), {'blurb_backup', 'last_modified'})
+        self.assertIn('password', reviews[0].writer.get_deferred_fields())
+
+
+class PublishJobTests(TestCase):
+
+    def setUp(self):
+        self.song = Song.objects.create(artist='Robyn', title='Missing U', status='closed')
+        self.writer = Writer.objects.create(username='w@example.com', email='w@example.com')
+        Review.objects.create(song=self.song, writer=self.writer, blurb='Sad bangers only', score=9, status='saved')
+
+    def test_job_publishes_song_and_renders_post(self):
+        job = publishing.enqueue_publish(self.song)
+
+        self.assertEqual(publishing.run_due_jobs(), [job])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(Song.objects.get(pk=self.song.pk).status, 'published')
+        self.assertEqual(list(self.song.review_set.values_list('status', flat=True)), ['published'])
+        self.assertIn('Sad bangers only', job.public_post.html_content)
+        self.assertTrue(job.public_post.visible)
+
+    def test_job_waits_for_scheduled_publish_date(self):
+        self.song.publish_date = dj_timezone.now() + timedelta(days=2)
+        self.song.save()
+        job = publishing.enqueue_publish(self.song)
+
+        self.assertEqual(job.run_after, self.song.publish_date)
+        self.assertEqual(publishing.run_due_jobs(), [])
+        self.assertEqual(publishing.run_due_jobs(now=self.song.publish_date), [job])
+
+    def test_late_job_is_dated_when_it_runs(self):
+        job = publishing.enqueue_publish(self.song)
+        PublishJob.objects.filter(pk=job.pk).update(run_after=dj_timezone.now() - timedelta(hours=6))
+
+        before = dj_timezone.now()
+        publishing.run_due_jobs()
+        self.assertGreaterEqual(PublicPost.objects.get(song=self.song).published_on, before)
+
+    def test_past_publish_date_publishes_straight_away(self):
+        self.song.publish_date = dj_timezone.now() - timedelta(days=2)
+        self.song.save()
+
+        job = publishing.enqueue_publish(self.song)
+
+        self.assertGreater(job.run_after, self.song.publish_date)
+        self.assertEqual(publishing.run_due_jobs(), [job])
+
+    def test_publishing_queries_dont_grow_with_reviews(self):
+        # Publish one first, so the songs below both have a previous post to link to
+        publishing.run_job(publishing.enqueue_publish(self.song))
+
+        counts = []
+        for review_count in (2, 15):
+            song = Song.objects.create(artist='Robyn', title='Dancing On My Own', status='closed')
+            for i in range(review_count):
+                writer = Writer.objects.create(username='w%s-%s' % (review_count, i), first_name='W', last_name=str(i))
+                Review.objects.create(song=song, writer=writer, blurb='Blurb', score=i % 11, status='saved')
+            job = publishing.enqueue_publish(song)
+            with CaptureQueriesContext(connection) as queries:
+                publishing.run_job(job)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        # Job, song and reviews, writer stats, the post and its links, its search terms,
+        # and publish_song()'s savepoint (nothing it calls adds one of its own)
+        self.assertLessEqual(counts[0], 20)
+
+    def test_job_runs_only_once(self):
+        job = publishing.enqueue_publish(self.song)
+        stale_copy = PublishJob.objects.get(pk=job.pk)
+
+        self.assertTrue(publishing.run_job(job))
+        self.assertFalse(publishing.run_job(stale_copy))
+        self.assertEqual(PublicPost.objects.filter(song=self.song).count(), 1)
+
+    def test_failed_job_records_error(self):
+        job = publishing.enqueue_publish(self.song)
+        Song.objects.filter(pk=self.song.pk).update(status='open')
+
+        publishing.run_due_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Only closed songs can be published', job.error)
+        self.assertFalse(PublicPost.objects.filter(song=self.song).exists())
+        self.assertEqual(self.song.review_set.get().status, 'saved')
+
+
+@skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+class QueryPlanTests(TestCase):
+    """
+    The hot queries from the blurber, writers and tsj views should be
+    answered from an index, not by scanning the whole table.
+    """
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            # The last column is the plan step's description
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_no_full_scan(self, queryset, allowed_tables=()):
+        plan = self.query_plan(queryset)
+        for step in plan:
+            # "SCAN TABLE x" on older SQLite versions, "SCAN x" on newer ones
+            match = re.match(r'SCAN (?:TABLE )?(\w+)', step)
+            if match and match.group(1) not in allowed_tables:
+                self.fail("Full scan of %s in query plan:\n%s" % (match.group(1), "\n".join(plan)))
+
+    def test_schedule_queries_use_indexes(self):
+        # The querysets weekly_schedule and write_review run, for a writer and an editor
+        for is_staff in (False, True):
+            self.assert_no_full_scan(Song.objects.for_schedule(Writer(pk=1, is_staff=is_staff)))
+        self.assert_no_full_scan(Song.objects.open().filter(id=1))
+
+    def test_song_review_queries_use_indexes(self):
+        # The reviews page, preview, HTML source and publishing
+        self.assert_no_full_scan(Review.objects.for_post(Song(pk=1)))
+        self.assert_no_full_scan(Song(pk=1).published_reviews())
+
+    def test_controversy_listings(self):
+        # Listings of published songs by controversy start from the status index
+        self.assert_no_full_scan(
+            Song.objects.filter(status='published').with_stats().order_by('-controversy')[:50]
+        )
+        # Ordering every song by it (the admin changelist) has to work the
+        # value out for each one: an accepted scan of the song table only,
+        # see SongQuerySet.with_controversy()
+        self.assert_no_full_scan(Song.objects.with_stats().order_by('-controversy'), allowed_tables=['blurber_song'])
+
+    def test_writer_queries_use_indexes(self):
+        writer = Writer(pk=1)
+        for status in (None, 'saved', 'published'):
+            self.assert_no_full_scan(get_reviews_by_status_and_year(writer, status, 2015))
+        self.assert_no_full_scan(get_year_index(writer))
+        # Listing every writer has to read the whole (small) writers table,
+        # but each writer's latest blurb should come from an index
+        self.assert_no_full_scan(Writer.objects.by_most_recent_blurb(), allowed_tables=['writers_writer'])
+
+    def test_public_queries_use_indexes(self):
+        self.assert_no_full_scan(PublicPost.objects.filter(visible=True).newest_first()[:10])
+        self.assert_no_full_scan(PublicPost.objects.filter(song_id=1, visible=True))
+        self.assert_no_full_scan(get_recent_comments())
+        self.assert_no_full_scan(Comment.objects.filter(visible=True, song_id=1).order_by('published_on'))
+
+    def test_search_starts_from_term_index(self):
+        plan = self.query_plan(search('kate bush'))
+        self.assert_no_full_scan(search('kate bush'))
+        self.assertTrue(any('tsj_searchterm_term_post' in step for step in plan), "\n".join(plan))
+        # Posts are only looked up by ID once their terms have matched
+        self.assertFalse(any('tsj_publicpost_visible_pub' in step for step in plan), "\n".join(plan))
+
+    def test_legacy_home_pages_start_from_position_index(self):
+        # The post a legacy ?paged=N home page starts after
+        cursor = PublicPost.objects.filter(visible=True, position=10).values_list('published_on', 'id')
+        plan = self.query_plan(cursor)
+        self.assert_no_full_scan(cursor)
+        self.assertTrue(any('tsj_publicpost_visible_pos' in step for step in plan), "\n".join(plan))
+
+
+class ArchiveExportTests(TestCase):
+
+    def setUp(self):
+        self.writer = Writer.objects.create(username='w@example.com', email='w@example.com', first_name='Mel')
+        self.writer.set_password('sporty')
+        self.writer.save()
+        self.songs = [Song.objects.create(artist='Artist %s' % i, title='Title %s' % i) for i in range(5)]
+        self.review = Review.objects.create(song=self.songs[0], writer=self.writer, blurb='Zig-a-zig-ah', score=7)
+        self.output = TemporaryDirectory()
+        self.addCleanup(self.output.cleanup)
+
+    def export(self, *args, **options):
+        call_command('export_archive', *args, output=self.output.name, stdout=StringIO(), **options)
+
+    def read(self, name):
+        path = os.path.join(self.output.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def ndjson_rows(self, name):
+        return [json.loads(line) for line in self.read(name).splitlines()]
+
+    def test_ndjson_export(self):
+        self.export()
+
+        songs = self.ndjson_rows('songs.ndjson')
+        self.assertEqual([song['title'] for song in songs], ['Title %s' % i for i in range(5)])
+        self.assertNotIn('score_total', songs[0])
+
+        reviews = self.ndjson_rows('reviews.ndjson')
+        self.assertEqual(reviews[0]['song_id'], self.songs[0].id)
+        self.assertEqual(reviews[0]['create_date'], self.review.create_date.isoformat())
+
+    def test_writer_credentials_are_left_out(self):
+        self.export(tables=['writers'])
+
+        writers = self.ndjson_rows('writers.ndjson')
+        self.assertEqual(writers[0]['first_name'], 'Mel')
+        self.assertNotIn('password', writers[0])
+        self.assertNotIn('sporty', self.read('writers.ndjson'))
+        self.assertFalse(os.path.exists(os.path.join(self.output.name, 'songs.ndjson')))
+
+    def test_gzipped_csv_export(self):
+        self.export(fmt='csv', compress=True, tables=['songs'])
+
+        rows = list(csv.reader(StringIO(self.read('songs.csv.gz'))))
+        self.assertEqual(rows[0][:3], ['id', 'artist', 'title'])
+        self.assertEqual(len(rows), 6)
+
+    def test_rows_are_fetched_in_chunks(self):
+        fields = export_fields(Song)
+        # One query per two songs, plus one that finds the end
+        with self.assertNumQueries(3):
+            rows = list(iter_rows(Song.objects.all(), fields, chunk_size=2))
+        self.assertEqual([row[0] for row in rows], [song.id for song in self.songs])
+
+    def test_incremental_export_uses_watermark(self):
+        watermark = os.path.join(self.output.name, 'watermark')
+        self.export(watermark=watermark)
+        self.assertEqual(len(self.ndjson_rows('songs.ndjson')), 5)
+
+        self.songs[3].title = 'Wannabe'
+        self.songs[3].save()
+        self.export(watermark=watermark)
+
+        self.assertEqual([song['title'] for song in self.ndjson_rows('songs.ndjson')], ['Wannabe'])
+        self.assertEqual(self.ndjson_rows('reviews.ndjson'), [])
+
+    def test_bad_since_is_an_error(self):
+        with self.assertRaises(CommandError):
+            self.export(since='last tuesday')
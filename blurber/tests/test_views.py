@@ -1,11 +1,13 @@
 from unittest.mock import patch, call, Mock
 
 from datetime import datetime, timezone
+from io import StringIO
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 
 from writers.models import Writer
-from blurber.models import Song, Review, ScheduledWeek
+from blurber.models import Song, Review, ScheduledWeek, PublishJob
 from blurber.forms import ReviewForm, UploadSongForm
 from tsj.models import PublicPost
 
@@ -88,7 +90,7 @@ class ScheduleViewTests(BlurberBaseViewTests):
         self.assertQuerysetEqual(
             resp.context['all_open_songs'], ['<Song: 2NE1 - I Am The Best>']
         )
-        self.assertEqual(resp.context['user_songs'], [self.song])
+        self.assertEqual([song.blurbed for song in resp.context['all_open_songs']], [True])
 
         # Should only be visible for staff
         self.assertNotContains(resp, 'Review all blurbs')
@@ -104,7 +106,7 @@ class ScheduleViewTests(BlurberBaseViewTests):
         self.assertQuerysetEqual(
             resp.context['all_open_songs'], ['<Song: 2NE1 - I Am The Best>']
         )
-        self.assertEqual(resp.context['user_songs'], [])
+        self.assertEqual([song.blurbed for song in resp.context['all_open_songs']], [False])
 
         # Should only be visible for staff
         self.assertContains(resp, 'Review all blurbs')
@@ -112,6 +114,21 @@ class ScheduleViewTests(BlurberBaseViewTests):
             resp, reverse('admin:blurber_song_change', args=[self.song.id])
         )
 
+    def test_weekly_schedule_query_count_does_not_grow_with_songs(self):
+        self.client.force_login(self.editor)
+        self.week.current_week = True
+        self.week.save()
+
+        for i in range(10):
+            song = self.generate_new_song(status='closed' if i % 2 else 'open')
+            self.week.tuesday.add(song)
+            Review.objects.create(song=song, writer=self.editor, status='saved', score=i, blurb='Hmm')
+
+        # Session, user, week, six weekdays, song list
+        with self.assertNumQueries(10):
+            resp = self.client.get(reverse('weekly_schedule'))
+        self.assertEqual(sum(song.blurbed for song in resp.context['all_open_songs']), 10)
+
 
 class WriteReviewViewTests(BlurberBaseViewTests):
 
@@ -148,6 +165,7 @@ class WriteReviewViewTests(BlurberBaseViewTests):
             reverse('write_review', kwargs={'song_id': new_song.id}),
             data={'blurb': 'Glowing appraisal', 'score': 10},
         )
+        new_song.refresh_from_db()
         self.assertEqual(new_song.blurb_count, 1)
 
     def test_write_html_text_review_for_new_song(self):
@@ -403,7 +421,12 @@ class ViewReviewsTest(BlurberBaseViewTests):
             reverse('publish_song', kwargs={'song_id': closed_song.id})
         )
 
-        self.assertContains(resp, "Song has been published.")
+        self.assertContains(resp, "Song has been queued for publishing.")
+        self.assertEqual(Song.objects.get(id=closed_song.id).status, "closed")
+        self.assertFalse(PublicPost.objects.filter(song=closed_song).exists())
+
+        call_command('run_publish_jobs', once=True, stdout=StringIO())
+
         fresh_song_db_lookup = Song.objects.get(id=closed_song.id)
         self.assertEqual(fresh_song_db_lookup.status, "published")
         reviews = [r.status for r in Review.objects.filter(song=closed_song).order_by('sort_order')]
@@ -414,6 +437,41 @@ class ViewReviewsTest(BlurberBaseViewTests):
         assert "Not ready yet" not in pp[0].html_content
         assert "Contains swears" not in pp[0].html_content
 
+    def test_publish_post_queues_one_job_per_song(self):
+        self.client.force_login(self.editor)
+        closed_song = self.generate_new_song(status='closed')
+        url = reverse('publish_song', kwargs={'song_id': closed_song.id})
+
+        self.client.get(url)
+        self.client.get(url)
+
+        job = PublishJob.objects.get(song=closed_song)
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.requested_by, self.editor)
+
+    def test_publish_job_status(self):
+        self.client.force_login(self.editor)
+        closed_song = self.generate_new_song(status='closed')
+        self.client.get(reverse('publish_song', kwargs={'song_id': closed_song.id}))
+        job = PublishJob.objects.get(song=closed_song)
+        url = reverse('publish_job_status', kwargs={'job_id': job.id})
+        # The reviews page polls it while the job is waiting
+        self.assertContains(
+            self.client.get(reverse('view_reviews', kwargs={'song_id': closed_song.id})), 'data-status-url="%s"' % url
+        )
+
+        self.assertEqual(self.client.get(url).json()['status'], 'queued')
+
+        call_command('run_publish_jobs', once=True, stdout=StringIO())
+
+        status = self.client.get(url).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['post_url'], reverse('single_post', args=[closed_song.id]))
+
+    def test_publish_job_status_hidden_for_writer(self):
+        job = PublishJob.objects.create(song=self.generate_new_song(status='closed'))
+        self.assert_view_hidden_for_writer(reverse('publish_job_status', kwargs={'job_id': job.id}))
+
     def assert_review_moved_to_position(self, url, expected_position):
 
         for i in range(3):
@@ -510,6 +568,79 @@ class ViewReviewsTest(BlurberBaseViewTests):
         # Should be 3/4 in queryset
         self.assert_review_moved_to_position(url, 2)
 
+    def test_move_published_review(self):
+        self.client.force_login(self.editor)
+        self.saved_review.status = 'published'
+        self.saved_review.save()
+        url = reverse('move_review_bottom', kwargs={'review_id': self.saved_review.id})
+
+        self.assert_review_moved_to_position(url, 3)
+
+    def test_move_uses_a_single_update(self):
+        self.client.force_login(self.editor)
+        for i in range(10):
+            Review.objects.create(
+                song=self.song, writer=self.generate_writer('w%s@example.com' % i),
+                blurb='Hmm', status='saved', score=i, sort_order=i + 2
+            )
+        url = reverse('move_review_bottom', kwargs={'review_id': self.saved_review.id})
+
+        # Session, user, review, then in a savepoint: song lock, song's review order and one UPDATE
+        with self.assertNumQueries(8):
+            self.client.get(url)
+        self.assertEqual(Review.objects.get(id=self.saved_review.id).sort_order, 11)
+
+
+class ReorderReviewsTest(BlurberBaseViewTests):
+
+    def setUp(self):
+        super(ReorderReviewsTest, self).setUp()
+        self.reviews = [self.saved_review] + [
+            Review.objects.create(
+                song=self.song, writer=self.generate_writer('w%s@example.com' % i),
+                blurb='Hmm', status='published' if i else 'saved', score=i, sort_order=i + 2
+            ) for i in range(3)
+        ]
+        self.url = reverse('reorder_reviews', kwargs={'song_id': self.song.id})
+
+    def test_reorder_hidden_for_writer(self):
+        self.assert_view_hidden_for_writer(self.url)
+
+    def test_reorder_applies_complete_ordering(self):
+        self.client.force_login(self.editor)
+        new_order = [r.id for r in reversed(self.reviews)]
+
+        resp = self.client.post(self.url, {'order': new_order})
+
+        self.assertRedirects(resp, reverse('view_reviews', kwargs={'song_id': self.song.id}))
+        self.assertEqual(
+            list(Review.objects.filter(song=self.song).order_by('sort_order').values_list('id', 'sort_order')),
+            [(review_id, i + 1) for i, review_id in enumerate(new_order)]
+        )
+
+    def test_reorder_accepts_comma_separated_ids_and_answers_ajax(self):
+        self.client.force_login(self.editor)
+        new_order = [r.id for r in self.reviews[1:] + self.reviews[:1]]
+
+        resp = self.client.post(
+            self.url, {'order': ','.join(str(i) for i in new_order)}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+
+        self.assertEqual(resp.json(), {'order': new_order})
+
+    def test_reorder_rejects_incomplete_ordering(self):
+        self.client.force_login(self.editor)
+
+        resp = self.client.post(self.url, {'order': [r.id for r in self.reviews[1:]]})
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.post(self.url, {'order': 'bananas'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_reorder_requires_post(self):
+        self.client.force_login(self.editor)
+
+        self.assertEqual(self.client.get(self.url).status_code, 405)
 
 class PreviewPostTests(BlurberBaseViewTests):
 
@@ -547,3 +678,21 @@ class PreviewPostTests(BlurberBaseViewTests):
         self.assertFalse(resp.context['show_admin_links'])
         self.assertNotContains(resp, "Preview")
         self.assertNotContains(resp, self.song.controversy_debug_string())
+
+
+class SongAdminTests(BlurberBaseViewTests):
+
+    def test_changelist_can_be_sorted_by_stats(self):
+        self.editor.is_superuser = True
+        self.editor.save()
+        divisive = self.generate_new_song()
+        Review.objects.create(song=divisive, writer=self.writer, status='saved', score=0, blurb='No')
+        Review.objects.create(song=divisive, writer=self.editor, status='saved', score=10, blurb='Yes')
+        self.client.force_login(self.editor)
+
+        # Sorted on the controversy column, descending
+        resp = self.client.get(reverse('admin:blurber_song_changelist'), {'o': '-7'})
+
+        songs = list(resp.context['cl'].result_list)
+        self.assertEqual(songs, [divisive, self.song])
+        self.assertEqual([(song.average, song.controversy) for song in songs], [(5, 5), (5, 0)])
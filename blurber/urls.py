@@ -2,7 +2,7 @@ from django.conf.urls import url
 
 from blurber.views import (
     weekly_schedule, write_review, upload_song, view_reviews,
-    preview_post, fetch_html, move_review
+    preview_post, fetch_html, move_review, reorder_reviews, publish_job_status
 )
 
 urlpatterns = [
@@ -13,10 +13,12 @@ urlpatterns = [
     # Staff only views
     url(r'^song/upload', upload_song, name='upload_song'),
     url(r'^song/(?P<song_id>\d+)/reviews/$', view_reviews, name='view_reviews'),
+    url(r'^song/(?P<song_id>\d+)/reviews/reorder/$', reorder_reviews, name='reorder_reviews'),
     url(r'^song/(?P<song_id>\d+)/preview/$', preview_post, name='preview_post'),
     url(r'^song/(?P<song_id>\d+)/source/$', fetch_html, name='fetch_html'),
     url(r'^song/(?P<song_id>\d+)/close/$', view_reviews, {'close': True}, name='close_song'),
     url(r'^song/(?P<song_id>\d+)/publish/$', view_reviews, {'publish': True}, name='publish_song'),
+    url(r'^publish-jobs/(?P<job_id>\d+)/$', publish_job_status, name='publish_job_status'),
 
     url(r'^review/(?P<review_id>\d+)/moveup/$', move_review, {'direction': 'up'}, name='move_review_up'),
     url(r'^review/(?P<review_id>\d+)/movedown/$', move_review, {'direction': 'down'}, name='move_review_down'),
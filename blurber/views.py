@@ -1,31 +1,34 @@
 from datetime import datetime
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.html import escape
 from django.utils import timezone
+from django.views.decorators.http import require_POST
 
-from blurber.models import Song, ScheduledWeek, Review
+from blurber.models import Song, ScheduledWeek, Review, PublishJob
 from blurber.forms import ReviewForm, UploadSongForm
-from tsj.models import PublicPost
+from blurber.publishing import enqueue_publish
 
 # Writer views
 
 @login_required
 def weekly_schedule(request):
 
-    if request.user.is_staff:
-        all_open_songs = Song.objects.filter(status__in=['open', 'closed'])
-    else:
-        all_open_songs = Song.objects.filter(status='open')
-    user_reviews = Review.objects.filter(song__in=all_open_songs, writer=request.user)
+    # Blurb counts are stored on the song row, and whether the user has blurbed
+    # each song is annotated, so the list renders from this one query
+    all_open_songs = Song.objects.for_schedule(request.user)
 
+    weeks = ScheduledWeek.objects.prefetch_related(*ScheduledWeek.SCHEDULE_DAYS)
     try:
-        this_week = get_object_or_404(ScheduledWeek, current_week=True)
+        this_week = weeks.get(current_week=True)
     except:
         # Get the most recent week
-        this_week = ScheduledWeek.objects.all().order_by('-week_beginning')[0]
+        this_week = weeks.order_by('-week_beginning')[0]
 
     return render(
         request,
@@ -34,14 +37,13 @@ def weekly_schedule(request):
             'this_week': this_week,
             'all_open_songs': all_open_songs,
             'now': datetime.now(),
-            'user_songs': [review.song for review in user_reviews]
         }
     )
 
 @login_required
 def write_review(request, song_id, use_html=False):
 
-    song = get_object_or_404(Song, id=song_id, status='open')
+    song = get_object_or_404(Song.objects.open(), id=song_id)
     try:
         review = Review.objects.get(writer=request.user, song=song)
         preview_text = True
@@ -113,28 +115,16 @@ def view_reviews(request, song_id, close=False, publish=False):
     # View all reviews for a song and change ordering
     # Also acts as action confirmation page
     song = get_object_or_404(Song, id=song_id)
-    reviews = Review.objects.filter(song_id=song_id, status__in=['saved', 'published']).order_by('sort_order')
+    reviews = Review.objects.for_post(song)
 
     error_message = None
     if close and song.status == 'open':
         song.status = 'closed'
         song.save()
     elif publish and song.status == 'closed':
-        reviews.update(status='published')
-        song.status = 'published'
-        song.save()
-
-        # TODO: check if a PublicPost already exists for this song, and hide previous published versions
-
-        # Copy to PublicPost
-        resp = _song_html_content(request, song_id)
-        html_data = resp.content
-        pp = PublicPost.objects.create(
-            song=song,
-            html_content=html_data,
-            published_on=datetime.utcnow()  # TODO: Schedule post
-        )
-        pp.save()
+        # Rendering and creating the PublicPost happen in the run_publish_jobs
+        # worker, at the song's publish_date if one is set
+        enqueue_publish(song, requested_by=request.user)
     else:
         error_message = "Cannot perform this action."
 
@@ -144,62 +134,117 @@ def view_reviews(request, song_id, close=False, publish=False):
         {
             'reviews': reviews,
             'song': song,
-            'review_count': reviews.count(),
+            'review_count': song.blurb_count,
             'error_message': error_message,
             'close_action': close,
-            'publish_action': publish
+            'publish_action': publish,
+            'publish_job': song.publish_jobs.order_by('-id').first()
         }
     )
 
 
+@staff_member_required(login_url="login")
+def publish_job_status(request, job_id):
+    # Polled by the reviews page while a publish is queued
+    job = get_object_or_404(PublishJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'song': job.song_id,
+        'status': job.status,
+        'run_after': job.run_after.isoformat(),
+        'finished': job.finished.isoformat() if job.finished else None,
+        'error': job.error,
+        'post_url': reverse('single_post', args=[job.song_id]) if job.status == 'done' else None,
+    })
+
+
+def _ordered_review_ids(song_id):
+    return list(
+        Review.objects.filter(song_id=song_id, status__in=['saved', 'published']).
+            order_by('sort_order', 'id').values_list('id', flat=True)
+    )
+
+
+def _apply_review_order(song_id, review_ids):
+    # Renumber the reviews 1..n in the given order with a single UPDATE
+    if not review_ids:
+        return
+    Review.objects.filter(song_id=song_id, id__in=review_ids).update(
+        sort_order=Case(
+            *[When(id=review_id, then=Value(i + 1)) for i, review_id in enumerate(review_ids)],
+            output_field=IntegerField()
+        ),
+        last_modified=timezone.now()
+    )
+
+
+def _lock_song(song_id):
+    # Review.save() takes the same lock, so no review can be added or change
+    # status between reading the current order and renumbering it
+    Song.objects.select_for_update().filter(pk=song_id).exists()
+
+
 @staff_member_required(login_url="login")
 def move_review(request, review_id, direction="top"):
     # Bump review to top or bottom, or swap with its neighbour
     review = get_object_or_404(Review, id=review_id)
-    all_reviews = Review.objects.filter(song=review.song, status='saved').order_by('sort_order')
-
-    all_other_reviews = all_reviews.exclude(id=review.id)
-
-    if direction == 'top':
-        new_review_list = [review] + list(all_other_reviews)
-    elif direction == 'bottom':
-        new_review_list = list(all_other_reviews) + [review]
-    else:
-        review_index = None
-        for index, item in enumerate(all_reviews):
-            if item.id == review.id:
-                review_index = index
-                break
-
-        new_review_list = list(all_reviews)
-        if direction == 'up':
+    with transaction.atomic():
+        _lock_song(review.song_id)
+        review_ids = _ordered_review_ids(review.song_id)
+        if review.id not in review_ids:
+            # Drafts and removed reviews aren't part of the post
+            return redirect('view_reviews', review.song_id)
+
+        review_index = review_ids.index(review.id)
+        if direction == 'top':
+            review_ids.insert(0, review_ids.pop(review_index))
+        elif direction == 'bottom':
+            review_ids.append(review_ids.pop(review_index))
+        elif direction == 'up':
             # Swap review with previous (if there)
             if review_index > 0:
-                new_review_list[review_index-1], \
-                new_review_list[review_index] = \
-                    review, \
-                    new_review_list[review_index-1]
-
-        if direction == 'down':
+                review_ids[review_index - 1], review_ids[review_index] = \
+                    review_ids[review_index], review_ids[review_index - 1]
+        elif direction == 'down':
             # Swap review with next (if there)
-            if review_index + 1 < len(new_review_list):
-                new_review_list[review_index+1], \
-                new_review_list[review_index] = \
-                    review, \
-                    new_review_list[review_index+1]
+            if review_index + 1 < len(review_ids):
+                review_ids[review_index + 1], review_ids[review_index] = \
+                    review_ids[review_index], review_ids[review_index + 1]
+
+        _apply_review_order(review.song_id, review_ids)
+
+    return redirect('view_reviews', review.song_id)
+
+
+@staff_member_required(login_url="login")
+@require_POST
+def reorder_reviews(request, song_id):
+    # Apply a complete ordering, e.g. from drag and drop:
+    # POST order=<review id>&order=<review id>... or order=<id>,<id>,...
+    song = get_object_or_404(Song, id=song_id)
+    try:
+        review_ids = [
+            int(review_id) for value in request.POST.getlist('order') for review_id in value.split(',') if review_id
+        ]
+    except ValueError:
+        return HttpResponseBadRequest("Review IDs must be numbers.")
+
+    with transaction.atomic():
+        _lock_song(song.id)
+        if sorted(review_ids) != sorted(_ordered_review_ids(song.id)):
+            return HttpResponseBadRequest("The ordering must include each of the song's reviews exactly once.")
 
-    # Now re-sort everything
-    for i in range(0, all_reviews.count()):
-        new_review_list[i].sort_order = i+1
-        new_review_list[i].save()
+        _apply_review_order(song.id, review_ids)
 
-    return redirect('view_reviews', review.song.id)
+    if request.is_ajax():
+        return JsonResponse({'order': review_ids})
+    return redirect('view_reviews', song.id)
 
 
 def _song_html_content(request, song_id, template='preview_source.html', show_admin_links=False):
     # Churn out HTML for saved/published reviews
     song = get_object_or_404(Song, id=song_id)
-    reviews = Review.objects.filter(song_id=song_id, status__in=['saved', 'published']).order_by('sort_order')
+    reviews = Review.objects.for_post(song)
     return render(request, template, {
         'reviews': reviews, 'song': song, 'show_admin_links': show_admin_links}
     )
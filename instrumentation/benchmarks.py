@@ -0,0 +1,112 @@
+"""
+Timed scenarios for the main views, run against a generated archive by
+the benchmark_views command.
+
+Each scenario makes its requests through the test client as a writer, an
+editor or a reader, so the timings include the middleware, sessions and
+template rendering. Requests that change data (writing a review,
+publishing) or are cached (single posts) use a different song each run.
+"""
+import time
+from collections import namedtuple
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from blurber.models import Song
+from blurber.publishing import run_due_jobs
+
+# user is 'writer', 'editor' or None for a reader; run(client, archive, i) makes the i'th request
+Scenario = namedtuple('Scenario', ['name', 'user', 'run'])
+
+
+def pick(ids, i):
+    if not ids:
+        raise ValueError("The archive has no songs for this scenario")
+    return ids[i % len(ids)]
+
+
+def publish(client, archive, i):
+    song_id = pick(archive.closed_song_ids, i)
+    # Runs go round the closed songs, republishing them once they've all been published
+    Song.objects.filter(id=song_id).update(status='closed')
+    response = client.get(reverse('publish_song', kwargs={'song_id': song_id}))
+    run_due_jobs()
+    return response
+
+
+SCENARIOS = [
+    Scenario('schedule', 'writer', lambda client, archive, i: client.get(reverse('weekly_schedule'))),
+    Scenario('write_review', 'writer', lambda client, archive, i: client.post(
+        reverse('write_review', kwargs={'song_id': pick(archive.open_song_ids, i)}),
+        {'blurb': 'Benchmark blurb %s' % i, 'score': i % 11}
+    )),
+    Scenario('view_reviews', 'editor', lambda client, archive, i: client.get(
+        reverse('view_reviews', kwargs={'song_id': pick(archive.closed_song_ids, i)})
+    )),
+    Scenario('publish', 'editor', publish),
+    Scenario('home', None, lambda client, archive, i: client.get(reverse('home_page'))),
+    Scenario('search', None, lambda client, archive, i: client.get(reverse('home_page'), {'s': archive.search_term})),
+    Scenario('single_post', None, lambda client, archive, i: client.get(
+        # Newest first, as readers mostly do
+        reverse('single_post', kwargs={'song_id': pick(archive.posted_song_ids[::-1], i)})
+    )),
+    Scenario('all_writers', 'editor', lambda client, archive, i: client.get(reverse('all_writers'))),
+    Scenario('my_blurbs', 'writer', lambda client, archive, i: client.get(reverse('my_blurbs'))),
+]
+
+SCENARIO_NAMES = [scenario.name for scenario in SCENARIOS]
+
+
+def time_scenario(scenario, archive, runs):
+    """
+    Time runs of a scenario after one untimed warm-up run. Returns the
+    timings in seconds, sorted, and the query count of each run.
+    """
+    client = Client()
+    if scenario.user:
+        client.force_login(getattr(archive, scenario.user))
+
+    timings, queries = [], []
+    for i in range(runs + 1):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = scenario.run(client, archive, i)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise ValueError("%s returned %s" % (scenario.name, response.status_code))
+        if i:
+            timings.append(elapsed)
+            queries.append(len(captured))
+    return sorted(timings), queries
+
+
+def summarise(timings, queries):
+    return {
+        'runs': len(timings),
+        'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+        'p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 2),
+        'max_ms': round(timings[-1] * 1000, 2),
+        'queries': sorted(queries)[len(queries) // 2],
+    }
+
+
+def regressions(results, baseline, threshold, min_difference_ms=1.0):
+    """
+    Scenarios whose median time grew by more than the threshold (a ratio,
+    ignoring changes under min_difference_ms) or that run more queries than
+    in the baseline results, as messages.
+    """
+    found = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['median_ms'] > before['median_ms'] * threshold and \
+                result['median_ms'] - before['median_ms'] >= min_difference_ms:
+            found.append("%s: median %.1fms, was %.1fms" % (name, result['median_ms'], before['median_ms']))
+        if result['queries'] > before['queries']:
+            found.append("%s: %s queries, was %s" % (name, result['queries'], before['queries']))
+    return found
@@ -0,0 +1,188 @@
+"""
+A deterministic generator for archives of any size, for benchmarks and
+query-count tests.
+
+generate_archive() fills the database with writers, scheduled weeks,
+open, closed and published songs with their reviews, public posts and
+comments, all from one seed, so two runs with the same options build the
+same archive. Rows go in with bulk_create(), skipping the save() methods
+and signals, so the derived data (song and writer stats, prev/next links,
+the search index and the public cache) is rebuilt at the end as after a
+WordPress import.
+"""
+import random
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blurber.models import Review, ScheduledWeek, Song
+from blurber.publishing import render_song_post
+from tsj import cache as page_cache
+from tsj.archives import refresh_archive_months
+from tsj.models import Comment, PublicPost
+from tsj.search import rebuild_index
+from tsj.wordpress import set_dates
+from writers.models import Writer
+from writers.stats import rebuild_stats
+
+SYLLABLES = ['ba', 'ko', 'ri', 'su', 'ne', 'lo', 'ma', 'te', 'vi', 'da', 'po', 'ze', 'qu', 'fi', 'gro', 'shi']
+
+# Published songs go out three a day
+POST_INTERVAL = timedelta(hours=8)
+
+GeneratedArchive = namedtuple('GeneratedArchive', [
+    'editor', 'writer', 'writer_ids', 'open_song_ids', 'closed_song_ids', 'published_song_ids', 'posted_song_ids',
+    'search_term'
+])
+
+
+def words(rng, count):
+    return " ".join("".join(rng.choice(SYLLABLES) for j in range(rng.randint(2, 4))) for i in range(count))
+
+
+def reset_sequences():
+    # Writers and songs are inserted with explicit IDs, so that they're known
+    # without querying; make sure later inserts don't collide with them
+    statements = connection.ops.sequence_reset_sql(no_style(), [Writer, Song])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def generate_writers(rng, count):
+    """The writers, the first of them an editor. Returns their IDs in order."""
+    first_id = (Writer.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    Writer.objects.bulk_create([
+        Writer(
+            id=first_id + i,
+            username='generated-writer-%s' % (first_id + i),
+            first_name=words(rng, 1).title(),
+            last_name=words(rng, 1).title(),
+            password='!',
+            bio_link='http://example.com/%s' % i if i % 3 else None,
+            is_staff=i == 0,
+        ) for i in range(count)
+    ])
+    return list(range(first_id, first_id + count))
+
+
+def generate_songs(rng, writer_ids, songs, reviews_per_song, open_songs, closed_songs, now):
+    """Songs with their reviews, oldest first. Returns the song IDs by status."""
+    first_id = (Song.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    published_songs = songs - open_songs - closed_songs
+    ids = {'published': [], 'closed': [], 'open': []}
+    song_rows, review_rows, dates = [], [], {}
+    for i in range(songs):
+        song_id = first_id + i
+        if i < published_songs:
+            status, review_status = 'published', 'published'
+            dates[song_id] = now - (published_songs - i) * POST_INTERVAL
+            review_count = reviews_per_song
+        else:
+            status = 'closed' if i < published_songs + closed_songs else 'open'
+            review_status = 'saved'
+            dates[song_id] = now - (songs - i) * timedelta(hours=1)
+            # Open songs are still collecting blurbs
+            review_count = reviews_per_song if status == 'closed' else rng.randint(0, reviews_per_song)
+        ids[status].append(song_id)
+
+        reviews = [
+            Review(song_id=song_id, writer_id=writer_id, blurb=words(rng, rng.randint(20, 80)),
+                   score=rng.randint(0, 10), sort_order=sort_order + 1, status=review_status)
+            for sort_order, writer_id in enumerate(rng.sample(writer_ids, min(review_count, len(writer_ids))))
+        ]
+        song = Song(id=song_id, artist=words(rng, 2).title(), title=words(rng, 3).title(),
+                    tagline=words(rng, 6), status=status, publish_date=dates[song_id])
+        song.saved_blurb_count, song.score_total, song.score_deviation_total = \
+            Song.score_stats([review.score for review in reviews])
+        song_rows.append(song)
+        review_rows.extend(reviews)
+
+    Song.objects.bulk_create(song_rows)
+    Review.objects.bulk_create(review_rows)
+    reset_sequences()
+    # bulk_create() sets auto_now_add fields to the current time
+    set_dates(Song, 'upload_date', dates)
+    # Reviews share their song's date, so writers' blurbs spread over the years
+    set_dates(Review, 'create_date', dates, key='song_id')
+    return ids
+
+
+def generate_posts(rng, song_ids, comments):
+    """Public posts for the given published songs, rendered as publishing would, and comments spread over them."""
+    songs = Song.objects.filter(id__in=song_ids).order_by('id')
+    PublicPost.objects.bulk_create([
+        PublicPost(song=song, html_content=render_song_post(song), published_on=song.publish_date)
+        for song in songs.iterator()
+    ], batch_size=500)
+    if song_ids:
+        Comment.objects.bulk_create([
+            Comment(song_id=rng.choice(song_ids), name=words(rng, 1).title(), mail='reader%s@example.com' % i,
+                    comment_text=words(rng, rng.randint(5, 40)))
+            for i in range(comments)
+        ], batch_size=500)
+
+
+def generate_weeks(rng, weeks, open_ids, published_ids, now):
+    """Scheduled weeks going back from this one, which has the open songs; older weeks list published songs."""
+    this_monday = timezone.localtime(now).date() - timedelta(days=timezone.localtime(now).weekday())
+    days = [getattr(ScheduledWeek, day).through for day in ScheduledWeek.SCHEDULE_DAYS]
+    links = {through: [] for through in days}
+    for week_no in range(weeks):
+        week = ScheduledWeek.objects.create(
+            week_beginning=this_monday - timedelta(weeks=week_no),
+            week_info=words(rng, 30),
+            current_week=week_no == 0
+        )
+        songs = open_ids if week_no == 0 else rng.sample(published_ids, min(len(published_ids), 5 * len(days)))
+        for i, song_id in enumerate(songs):
+            links[days[i % len(days)]].append(days[i % len(days)](scheduledweek_id=week.id, song_id=song_id))
+    for through, rows in links.items():
+        through.objects.bulk_create(rows, batch_size=500)
+
+
+def refresh_public_cache():
+    # Every cached public page can show generated posts
+    refresh_archive_months()
+    for name in page_cache.SHARED_VERSIONS + ('feeds',):
+        page_cache.bump_version(name)
+
+
+def generate_archive(writers=100, songs=2000, reviews_per_song=12, comments=5000, public_posts=None,
+                     weeks=52, open_songs=30, closed_songs=20, seed=1):
+    """
+    Generate an archive and return a GeneratedArchive with the editor, a
+    busy writer, the song IDs by status (and of the published songs with a
+    post) and a word to search for.
+    public_posts limits how many published songs get a post (default all).
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    open_songs = min(open_songs, songs)
+    closed_songs = min(closed_songs, songs - open_songs)
+
+    with transaction.atomic():
+        writer_ids = generate_writers(rng, max(writers, 2))
+        song_ids = generate_songs(rng, writer_ids, songs, reviews_per_song, open_songs, closed_songs, now)
+        published_ids = song_ids['published']
+        posted_ids = published_ids if public_posts is None else \
+            published_ids[max(len(published_ids) - public_posts, 0):]
+        generate_posts(rng, posted_ids, comments)
+        generate_weeks(rng, weeks, song_ids['open'], published_ids, now)
+
+        # Catch up on what save() and the signals would have done
+        PublicPost.objects.relink()
+        rebuild_index()
+        rebuild_stats()
+    refresh_public_cache()
+
+    editor, writer = Writer.objects.get(id=writer_ids[0]), Writer.objects.get(id=writer_ids[1])
+    search_term = Song.objects.get(id=posted_ids[-1]).artist.split()[0] if posted_ids else ''
+    return GeneratedArchive(
+        editor, writer, writer_ids, song_ids['open'], song_ids['closed'], published_ids, posted_ids, search_term
+    )
@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from instrumentation.benchmarks import SCENARIOS, SCENARIO_NAMES, time_scenario, summarise, regressions
+from instrumentation.generator import generate_archive, refresh_public_cache
+
+
+class Command(BaseCommand):
+    help = "Time the main views against a generated archive and optionally compare with an earlier run. " \
+           "The archive is created inside a transaction that is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=100)
+        parser.add_argument('--songs', type=int, default=2000)
+        parser.add_argument('--reviews-per-song', type=int, default=12, dest='reviews_per_song')
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--public-posts', type=int, dest='public_posts',
+                            help="How many published songs get a public post (default all).")
+        parser.add_argument('--open-songs', type=int, default=30, dest='open_songs')
+        parser.add_argument('--closed-songs', type=int, default=20, dest='closed_songs')
+        parser.add_argument('--weeks', type=int, default=52, help="Scheduled weeks.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--runs', type=int, default=10, help="Timed runs of each scenario.")
+        parser.add_argument('--scenario', action='append', choices=SCENARIO_NAMES, dest='scenarios',
+                            help="Only run this scenario (can be repeated).")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Fail if a scenario regressed since the results in this JSON file.")
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help="How much slower than the baseline a median may be (default 1.2, i.e. 20%%).")
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in (
+            'writers', 'songs', 'reviews_per_song', 'comments', 'public_posts', 'open_songs', 'closed_songs',
+            'weeks', 'seed'
+        )}
+        scenarios = [s for s in SCENARIOS if not options['scenarios'] or s.name in options['scenarios']]
+
+        results = {}
+        # The test client's requests come from 'testserver'
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+            start = time.perf_counter()
+            archive = generate_archive(**sizes)
+            self.stdout.write("Generated the archive in %.1fs" % (time.perf_counter() - start))
+
+            for scenario in scenarios:
+                try:
+                    results[scenario.name] = summarise(*time_scenario(scenario, archive, options['runs']))
+                except ValueError as e:
+                    raise CommandError("%s: %s" % (scenario.name, e))
+                self.stdout.write(
+                    "%-14s median %7.1fms, 95th percentile %7.1fms, max %7.1fms, %3s queries" % (
+                        scenario.name, results[scenario.name]['median_ms'], results[scenario.name]['p95_ms'],
+                        results[scenario.name]['max_ms'], results[scenario.name]['queries']
+                    )
+                )
+
+            transaction.set_rollback(True)
+        # Don't leave pages from the rolled back archive in the public cache
+        refresh_public_cache()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': dict(sizes, runs=options['runs']), 'scenarios': results}, f, indent=2,
+                          sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline['options'] != dict(sizes, runs=options['runs']):
+                self.stderr.write("The baseline was run with different options: %s" % baseline['options'])
+            found = regressions(results, baseline['scenarios'], options['threshold'])
+            if found:
+                raise CommandError("Regressed since the baseline:\n" + "\n".join(found))
+            self.stdout.write("No regressions since the baseline.")
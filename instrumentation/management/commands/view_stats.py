@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from instrumentation.stats import load_stats
+
+HEADER = "%-28s %8s %8s %8s %8s %8s %8s %8s %8s" % (
+    'view', 'requests', 'p50 ms', 'p95 ms', 'max ms', 'queries', 'db ms', 'tmpl ms', 'KB'
+)
+
+
+class Command(BaseCommand):
+    help = "Show the slowest and most query-heavy views recorded by ViewStatsMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help="How many views to list (default 10).")
+        parser.add_argument('--hours', type=float, default=24, help="How far back to look (default 24).")
+        parser.add_argument('--path', help="The stats file (default VIEW_STATS_PATH).")
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.VIEW_STATS_PATH
+        if not os.path.exists(path):
+            raise CommandError("No view stats at %s: is VIEW_STATS_SAMPLE_RATE set?" % path)
+
+        views = load_stats(path, since=time.time() - options['hours'] * 3600)
+        if not views:
+            self.stdout.write("No requests recorded in the last %g hours." % options['hours'])
+            return
+
+        self.table("Slowest views (by p95)", views, lambda h: h['wall_ms'].percentile(95), options['top'])
+        self.stdout.write('')
+        self.table("Most queries per request", views, lambda h: h['queries'].mean(), options['top'])
+
+    def table(self, title, views, key, top):
+        self.stdout.write(title)
+        self.stdout.write(HEADER)
+        for view, h in sorted(views.items(), key=lambda item: key(item[1]), reverse=True)[:top]:
+            self.stdout.write("%-28s %8d %8.1f %8.1f %8.1f %8.1f %8.1f %8.1f %8.1f" % (
+                view, h['wall_ms'].count, h['wall_ms'].percentile(50), h['wall_ms'].percentile(95),
+                h['wall_ms'].max, h['queries'].mean(), h['db_ms'].mean(), h['template_ms'].mean(),
+                h['response_bytes'].mean() / 1024,
+            ))
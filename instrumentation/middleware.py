@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from instrumentation.stats import current, get_recorder
+
+
+def sample_rate():
+    return getattr(settings, 'VIEW_STATS_SAMPLE_RATE', 0)
+
+
+class RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.template_seconds = 0
+        self.rendering = False
+        # Turn on the query log (as DEBUG does) for this request, noting where it starts
+        self.connections = []
+        for connection in connections.all():
+            self.connections.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+            connection.force_debug_cursor = True
+
+    def stop(self):
+        queries, db_seconds = 0, 0
+        for connection, force_debug_cursor, start in self.connections:
+            new_queries = list(connection.queries_log)[start:]
+            queries += len(new_queries)
+            # Logged to the millisecond
+            db_seconds += sum(float(q['time']) for q in new_queries)
+            connection.force_debug_cursor = force_debug_cursor
+        return {
+            'wall_ms': (time.perf_counter() - self.start) * 1000,
+            'queries': queries,
+            'db_ms': db_seconds * 1000,
+            'template_ms': self.template_seconds * 1000,
+        }
+
+
+class ViewStatsMiddleware(MiddlewareMixin):
+    """
+    Times a sample of requests (VIEW_STATS_SAMPLE_RATE, from 0 to 1) for
+    the view_stats report. Put it first, so the time includes the other
+    middleware.
+    """
+
+    def __init__(self, get_response=None):
+        if not sample_rate():
+            raise MiddlewareNotUsed
+        super(ViewStatsMiddleware, self).__init__(get_response)
+
+    def process_request(self, request):
+        stale = getattr(current, 'timer', None)
+        if stale is not None:
+            # The last request on this thread failed in another middleware before we saw its response
+            stale.stop()
+        current.timer = RequestTimer() if random.random() < sample_rate() else None
+
+    def process_exception(self, request, exception):
+        # Response middleware is skipped when a view raises, so record it now
+        self.record(request, None)
+
+    def process_response(self, request, response):
+        self.record(request, None if response.streaming else len(response.content))
+        return response
+
+    def record(self, request, response_bytes):
+        timer = getattr(current, 'timer', None)
+        if timer is None:
+            return
+        current.timer = None
+        measurements = timer.stop()
+        measurements['response_bytes'] = response_bytes
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        recorder = get_recorder(settings.VIEW_STATS_PATH, getattr(settings, 'VIEW_STATS_FLUSH_INTERVAL', 60))
+        recorder.record(view, measurements)
@@ -0,0 +1,174 @@
+"""
+Per-view request statistics: wall time, database queries and time,
+template render time and response size.
+
+ViewStatsMiddleware times a sample of requests and adds them to
+histograms held in memory, one set per view (by URL name). Every
+VIEW_STATS_FLUSH_INTERVAL seconds the histograms for the window so far
+are appended to a SQLite file (VIEW_STATS_PATH) and started afresh, so a
+process only ever holds one window. The view_stats command merges the
+windows from a chosen period.
+
+The file is written with the sqlite3 module rather than the ORM, so
+recording never touches the site's database or its query counts.
+"""
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+MS_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Each bound is the upper limit of a bucket, with one more bucket for anything bigger
+METRICS = (
+    ('wall_ms', MS_BOUNDS),
+    ('queries', (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)),
+    ('db_ms', MS_BOUNDS),
+    ('template_ms', MS_BOUNDS),
+    ('response_bytes', (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+)
+
+# The timer for the request being handled by this thread, if it is being sampled
+current = threading.local()
+
+
+class Histogram(object):
+    """Counts of values in fixed buckets, plus their total and maximum."""
+
+    def __init__(self, bounds, counts=None, total=0, maximum=0):
+        self.bounds = tuple(bounds)
+        self.counts = list(counts) if counts else [0] * (len(self.bounds) + 1)
+        self.total = total
+        self.max = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            raise ValueError("Can't merge histograms with different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, percent):
+        """
+        An upper estimate of the given percentile: the upper bound of the
+        bucket it falls in, or the maximum if that's lower.
+        """
+        target = self.count * percent / 100.0
+        running = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            running += count
+            if count and running >= target:
+                return self.max if bound is None else min(bound, self.max)
+        return 0
+
+
+def new_histograms():
+    return {name: Histogram(bounds) for name, bounds in METRICS}
+
+
+class ViewStatsRecorder(object):
+    """The in-memory histograms of one process, flushed to the SQLite file at intervals."""
+
+    def __init__(self, path, flush_interval=60, clock=time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.window_start = clock()
+        self.views = {}
+
+    def record(self, view, measurements):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = new_histograms()
+            for name, value in measurements.items():
+                if value is not None:
+                    histograms[name].add(value)
+            due = self.clock() - self.window_start >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            views, start, end = self.views, self.window_start, self.clock()
+            self.views, self.window_start = {}, end
+        if not views:
+            return
+        try:
+            write_window(self.path, start, end, views)
+        except sqlite3.Error:
+            # Losing a window of stats shouldn't break the site
+            logger.exception("Couldn't write view stats to %s", self.path)
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(path, flush_interval=60):
+    """The recorder for a stats file, shared by the whole process and flushed when it exits."""
+    with _recorders_lock:
+        recorder = _recorders.get(path)
+        if recorder is None:
+            recorder = _recorders[path] = ViewStatsRecorder(path, flush_interval)
+            atexit.register(recorder.flush)
+        return recorder
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=5)
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS view_stats ('
+        'window_start REAL, window_end REAL, view TEXT, metric TEXT, '
+        'bounds TEXT, counts TEXT, total REAL, max REAL)'
+    )
+    db.execute('CREATE INDEX IF NOT EXISTS view_stats_window_end ON view_stats (window_end)')
+    return db
+
+
+def write_window(path, start, end, views):
+    rows = [
+        (start, end, view, name, json.dumps(histogram.bounds), json.dumps(histogram.counts),
+         histogram.total, histogram.max)
+        for view, histograms in views.items()
+        for name, histogram in histograms.items()
+    ]
+    with closing(connect(path)) as db, db:
+        db.executemany('INSERT INTO view_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def load_stats(path, since=None):
+    """{view: {metric: Histogram}} merged over the windows that ended at or after since (a timestamp)."""
+    views = {}
+    with closing(connect(path)) as db:
+        rows = db.execute(
+            'SELECT view, metric, bounds, counts, total, max FROM view_stats WHERE window_end >= ?',
+            (since or 0,)
+        )
+        for view, metric, bounds, counts, total, maximum in rows:
+            histogram = Histogram(json.loads(bounds), json.loads(counts), total, maximum)
+            histograms = views.setdefault(view, {})
+            if metric in histograms:
+                histograms[metric].merge(histogram)
+            else:
+                histograms[metric] = histogram
+    return views
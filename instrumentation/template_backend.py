@@ -0,0 +1,39 @@
+"""
+The Django template backend, timing renders for ViewStatsMiddleware.
+
+Only the outermost render in a request is timed, so templates rendered
+from inside another (by a template tag, say) aren't counted twice.
+"""
+import time
+
+from django.template.backends import django as django_backend
+
+from instrumentation.stats import current
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        timer = getattr(current, 'timer', None)
+        if timer is None or timer.rendering:
+            return super(Template, self).render(context, request)
+
+        timer.rendering = True
+        start = time.perf_counter()
+        try:
+            return super(Template, self).render(context, request)
+        finally:
+            timer.template_seconds += time.perf_counter() - start
+            timer.rendering = False
+
+
+class TimedDjangoTemplates(django_backend.DjangoTemplates):
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except django_backend.TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
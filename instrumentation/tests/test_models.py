@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from blurber.models import Review, ScheduledWeek, Song
+from tsj.models import Comment, PublicPost
+from instrumentation.generator import generate_archive
+
+
+class ArchiveGeneratorTests(TestCase):
+
+    def test_generates_the_requested_archive(self):
+        archive = generate_archive(writers=5, songs=20, reviews_per_song=3, comments=10, weeks=2,
+                                   open_songs=4, closed_songs=2)
+
+        self.assertTrue(archive.editor.is_staff)
+        self.assertEqual(len(archive.open_song_ids), 4)
+        self.assertEqual(len(archive.closed_song_ids), 2)
+        self.assertEqual(Song.objects.filter(status='published').count(), 14)
+        self.assertEqual(PublicPost.objects.filter(visible=True).count(), 14)
+        self.assertEqual(Review.objects.filter(status='published').count(), 14 * 3)
+        self.assertEqual(Comment.objects.count(), 10)
+        self.assertEqual(ScheduledWeek.objects.get(current_week=True).monday.count(), 1)
+
+        newest = PublicPost.objects.newest_first().first()
+        self.assertEqual(newest.song_id, archive.published_song_ids[-1])
+        self.assertIsNone(newest.next_post)
+        self.assertIn(archive.search_term, newest.song.artist)
+        # The stored stats agree with the reviews
+        for song in Song.objects.all():
+            self.assertEqual(song.saved_blurb_count, song.saved_reviews().count())
+
+    def test_same_seed_same_archive(self):
+        generate_archive(writers=3, songs=5, comments=0, weeks=1, seed=7)
+        first = list(Song.objects.order_by('id').values_list('artist', 'title', 'saved_blurb_count', 'score_total'))
+        Song.objects.all().delete()
+        generate_archive(writers=3, songs=5, comments=0, weeks=1, seed=7)
+        second = list(Song.objects.order_by('id').values_list('artist', 'title', 'saved_blurb_count', 'score_total'))
+
+        self.assertEqual(first, second)
+
+    def test_only_some_published_songs_posted(self):
+        archive = generate_archive(writers=3, songs=10, comments=0, weeks=1, public_posts=2, open_songs=1,
+                                   closed_songs=1)
+
+        self.assertEqual(len(archive.published_song_ids), 8)
+        self.assertEqual(archive.posted_song_ids, archive.published_song_ids[-2:])
+        self.assertEqual(PublicPost.objects.count(), 2)
@@ -0,0 +1,131 @@
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from blurber.models import Review, Song
+from blurber.publishing import enqueue_publish
+from blurber.urls import urlpatterns as blurber_urls
+from tsj import cache as page_cache
+from tsj.archives import archive_months
+from tsj.urls import urlpatterns as tsj_urls
+from writers.urls import urlpatterns as writers_urls
+from writers.views import current_year
+from instrumentation.generator import generate_archive
+
+SMALL = {'writers': 4, 'songs': 12, 'reviews_per_song': 3, 'comments': 5, 'weeks': 2,
+         'open_songs': 3, 'closed_songs': 3}
+LARGE = {'writers': 20, 'songs': 60, 'reviews_per_song': 12, 'comments': 100, 'weeks': 6,
+         'open_songs': 12, 'closed_songs': 6}
+
+
+def closed_review(archive):
+    return Review.objects.filter(song_id=archive.closed_song_ids[0]).order_by('sort_order')[1].id
+
+
+def review_order(archive):
+    song_id = archive.closed_song_ids[0]
+    return {'order': ','.join(str(i) for i in Review.objects.filter(song_id=song_id).values_list('id', flat=True))}
+
+
+def latest_month(archive):
+    month = archive_months()[0]
+    return {'year': '%04d' % month.year, 'month': '%02d' % month.month}
+
+
+def song(ids, index=0):
+    return lambda archive: {'song_id': getattr(archive, ids)[index]}
+
+
+def writer(archive):
+    return {'writer_id': archive.writer.id}
+
+
+def this_year(**kwargs):
+    return lambda archive: dict(kwargs, year=str(current_year()))
+
+
+# URL name: (user, method, URL kwargs(archive), POST data(archive)). Every
+# request is made against a small and a large archive, and should run the
+# same queries on both.
+REQUESTS = {
+    'weekly_schedule': ('writer', 'get', None, None),
+    'write_review': ('writer', 'get', song('open_song_ids'), None),
+    'write_review_html': ('writer', 'get', song('open_song_ids'), None),
+    'upload_song': ('editor', 'get', None, None),
+    'view_reviews': ('editor', 'get', song('closed_song_ids'), None),
+    'reorder_reviews': ('editor', 'post', song('closed_song_ids'), review_order),
+    'preview_post': ('editor', 'get', song('closed_song_ids'), None),
+    'fetch_html': ('editor', 'get', song('closed_song_ids'), None),
+    # Not the song the writer pages use, which has to stay open
+    'close_song': ('editor', 'get', song('open_song_ids', -1), None),
+    'publish_song': ('editor', 'get', song('closed_song_ids'), None),
+    'publish_job_status': ('editor', 'get', lambda archive: {
+        'job_id': enqueue_publish(Song.objects.get(id=archive.closed_song_ids[0])).id
+    }, None),
+    'move_review_up': ('editor', 'get', lambda archive: {'review_id': closed_review(archive)}, None),
+    'move_review_down': ('editor', 'get', lambda archive: {'review_id': closed_review(archive)}, None),
+    'move_review_top': ('editor', 'get', lambda archive: {'review_id': closed_review(archive)}, None),
+    'move_review_bottom': ('editor', 'get', lambda archive: {'review_id': closed_review(archive)}, None),
+
+    'home_page': (None, 'get', None, None),
+    'post_comment': (None, 'post', song('posted_song_ids'), lambda archive: {
+        'name': 'Reader', 'mail': 'reader@example.com', 'comment_text': 'Nice.'
+    }),
+    'single_post': (None, 'get', song('posted_song_ids'), None),
+    'comment_token': (None, 'get', None, None),
+    'about': (None, 'get', None, None),
+    'archive_month': (None, 'get', latest_month, None),
+    'feed': (None, 'get', None, None),
+    'atom_feed': (None, 'get', None, None),
+    'writer_feed': (None, 'get', writer, None),
+    'writer_atom_feed': (None, 'get', writer, None),
+
+    'my_blurbs': ('writer', 'get', None, None),
+    'my_blurbs_by_year': ('writer', 'get', this_year(), None),
+    'my_blurbs_by_status': ('writer', 'get', lambda archive: {'status': 'published'}, None),
+    'my_blurbs_by_year_and_status': ('writer', 'get', this_year(status='saved'), None),
+    'all_writers': ('editor', 'get', None, None),
+    'all_writers_alphabetical': ('editor', 'get', None, None),
+    'writer_blurbs': ('editor', 'get', writer, None),
+    'writer_blurbs_by_year': ('editor', 'get', lambda archive: dict(writer(archive), **this_year()(archive)), None),
+    'writer_blurbs_by_status': ('editor', 'get', lambda archive: dict(writer(archive), status='published'), None),
+    'writer_blurbs_by_year_and_status': ('editor', 'get', lambda archive: dict(
+        writer(archive), status='published', **this_year()(archive)
+    ), None),
+    'writer_stats': ('editor', 'get', writer, None),
+}
+
+
+class QueryCountTests(TestCase):
+    """Every page runs the same number of queries however big the archive is."""
+
+    def query_counts(self, sizes):
+        counts = {}
+        with transaction.atomic():
+            archive = generate_archive(**sizes)
+            for name, (user, method, kwargs, data) in sorted(REQUESTS.items()):
+                self.client.logout()
+                if user:
+                    self.client.force_login(getattr(archive, user))
+                url = reverse(name, kwargs=kwargs(archive) if kwargs else None)
+                data = data(archive) if data else {}
+                # Cold caches, so the pages are rendered in full
+                page_cache.public_cache().clear()
+
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(url, data)
+                self.assertLess(response.status_code, 400, name)
+                counts[name] = len(queries)
+            transaction.set_rollback(True)
+        return counts
+
+    def test_every_url_is_covered(self):
+        names = {pattern.name for pattern in blurber_urls + tsj_urls + writers_urls}
+        self.assertEqual(names, set(REQUESTS))
+
+    def test_query_counts_dont_grow_with_the_archive(self):
+        small, large = self.query_counts(SMALL), self.query_counts(LARGE)
+        for name in sorted(REQUESTS):
+            with self.subTest(url=name):
+                self.assertEqual(large[name], small[name])
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from blurber.tests.test_models import SongTestBase
+from writers.models import Writer
+from instrumentation.benchmarks import SCENARIO_NAMES
+from instrumentation.stats import Histogram, ViewStatsRecorder, get_recorder, load_stats
+
+
+class HistogramTests(TestCase):
+
+    def test_percentile_is_the_upper_bound_of_its_bucket(self):
+        h = Histogram((10, 100, 1000))
+        for value in (3, 4, 5, 50, 5000):
+            h.add(value)
+
+        self.assertEqual(h.count, 5)
+        self.assertEqual(h.percentile(50), 10)
+        self.assertEqual(h.percentile(80), 100)
+        # The last bucket has no upper bound
+        self.assertEqual(h.percentile(100), 5000)
+        self.assertEqual(h.mean(), 1012.4)
+
+    def test_merge(self):
+        a, b = Histogram((10, 100)), Histogram((10, 100))
+        a.add(5)
+        b.add(50)
+        b.add(70)
+        a.merge(b)
+
+        self.assertEqual(a.counts, [1, 2, 0])
+        self.assertEqual(a.total, 125)
+        self.assertEqual(a.max, 70)
+        with self.assertRaises(ValueError):
+            a.merge(Histogram((1,)))
+
+
+class ViewStatsTestBase(SongTestBase):
+
+    def setUp(self):
+        super(ViewStatsTestBase, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'view_stats.sqlite3')
+        self.addCleanup(shutil.rmtree, self.tmp)
+        # Before the directory goes
+        self.addCleanup(lambda: get_recorder(self.path).flush())
+
+
+@override_settings(VIEW_STATS_SAMPLE_RATE=1)
+class ViewStatsMiddlewareTests(ViewStatsTestBase):
+
+    def setUp(self):
+        super(ViewStatsMiddlewareTests, self).setUp()
+        self.settings_override = override_settings(VIEW_STATS_PATH=self.path)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_records_timings_by_view_name(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('home_page'))
+            self.client.get(reverse('home_page'))
+        get_recorder(self.path).flush()
+
+        histograms = load_stats(self.path)['home_page']
+        self.assertEqual(histograms['wall_ms'].count, 2)
+        self.assertEqual(histograms['queries'].total, len(queries))
+        self.assertGreater(histograms['template_ms'].total, 0)
+        self.assertEqual(histograms['db_ms'].count, 2)
+        self.assertEqual(histograms['response_bytes'].max, len(resp.content))
+
+    def test_unresolved_urls_are_grouped(self):
+        self.client.get('/no-such-page-here')
+        get_recorder(self.path).flush()
+
+        self.assertEqual(list(load_stats(self.path)), ['unresolved'])
+
+    def test_only_samples_the_given_share_of_requests(self):
+        with override_settings(VIEW_STATS_SAMPLE_RATE=0.5), \
+                mock.patch('instrumentation.middleware.random') as random:
+            random.random.side_effect = [0.2, 0.7, 0.4]
+            for _ in range(3):
+                self.client.get(reverse('about'))
+        get_recorder(self.path).flush()
+
+        self.assertEqual(load_stats(self.path)['about']['wall_ms'].count, 2)
+
+    def test_query_logging_is_switched_back_off(self):
+        self.client.get(reverse('home_page'))
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_not_used_when_sample_rate_is_zero(self):
+        with override_settings(VIEW_STATS_SAMPLE_RATE=0):
+            self.client.get(reverse('home_page'))
+        get_recorder(self.path).flush()
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ViewStatsRecorderTests(ViewStatsTestBase):
+
+    def test_flushes_each_window(self):
+        now = [1000.0]
+        recorder = ViewStatsRecorder(self.path, flush_interval=60, clock=lambda: now[0])
+        recorder.record('home_page', {'wall_ms': 30, 'queries': 2})
+        self.assertFalse(os.path.exists(self.path))
+
+        now[0] += 61
+        recorder.record('home_page', {'wall_ms': 40, 'queries': 2})
+        self.assertEqual(recorder.views, {})
+        self.assertEqual(load_stats(self.path)['home_page']['wall_ms'].count, 2)
+        # Windows that ended before since are left out
+        self.assertEqual(load_stats(self.path, since=now[0] + 1), {})
+
+
+class ViewStatsCommandTests(ViewStatsTestBase):
+
+    def test_lists_slowest_and_most_queried_views(self):
+        recorder = ViewStatsRecorder(self.path)
+        for view, wall_ms, queries in (('home_page', 20, 2), ('search', 300, 3), ('about', 5, 0)):
+            recorder.record(view, {'wall_ms': wall_ms, 'queries': queries, 'response_bytes': 2048})
+        recorder.flush()
+
+        out = StringIO()
+        call_command('view_stats', path=self.path, top=2, stdout=out)
+
+        slowest, most_queries = out.getvalue().split('\n\n')
+        self.assertEqual([line.split()[0] for line in slowest.splitlines()[2:]], ['search', 'home_page'])
+        self.assertEqual([line.split()[0] for line in most_queries.splitlines()[2:]], ['search', 'home_page'])
+
+    def test_missing_stats_file(self):
+        with self.assertRaises(CommandError):
+            call_command('view_stats', path=self.path, stdout=StringIO())
+
+
+class BenchmarkViewsCommandTests(ViewStatsTestBase):
+
+    def test_times_each_scenario_and_compares_with_a_baseline(self):
+        output = os.path.join(self.tmp, 'results.json')
+        sizes = {'writers': 4, 'songs': 12, 'open_songs': 3, 'closed_songs': 3, 'comments': 5, 'weeks': 2, 'runs': 2}
+        call_command('benchmark_views', output=output, stdout=StringIO(), **sizes)
+
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(sorted(results['scenarios']), sorted(SCENARIO_NAMES))
+        self.assertEqual(results['scenarios']['home']['runs'], 2)
+        # The archive was rolled back
+        self.assertEqual(Writer.objects.filter(username__startswith='generated-writer-').count(), 0)
+
+        # A baseline that was much faster, with fewer queries
+        for result in results['scenarios'].values():
+            result['median_ms'], result['queries'] = 0, 0
+        with open(output, 'w') as f:
+            json.dump(results, f)
+        with self.assertRaisesRegex(CommandError, 'home: 2 queries, was 0'):
+            call_command('benchmark_views', baseline=output, scenarios=['home'], stdout=StringIO(), **sizes)
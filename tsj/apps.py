@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TsjConfig(AppConfig):
     name = 'tsj'
+
+    def ready(self):
+        import tsj.signals  # noqa: F401
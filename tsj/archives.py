@@ -0,0 +1,85 @@
+"""
+The month archive shown in the public sidebar.
+
+Every month with a visible post is worked out with one grouped query over
+PublicPost.published_on and kept in the public cache. tsj.signals
+recomputes it whenever a post is saved or deleted (new posts in a month
+already listed just add to its count), and bumps the 'archives' version
+(re-rendering the sidebar and the cached pages that include it) only
+when the list of months has actually changed.
+"""
+from collections import namedtuple
+from datetime import date, datetime
+
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from tsj import cache as page_cache
+from tsj.models import PublicPost
+
+ARCHIVE_MONTHS_KEY = 'archive_months'
+
+
+class ArchiveMonth(namedtuple('ArchiveMonth', ['year', 'month', 'posts'])):
+
+    @property
+    def first_day(self):
+        return date(self.year, self.month, 1)
+
+
+def month_rollup():
+    """An ArchiveMonth for every month with a visible post, newest first (in the current time zone)."""
+    rows = PublicPost.objects.filter(visible=True).\
+        annotate(year=ExtractYear('published_on'), month=ExtractMonth('published_on')).\
+        values('year', 'month').annotate(posts=Count('id')).order_by('-year', '-month')
+    return [ArchiveMonth(row['year'], row['month'], row['posts']) for row in rows]
+
+
+def archive_months():
+    months = page_cache.public_cache().get(ARCHIVE_MONTHS_KEY)
+    if months is None:
+        # Evicted: nothing has changed since the last refresh, so no new version is needed
+        months = month_rollup()
+        page_cache.public_cache().set(ARCHIVE_MONTHS_KEY, months, None)
+    return months
+
+
+def refresh_archive_months():
+    cache = page_cache.public_cache()
+    old_months = cache.get(ARCHIVE_MONTHS_KEY)
+    months = month_rollup()
+    cache.set(ARCHIVE_MONTHS_KEY, months, None)
+    # The sidebar only shows the months, so new posts in a month already listed don't invalidate anything
+    if old_months is None or [m[:2] for m in old_months] != [m[:2] for m in months]:
+        page_cache.bump_version('archives')
+    return months
+
+
+def add_post(published_on):
+    """Count a new visible post, only running the rollup if its month isn't listed yet."""
+    cache = page_cache.public_cache()
+    months = cache.get(ARCHIVE_MONTHS_KEY)
+    if timezone.is_naive(published_on):
+        # As saving it did
+        published_on = timezone.make_aware(published_on, timezone.get_default_timezone())
+    published_on = timezone.localtime(published_on)
+    key = (published_on.year, published_on.month)
+    if months is None or key not in [m[:2] for m in months]:
+        return refresh_archive_months()
+    months = [m._replace(posts=m.posts + 1) if m[:2] == key else m for m in months]
+    cache.set(ARCHIVE_MONTHS_KEY, months, None)
+    return months
+
+
+def get_archive_month(year, month):
+    """The ArchiveMonth for year/month, or None if it has no visible posts."""
+    return next((m for m in archive_months() if (m.year, m.month) == (year, month)), None)
+
+
+def month_range(year, month):
+    # Half-open [first of the month, first of the next month) in the current time zone
+    return tuple(
+        timezone.make_aware(datetime(y, m, 1))
+        for y, m in ((year, month), (year + month // 12, month % 12 + 1))
+    )
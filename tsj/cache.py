@@ -0,0 +1,193 @@
+"""
+Caching for the public site.
+
+Rendered pages live in the cache named by the PUBLIC_CACHE_ALIAS setting
+(the default cache if unset), so the backend can be files or memcached as
+configured in CACHES. It has to be shared by every process: the publish
+worker invalidates pages the web processes serve, and the hit/miss counters
+are added up across them. check_public_cache() makes a per-process backend
+a startup error. Keys include version numbers that are
+bumped when shared content (e.g. the blogroll) changes, which invalidates
+every page using it at once without having to find and delete them.
+
+The same versions go into the validators of public pages, so browsers,
+feed readers and crawlers re-polling an unchanged page get a 304 without it
+being rendered (see page_validators() and conditional_response()).
+"""
+import hashlib
+import time
+from calendar import timegm
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+PAGE_TIMEOUT = 60 * 60 * 24
+
+# Rendered into cached pages in place of the per-visitor CSRF token
+CSRF_PLACEHOLDER = 'csrf-token-placeholder'
+
+# Content that can change any public page: the sidebars, plus 'posts',
+# bumped when a post is deleted (which leaves no last_modified behind)
+SHARED_VERSIONS = ('archives', 'blogroll', 'comments', 'posts')
+
+
+def public_cache_alias():
+    return getattr(settings, 'PUBLIC_CACHE_ALIAS', 'default')
+
+
+def public_cache():
+    return caches[public_cache_alias()]
+
+
+# Backends that keep a separate cache in each process
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register()
+def check_public_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get(public_cache_alias(), {}).get('BACKEND')
+    if backend in PER_PROCESS_BACKENDS:
+        return [checks.Error(
+            "The public page cache '%s' uses %s, which isn't shared between processes." % (
+                public_cache_alias(), backend
+            ),
+            hint="Publish jobs would never invalidate the pages the web processes serve. "
+                 "Use a file-based or memcached cache.",
+            id='tsj.E001',
+        )]
+    return []
+
+
+def _initial_version():
+    # Versions are times in milliseconds: if a version key is evicted or the
+    # cache is flushed we never go back to a number used before, and pages
+    # can give the newest as their Last-Modified
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    key = 'version:%s' % name
+    cache = public_cache()
+    cache.add(key, _initial_version(), None)
+    return cache.get(key) or _initial_version()
+
+
+def get_versions(names):
+    # One round trip when the versions are all there, as they usually are
+    keys = ['version:%s' % name for name in names]
+    found = public_cache().get_many(keys)
+    return [found.get(key) or get_version(name) for key, name in zip(keys, names)]
+
+
+def bump_version(name):
+    key = 'version:%s' % name
+    cache = public_cache()
+    cache.add(key, _initial_version(), None)
+    try:
+        # Move on to the current time, or by 1 if the clock hasn't moved past it
+        cache.incr(key, max(_initial_version() - (cache.get(key) or 0), 1))
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, _initial_version(), None)
+
+
+def _count(name):
+    key = 'stats:%s' % name
+    cache = public_cache()
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def page_stats(page_type):
+    cache = public_cache()
+    hits = cache.get('stats:%s:hits' % page_type, 0)
+    misses = cache.get('stats:%s:misses' % page_type, 0)
+    return {'hits': hits, 'misses': misses}
+
+
+def reset_page_stats(page_type):
+    public_cache().delete_many(['stats:%s:hits' % page_type, 'stats:%s:misses' % page_type])
+
+
+def single_post_key(song_id):
+    # The sidebars on every page show the archive months, blogroll and recent comments
+    return 'single_post:%s:%s:%s:%s' % (
+        song_id, get_version('archives'), get_version('blogroll'), get_version('comments')
+    )
+
+
+def get_single_post(song_id):
+    """The cached (html, etag, last modified) of a single post page, or None."""
+    page = public_cache().get(single_post_key(song_id))
+    _count('single_post:%s' % ('misses' if page is None else 'hits'))
+    return page
+
+
+def set_single_post(song_id, html, etag, last_modified):
+    public_cache().set(single_post_key(song_id), (html, etag, last_modified), PAGE_TIMEOUT)
+
+
+def invalidate_single_posts(song_ids):
+    public_cache().delete_many([single_post_key(song_id) for song_id in set(song_ids)])
+
+
+def feed_key(name):
+    # Feeds change when posts are published or edited, and writer feeds show writer names
+    return 'feed:%s:%s:%s' % (name, get_version('feeds'), get_version('blogroll'))
+
+
+def get_feed(name):
+    """The cached (content, content type, etag, last modified) of a feed, or None."""
+    feed = public_cache().get(feed_key(name))
+    _count('feed:%s' % ('misses' if feed is None else 'hits'))
+    return feed
+
+
+def set_feed(name, content, content_type, etag, last_modified):
+    public_cache().set(feed_key(name), (content, content_type, etag, last_modified), PAGE_TIMEOUT)
+
+
+def with_csrf_token(request, html):
+    return html.replace(CSRF_PLACEHOLDER, get_token(request))
+
+
+def page_validators(times, *parts):
+    """
+    A strong ETag and the Last-Modified time for a public page. times are
+    the last_modified of the page's own content (None for missing ones) and
+    parts anything else identifying it; the shared versions cover the
+    sidebars. Both validators come from all of them, so they change together.
+    """
+    versions = get_versions(SHARED_VERSIONS)
+    etag = quote_etag(hashlib.md5(repr(tuple(times) + parts + tuple(versions)).encode('utf-8')).hexdigest())
+    shared = datetime.fromtimestamp(max(versions) / 1000, timezone.utc)
+    return etag, max([t for t in times if t] + [shared])
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    The 304 (or 412) response if the request's conditional headers are
+    satisfied by the page's current validators, otherwise None. Call it
+    before rendering anything.
+    """
+    return get_conditional_response(
+        request, etag=etag, last_modified=timegm(last_modified.utctimetuple()) if last_modified else None
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
@@ -0,0 +1,107 @@
+"""
+RSS and Atom feeds of the latest public posts, site-wide and per writer.
+
+Entries reuse each post's stored html_content, so a feed is one query
+for its posts. Rendered feeds are kept in the public cache until tsj.signals
+bumps the 'feeds' version on publish, and served with conditional GET, so
+readers polling an unchanged feed never reach the database.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.contrib.syndication.views import Feed
+from django.core.urlresolvers import reverse, reverse_lazy
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import parse_http_date_safe, quote_etag
+
+from tsj import cache as page_cache
+from tsj.models import PublicPost
+from writers.models import Writer
+
+FEED_ITEMS = 20
+
+
+class LatestPostsFeed(Feed):
+    title = "The Singles Jukebox"
+    link = reverse_lazy('home_page')
+    description = "Pop, to two decimal places"
+
+    def items(self):
+        return PublicPost.objects.filter(visible=True).newest_first().select_related('song')[:FEED_ITEMS]
+
+    def item_title(self, pp):
+        return str(pp.song)
+
+    def item_description(self, pp):
+        return pp.html_content
+
+    def item_link(self, pp):
+        return reverse('single_post', kwargs={'song_id': pp.song_id})
+
+    def item_pubdate(self, pp):
+        return pp.published_on
+
+    def item_updateddate(self, pp):
+        return pp.last_modified
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class WriterPostsFeed(LatestPostsFeed):
+    """The latest posts with a published blurb by one writer."""
+
+    def get_object(self, request, writer_id):
+        return get_object_or_404(Writer, id=writer_id)
+
+    def title(self, writer):
+        return "The Singles Jukebox: %s" % writer.get_full_name()
+
+    def description(self, writer):
+        return "Songs blurbed by %s" % writer.get_full_name()
+
+    def items(self, writer):
+        songs = writer.published_blurb_history().order_by().values('song_id')
+        return PublicPost.objects.filter(visible=True, song__in=songs).newest_first().\
+            select_related('song')[:FEED_ITEMS]
+
+
+class WriterPostsAtomFeed(WriterPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = WriterPostsFeed.description
+
+
+def cached_feed(feed, name):
+    """
+    A view serving the feed from the public cache, keyed by name (formatted
+    with the URL kwargs), and rendering it only on a miss.
+    """
+    def view(request, **kwargs):
+        # Entry links are absolute, so each host gets its own copy
+        cache_name = '%s://%s:%s' % (request.scheme, request.get_host(), name.format(**kwargs))
+        cached = page_cache.get_feed(cache_name)
+        if cached is None:
+            response = feed(request, **kwargs)
+            content, content_type = response.content, response['Content-Type']
+            etag = quote_etag(hashlib.md5(content).hexdigest())
+            # Syndication sets this from the newest item's date
+            timestamp = parse_http_date_safe(response.get('Last-Modified', ''))
+            last_modified = datetime.fromtimestamp(timestamp, timezone.utc) if timestamp else None
+            page_cache.set_feed(cache_name, content, content_type, etag, last_modified)
+        else:
+            content, content_type, etag, last_modified = cached
+
+        response = page_cache.conditional_response(request, etag, last_modified) or \
+            HttpResponse(content, content_type=content_type)
+        return page_cache.set_validators(response, etag, last_modified)
+    return view
+
+
+latest_posts_rss = cached_feed(LatestPostsFeed(), 'posts-rss')
+latest_posts_atom = cached_feed(LatestPostsAtomFeed(), 'posts-atom')
+writer_posts_rss = cached_feed(WriterPostsFeed(), 'writer-{writer_id}-rss')
+writer_posts_atom = cached_feed(WriterPostsAtomFeed(), 'writer-{writer_id}-atom')
@@ -1,8 +1,15 @@
-from django.forms import ModelForm, ValidationError, TextInput, Textarea
+from django.forms import CharField, ModelForm, ValidationError, TextInput, Textarea
 from tsj.models import Comment
 
 
 class CommentForm(ModelForm):
+    # Hidden from readers, so anything in it came from a spam bot
+    url = CharField(required=False, widget=TextInput(attrs={'size': 40, 'autocomplete': 'off', 'tabindex': '-1'}))
+
+    def clean_url(self):
+        if self.cleaned_data['url']:
+            raise ValidationError("Leave this field empty.")
+        return ''
 
     class Meta:
         model = Comment
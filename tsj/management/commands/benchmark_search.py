@@ -0,0 +1,118 @@
+import random
+import time
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils import timezone
+
+from blurber.models import Song
+from tsj.models import PublicPost
+from tsj.search import rebuild_index, search
+from tsj.views import SEARCH_RESULTS_PER_PAGE
+
+SYLLABLES = ['ba', 'ko', 'ri', 'su', 'ne', 'lo', 'ma', 'te', 'vi', 'da', 'po', 'ze', 'qu', 'fi', 'gro', 'shi']
+
+
+class Command(BaseCommand):
+    help = "Time public searches against a generated corpus of posts. " \
+           "The corpus is created inside a transaction that is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--legacy-queries', type=int, default=20, dest='legacy_queries',
+                            help="How many of the queries to also time with the old icontains filter.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = self.vocabulary(rng, 5000)
+        # Roughly Zipfian word cum_frequencies, like real text
+        cum_frequencies = list(accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            self.build_corpus(rng, options['posts'], vocabulary, cum_frequencies)
+            self.stdout.write("Created %s posts in %.1fs" % (options['posts'], time.perf_counter() - start))
+
+            start = time.perf_counter()
+            rebuild_index()
+            self.stdout.write("Indexed them in %.1fs" % (time.perf_counter() - start))
+
+            # Readers mostly search for artists and titles, so pick query
+            # words uniformly rather than by their frequency in the text
+            queries = [" ".join(rng.sample(vocabulary, rng.randint(1, 2))) for i in range(options['queries'])]
+            indexed = self.time_queries(
+                queries, lambda query: search(query)
+            )
+            legacy = self.time_queries(
+                queries[:options['legacy_queries']],
+                lambda query: PublicPost.objects.filter(
+                    html_content__icontains=query, include_in_search_results=True, visible=True
+                ).order_by('-published_on')
+            )
+
+            transaction.set_rollback(True)
+
+        self.report("Indexed search", indexed)
+        self.report("Legacy icontains search", legacy)
+
+    @staticmethod
+    def time_queries(queries, get_results):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            list(Paginator(get_results(query), SEARCH_RESULTS_PER_PAGE).page(1))
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)
+
+    def report(self, label, timings):
+        if not timings:
+            return
+        self.stdout.write(
+            "%s, %s queries: median %.1fms, 95th percentile %.1fms, max %.1fms" % (
+                label,
+                len(timings),
+                timings[len(timings) // 2] * 1000,
+                timings[int(len(timings) * 0.95)] * 1000,
+                timings[-1] * 1000
+            )
+        )
+
+    @staticmethod
+    def vocabulary(rng, size):
+        words = set()
+        while len(words) < size:
+            words.add("".join(rng.choice(SYLLABLES) for i in range(rng.randint(2, 4))))
+        return sorted(words)
+
+    @staticmethod
+    def build_corpus(rng, count, vocabulary, cum_frequencies, batch_size=1000):
+        published_on = datetime(2005, 1, 1, tzinfo=timezone.utc)
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            songs = Song.objects.bulk_create([
+                Song(
+                    artist=" ".join(rng.choices(vocabulary, cum_weights=cum_frequencies, k=2)),
+                    title=" ".join(rng.choices(vocabulary, cum_weights=cum_frequencies, k=3)),
+                    tagline=" ".join(rng.choices(vocabulary, cum_weights=cum_frequencies, k=6)),
+                    status='published'
+                ) for i in range(size)
+            ])
+            if songs[0].pk is None:
+                # Backends that don't return bulk-inserted IDs
+                songs = list(Song.objects.order_by('-pk')[:size])[::-1]
+
+            posts = []
+            for song in songs:
+                published_on += timedelta(hours=8)
+                paragraphs = [
+                    "<p><strong>Writer:</strong> %s<br />[%s]</p>" % (
+                        " ".join(rng.choices(vocabulary, cum_weights=cum_frequencies, k=60)), rng.randint(0, 10)
+                    ) for i in range(8)
+                ]
+                posts.append(PublicPost(song=song, html_content="".join(paragraphs), published_on=published_on))
+            PublicPost.objects.bulk_create(posts)
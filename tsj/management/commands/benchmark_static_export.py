@@ -0,0 +1,25 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from tsj.static_site import export_site
+
+
+class Command(BaseCommand):
+    help = "Time full static exports of the current database with different numbers of rendering processes. " \
+           "The pages are written to a temporary directory that is removed afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                            help="Worker counts to try (default: 1 2 4).")
+
+    def handle(self, *args, **options):
+        for workers in options['workers']:
+            with tempfile.TemporaryDirectory() as output:
+                start = time.perf_counter()
+                written, skipped, removed = export_site(output, workers=workers, full=True)
+                elapsed = time.perf_counter() - start
+            self.stdout.write("%s worker%s: %s pages in %.1fs, %.0f pages/s" % (
+                workers, '' if workers == 1 else 's', written, elapsed, written / elapsed if elapsed else 0
+            ))
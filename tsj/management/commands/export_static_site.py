@@ -0,0 +1,32 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tsj.static_site import export_site
+
+
+class Command(BaseCommand):
+    help = "Render the public site (posts, home and archive pages, about) into a directory of static HTML. " \
+           "After the first run only the posts changed since the last one are re-rendered."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Directory to write the site to.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Rendering processes (default: one per CPU).")
+        parser.add_argument('--full', action='store_true', dest='full',
+                            help="Re-render every page, e.g. to refresh the sidebars everywhere.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(written):
+            self.stdout.write("Rendered %s pages (%.0fs)" % (written, time.perf_counter() - start))
+
+        written, skipped, removed = export_site(
+            options['output'], workers=options['workers'], full=options['full'], progress=progress
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write("Rendered %s pages in %.1fs (%.0f pages/s), skipped %s, removed %s." % (
+            written, elapsed, written / elapsed if elapsed else 0, skipped, removed
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tsj import cache as page_cache
+from tsj.archives import refresh_archive_months
+from tsj.models import PublicPost
+from tsj.wordpress import import_wxr
+from writers.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Import the published posts, reviews, writers and comments from a WordPress export (WXR) file. " \
+           "Posts that were already imported are skipped, so an interrupted import can be run again."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The WXR export file.")
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help="Posts imported per transaction (default 500).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(seen, imported):
+            self.stdout.write("Read %s posts, imported %s (%.0fs)" % (seen, imported, time.perf_counter() - start))
+
+        seen, imported, clashes = import_wxr(options['path'], batch_size=options['batch_size'], progress=progress)
+
+        # Bulk inserts skip save() and the signals, so catch up once at the end
+        PublicPost.objects.relink()
+        rebuild_stats()
+        refresh_archive_months()
+        page_cache.bump_version('blogroll')
+        page_cache.bump_version('comments')
+
+        self.stdout.write("Imported %s of %s posts in %.0fs." % (imported, seen, time.perf_counter() - start))
+        if clashes:
+            raise CommandError(
+                "%s posts weren't imported, as songs created in the blurber already have their IDs: %s" % (
+                    len(clashes), ", ".join(str(post_id) for post_id in clashes)
+                )
+            )
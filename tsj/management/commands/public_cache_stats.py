@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from tsj.cache import page_stats, reset_page_stats
+
+PAGE_TYPES = ['single_post', 'feed']
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counts for the public page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', dest='reset', help="Zero the counters afterwards.")
+
+    def handle(self, *args, **options):
+        for page_type in PAGE_TYPES:
+            stats = page_stats(page_type)
+            total = stats['hits'] + stats['misses']
+            hit_rate = 100.0 * stats['hits'] / total if total else 0
+            self.stdout.write("%s: %s hits, %s misses (%.1f%% hit rate)" % (
+                page_type, stats['hits'], stats['misses'], hit_rate
+            ))
+            if options['reset']:
+                reset_page_stats(page_type)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tsj.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the public search index from every visible PublicPost."
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write("Indexed %s posts." % count)
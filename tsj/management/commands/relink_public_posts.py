@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tsj.models import PublicPost
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored previous/next links and positions of visible public posts."
+
+    def handle(self, *args, **options):
+        changed = PublicPost.objects.relink()
+        self.stdout.write("Relinked %s posts." % changed)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_search_index(apps, schema_editor):
+    # Weigh terms as tsj.search does, but read the posts through the
+    # historical models: the live ones have columns added by later migrations
+    from tsj.search import post_term_weights
+    PublicPost = apps.get_model('tsj', 'PublicPost')
+    SearchTerm = apps.get_model('tsj', 'SearchTerm')
+    Review = apps.get_model('blurber', 'Review')
+
+    posts = PublicPost.objects.filter(visible=True, include_in_search_results=True).select_related('song')
+    post_ids = list(posts.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(post_ids), 500):
+        batch = list(posts.filter(pk__in=post_ids[start:start + 500]))
+        names = {}
+        reviews = Review.objects.filter(
+            song_id__in=[post.song_id for post in batch], status__in=['saved', 'published']
+        ).values_list('song_id', 'writer__first_name', 'writer__last_name')
+        for song_id, first_name, last_name in reviews:
+            names.setdefault(song_id, []).append("%s %s" % (first_name, last_name))
+        SearchTerm.objects.bulk_create([
+            SearchTerm(post=post, term=term, weight=weight)
+            for post in batch
+            for term, weight in post_term_weights(post, names.get(post.song_id, [])).items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0005_comment_song'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.IntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tsj.PublicPost')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'post'], name='tsj_searchterm_term_post'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together=set([('post', 'term')]),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
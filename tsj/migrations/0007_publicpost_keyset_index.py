@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0006_search_term'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='publicpost',
+            index=models.Index(fields=['visible', 'published_on', 'id'], name='tsj_publicpost_visible_pub'),
+        ),
+    ]
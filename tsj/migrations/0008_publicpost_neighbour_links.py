@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def hide_old_versions_and_link_posts(apps, schema_editor):
+    PublicPost = apps.get_model('tsj', 'PublicPost')
+
+    # Keep only the newest visible version of each song
+    seen_songs = set()
+    for post_id, song_id in PublicPost.objects.filter(visible=True).\
+            order_by('-published_on', '-id').values_list('id', 'song_id'):
+        if song_id in seen_songs:
+            PublicPost.objects.filter(id=post_id).update(visible=False)
+        seen_songs.add(song_id)
+
+    visible_ids = list(
+        PublicPost.objects.filter(visible=True).order_by('published_on', 'id').values_list('id', flat=True)
+    )
+    for i, post_id in enumerate(visible_ids):
+        PublicPost.objects.filter(id=post_id).update(
+            previous_post_id=visible_ids[i - 1] if i > 0 else None,
+            next_post_id=visible_ids[i + 1] if i + 1 < len(visible_ids) else None
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0007_publicpost_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publicpost',
+            name='next_post',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tsj.PublicPost'),
+        ),
+        migrations.AddField(
+            model_name='publicpost',
+            name='previous_post',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tsj.PublicPost'),
+        ),
+        migrations.RunPython(hide_old_versions_and_link_posts, migrations.RunPython.noop),
+    ]
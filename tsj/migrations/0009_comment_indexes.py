@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0008_publicpost_neighbour_links'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['song', 'visible', 'published_on'], name='tsj_comment_song_visible'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['visible', 'published_on'], name='tsj_comment_visible_pub'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 19:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def number_visible_posts(apps, schema_editor):
+    PublicPost = apps.get_model('tsj', 'PublicPost')
+    visible_ids = PublicPost.objects.filter(visible=True).order_by('published_on', 'id').values_list('id', flat=True)
+    for position, post_id in enumerate(list(visible_ids), 1):
+        PublicPost.objects.filter(id=post_id).update(position=position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tsj', '0011_imported_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publicpost',
+            name='position',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='publicpost',
+            index=models.Index(fields=['visible', 'position'], name='tsj_publicpost_visible_pos'),
+        ),
+        migrations.RunPython(number_visible_posts, migrations.RunPython.noop),
+    ]
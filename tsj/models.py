@@ -1,6 +1,68 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from blurber.models import Song
 
+# Sent by PublicPost.save() once the post and its prev/next links are saved,
+# with the song IDs of the single post pages showing it (its own and its
+# neighbours'), so receivers don't have to look the neighbours up again
+public_post_saved = Signal(providing_args=['post', 'created', 'affected_song_ids'])
+
+
+class PublicPostQuerySet(models.QuerySet):
+
+    def newest_first(self):
+        # (published_on, id) is the ordering key used for keyset pagination
+        return self.order_by('-published_on', '-id')
+
+    def published_before(self, published_on, post_id):
+        """
+        Posts that come after (published_on, post_id) in newest_first()
+        order, i.e. the next page of a keyset-paginated listing.
+        """
+        return self.filter(
+            models.Q(published_on__lt=published_on) |
+            models.Q(published_on=published_on, id__lt=post_id)
+        )
+
+    def published_after(self, published_on, post_id):
+        return self.filter(
+            models.Q(published_on__gt=published_on) |
+            models.Q(published_on=published_on, id__gt=post_id)
+        )
+
+    def relink(self):
+        """
+        Rebuild the stored previous/next links and positions of every post
+        from scratch, e.g. after a bulk import or queryset update that
+        bypassed save(). Returns the number of posts that changed.
+        """
+        visible_ids = list(self.filter(visible=True).newest_first().values_list('id', flat=True))[::-1]
+        expected = {}
+        for i, post_id in enumerate(visible_ids):
+            expected[post_id] = (
+                visible_ids[i - 1] if i > 0 else None,
+                visible_ids[i + 1] if i + 1 < len(visible_ids) else None,
+                i + 1
+            )
+
+        changed = 0
+        with transaction.atomic():
+            for post_id, previous_id, next_id, position in self.values_list(
+                    'id', 'previous_post_id', 'next_post_id', 'position'):
+                links = expected.get(post_id, (None, None, None))
+                if (previous_id, next_id) != links[:2]:
+                    self.filter(id=post_id).update(
+                        previous_post_id=links[0], next_post_id=links[1], position=links[2],
+                        last_modified=timezone.now()
+                    )
+                    changed += 1
+                elif position != links[2]:
+                    # The page itself is unchanged, so last_modified stays put
+                    self.filter(id=post_id).update(position=links[2])
+                    changed += 1
+        return changed
+
 
 class PublicPost(models.Model):
     """
@@ -11,6 +73,10 @@ class PublicPost(models.Model):
     You can reopen then republish a song and create a new PublicPost which will hide the old one, or for small
     emergency changes you can edit the html_content directly.
 
+    The previous/next visible posts are stored on each post and relinked whenever a post is saved,
+    so single post pages don't have to look them up. Visible posts are also numbered in publication
+    order, so legacy ?paged=N home pages can find where they start without counting through the posts.
+
     IMPORTANT: Song ID refers to the Song.id, not PublicPost.id (which may change if republished)
     """
     song = models.ForeignKey(Song)
@@ -18,10 +84,165 @@ class PublicPost(models.Model):
     visible = models.BooleanField(default=True)
     include_in_search_results = models.BooleanField(default=True)
     published_on = models.DateTimeField()  # Don't edit this or use for scheduling, use Song.publish_date
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Neighbouring visible posts for the prev/next links, maintained by save()
+    previous_post = models.ForeignKey('self', null=True, blank=True, editable=False,
+                                      on_delete=models.SET_NULL, related_name='+')
+    next_post = models.ForeignKey('self', null=True, blank=True, editable=False,
+                                  on_delete=models.SET_NULL, related_name='+')
+    # Place among the visible posts, oldest first (1, 2, 3...), maintained by save()
+    position = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    objects = PublicPostQuerySet.as_manager()
 
     def __str__(self):
         return self.song.__str__()
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic(savepoint=False):
+            if not created:
+                # The links may have changed since this copy was loaded, and
+                # update_links() needs the stored ones to tell if it moved
+                self.refresh_from_db(fields=['previous_post', 'next_post', 'position'])
+            super(PublicPost, self).save(*args, **kwargs)
+            if self.visible:
+                # Only one version of a song is public: hide the older ones
+                for old_version in PublicPost.objects.filter(song_id=self.song_id, visible=True).exclude(id=self.id):
+                    old_version.visible = False
+                    old_version.save()
+            neighbours = self.update_links()
+            public_post_saved.send(
+                sender=PublicPost, post=self, created=created,
+                affected_song_ids=[self.song_id] + [post.song_id for post in neighbours]
+            )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self.refresh_from_db(fields=['position'])
+            previous_post, next_post = self.neighbours()
+            result = super(PublicPost, self).delete(*args, **kwargs)
+            self._join(previous_post, next_post)
+            if self.position is not None:
+                self._close_gap(self.position)
+        return result
+
+    def neighbours(self):
+        """
+        The visible posts either side of this one in publication order,
+        looked up from the (published_on, id) index rather than the stored links.
+        Only their keys, links and positions are loaded, not the post HTML.
+        """
+        visible_posts = PublicPost.objects.filter(visible=True).exclude(id=self.id).\
+            only('id', 'song_id', 'published_on', 'previous_post_id', 'next_post_id', 'position')
+        previous_post = visible_posts.published_before(self.published_on, self.id).newest_first().first()
+        next_post = visible_posts.published_after(self.published_on, self.id).\
+            order_by('published_on', 'id').first()
+        return previous_post, next_post
+
+    def update_links(self):
+        """
+        Relink this post and its neighbours, and if it has moved or been
+        hidden, join up the posts it used to sit between and renumber the
+        posts after it. Returns the posts either side of it before and after,
+        whose pages link to it.
+        """
+        previous_post, next_post = self.neighbours()
+        old_neighbours = []
+        moved = (self.previous_post_id, self.next_post_id) != tuple(post.id if post else None
+                                                                    for post in (previous_post, next_post))
+        position = self.position
+        if moved or self.visible != (position is not None):
+            position = self._renumber(previous_post, next_post)
+        if moved:
+            old_neighbours = self._unlink()
+            # The old neighbours' links may have just changed, so use those copies
+            by_id = {post.id: post for post in old_neighbours}
+            previous_post = by_id.get(previous_post.id, previous_post) if previous_post else None
+            next_post = by_id.get(next_post.id, next_post) if next_post else None
+
+        # This post's own links and position in one UPDATE (save() has just
+        # moved its last_modified), then its neighbours' links to it
+        links = (previous_post, next_post) if self.visible else (None, None)
+        if (self.previous_post_id, self.next_post_id, self.position) != \
+                tuple(post.id if post else None for post in links) + (position,):
+            self.previous_post, self.next_post = links
+            self.position = position
+            PublicPost.objects.filter(id=self.id).update(previous_post=links[0], next_post=links[1], position=position)
+        if self.visible:
+            self._join(previous_post, self)
+            self._join(self, next_post)
+        else:
+            self._join(previous_post, next_post)
+        neighbours = old_neighbours + [post for post in (previous_post, next_post) if post]
+        return list({post.id: post for post in neighbours}.values())
+
+    def _unlink(self):
+        """
+        Join up the posts this one was stored as sitting between, where
+        they still link to it. Returns them.
+        """
+        old_ids = [post_id for post_id in (self.previous_post_id, self.next_post_id) if post_id]
+        if not old_ids:
+            return []
+        old = PublicPost.objects.filter(id__in=old_ids, visible=True).\
+            only('id', 'song_id', 'published_on', 'previous_post_id', 'next_post_id').in_bulk()
+        old_previous, old_next = old.get(self.previous_post_id), old.get(self.next_post_id)
+        if old_previous and old_previous.next_post_id == self.id:
+            old_previous.next_post = old_next
+            PublicPost.objects.filter(id=old_previous.id).update(next_post=old_next, last_modified=timezone.now())
+        if old_next and old_next.previous_post_id == self.id:
+            old_next.previous_post = old_previous
+            PublicPost.objects.filter(id=old_next.id).update(previous_post=old_previous, last_modified=timezone.now())
+        return list(old.values())
+
+    def _renumber(self, previous_post, next_post):
+        """
+        Take this post out of the numbering if it had a place, and if it is
+        visible, make room for it between its new neighbours. Returns its
+        new position (None if hidden), which the caller stores.
+        """
+        if self.position is not None:
+            self._close_gap(self.position)
+            for post in (previous_post, next_post):
+                if post and post.position and post.position > self.position:
+                    post.position -= 1
+        if not self.visible:
+            return None
+        if previous_post and previous_post.position is None:
+            # Posts not numbered yet (relink() numbers them): count instead
+            position = PublicPost.objects.filter(visible=True).exclude(id=self.id).\
+                published_before(self.published_on, self.id).count() + 1
+        else:
+            position = previous_post.position + 1 if previous_post else 1
+        if next_post:
+            # Not the usual case of a new post going after the newest
+            PublicPost.objects.filter(visible=True, position__gte=position).exclude(id=self.id).\
+                update(position=models.F('position') + 1)
+        return position
+
+    def _close_gap(self, position):
+        PublicPost.objects.filter(visible=True, position__gt=position).exclude(id=self.id).\
+            update(position=models.F('position') - 1)
+
+    @staticmethod
+    def _join(earlier, later):
+        # A post whose links change has a changed page, so its last_modified
+        # moves too (the static export finds the pages to redo by it)
+        if earlier and earlier.next_post_id != (later.id if later else None):
+            earlier.next_post = later
+            PublicPost.objects.filter(id=earlier.id).update(next_post=later, last_modified=timezone.now())
+        if later and later.previous_post_id != (earlier.id if earlier else None):
+            later.previous_post = earlier
+            PublicPost.objects.filter(id=later.id).update(previous_post=earlier, last_modified=timezone.now())
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['visible', 'published_on', 'id'], name='tsj_publicpost_visible_pub'),
+            models.Index(fields=['visible', 'position'], name='tsj_publicpost_visible_pos'),
+        ]
+
 
 class Comment(models.Model):
     song = models.ForeignKey(Song)
@@ -31,6 +252,47 @@ class Comment(models.Model):
     comment_text = models.TextField()
     visible = models.BooleanField(default=True)
     published_on = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
+
+    class Meta:
+        indexes = [
+            # A post's comments in order, and the blogroll's recent comments
+            models.Index(fields=['song', 'visible', 'published_on'], name='tsj_comment_song_visible'),
+            models.Index(fields=['visible', 'published_on'], name='tsj_comment_visible_pub'),
+        ]
+
+
+class ImportedPost(models.Model):
+    """
+    A song imported from the WordPress archive, which keeps its WordPress
+    post ID (see tsj.wordpress). Tells reruns of the import which posts are
+    done, and which song IDs were taken by songs created in the blurber.
+    """
+    song = models.OneToOneField(Song, primary_key=True, on_delete=models.CASCADE)
+    imported_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.song.__str__()
+
+
+class SearchTerm(models.Model):
+    """
+    One row of the public search index: a normalised word that appears in
+    a visible PublicPost, weighted by where and how often it appears.
+    Maintained by tsj.search, never edited by hand.
+    """
+    post = models.ForeignKey(PublicPost, on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    weight = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ('post', 'term')
+        indexes = [
+            models.Index(fields=['term', 'post'], name='tsj_searchterm_term_post'),
+        ]
+
+    def __str__(self):
+        return self.term
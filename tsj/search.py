@@ -0,0 +1,152 @@
+"""
+Public site search.
+
+Each visible PublicPost is broken down into weighted terms (its text with
+the HTML stripped, plus the song's artist, title and tagline and the names
+of the writers who blurbed it) and stored in SearchTerm, so a search is an
+indexed lookup on the terms rather than a scan over raw HTML.
+"""
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.utils.html import strip_tags
+from django.utils.text import unescape_entities
+
+from blurber.models import Review
+from tsj.models import PublicPost, SearchTerm
+
+# How much a match in each part of a post counts towards its rank
+TITLE_WEIGHT = 10
+TAGLINE_WEIGHT = 4
+WRITER_WEIGHT = 3
+BODY_WEIGHT = 1
+
+MAX_TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+STOP_WORDS = {'a', 'an', 'and', 'at', 'for', 'in', 'is', 'it', 'of', 'on', 'or', 'the', 'to'}
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return [
+        word[:MAX_TERM_LENGTH] for word in WORD_RE.findall((text or '').lower())
+        if word not in STOP_WORDS
+    ]
+
+
+def query_terms(query):
+    # Unique terms, in the order they were typed
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def is_searchable(post):
+    return post.visible and post.include_in_search_results
+
+
+def html_to_text(html):
+    # Space out the tags first so words either side of them don't run together
+    return unescape_entities(strip_tags(html.replace('<', ' <')))
+
+
+def post_term_weights(post, writer_names=()):
+    weights = Counter()
+    song = post.song
+    for term in tokenize("%s %s" % (song.artist, song.title)):
+        weights[term] += TITLE_WEIGHT
+    for term in tokenize(song.tagline):
+        weights[term] += TAGLINE_WEIGHT
+    for term in tokenize(" ".join(writer_names)):
+        weights[term] += WRITER_WEIGHT
+    for term in tokenize(html_to_text(post.html_content)):
+        weights[term] += BODY_WEIGHT
+    return weights
+
+
+def _writer_names_by_song(song_ids):
+    names = {}
+    reviews = Review.objects.filter(song_id__in=song_ids, status__in=['saved', 'published']).\
+        values_list('song_id', 'writer__first_name', 'writer__last_name')
+    for song_id, first_name, last_name in reviews:
+        names.setdefault(song_id, []).append("%s %s" % (first_name, last_name))
+    return names
+
+
+def _search_terms(post, writer_names):
+    return [
+        SearchTerm(post=post, term=term, weight=weight)
+        for term, weight in post_term_weights(post, writer_names).items()
+    ]
+
+
+def index_post(post, new=False):
+    # A new post has no terms to clear out. Posts are indexed as they are
+    # saved, inside PublicPost.save()'s transaction, so no savepoint
+    with transaction.atomic(savepoint=False):
+        if not new:
+            SearchTerm.objects.filter(post=post).delete()
+        if is_searchable(post):
+            writer_names = _writer_names_by_song([post.song_id]).get(post.song_id, [])
+            SearchTerm.objects.bulk_create(_search_terms(post, writer_names))
+
+
+def rebuild_index(posts=None, batch_size=500):
+    """
+    (Re)index the given PublicPosts (default: all of them) in batches,
+    with one writer name lookup and one bulk insert per batch.
+    Returns the number of posts indexed.
+    """
+    if posts is None:
+        posts = PublicPost.objects.all()
+    post_ids = list(posts.filter(visible=True, include_in_search_results=True).
+                    order_by('pk').values_list('pk', flat=True))
+    SearchTerm.objects.filter(post__in=posts).delete()
+
+    for start in range(0, len(post_ids), batch_size):
+        batch = list(PublicPost.objects.filter(pk__in=post_ids[start:start + batch_size]).select_related('song'))
+        names = _writer_names_by_song([post.song_id for post in batch])
+        with transaction.atomic():
+            rows = []
+            for post in batch:
+                rows.extend(
+                    (post.pk, term, weight)
+                    for term, weight in post_term_weights(post, names.get(post.song_id, [])).items()
+                )
+            _insert_terms(rows)
+    return len(post_ids)
+
+
+def _insert_terms(rows):
+    # Hundreds of terms per post: skip building a SearchTerm instance for each
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, %%s)' % (
+        quote(SearchTerm._meta.db_table),
+        quote(SearchTerm._meta.get_field('post').column), quote('term'), quote('weight')
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def search(query):
+    """
+    Visible posts matching every term in the query, best matches first.
+
+    The matching posts are found from the (term, post) index alone, by
+    counting matched terms per post, and only then looked up by ID. Only
+    visible, searchable posts have terms (see index_post()), so there's
+    nothing to filter on PublicPost: a condition on its visible column
+    would have SQLite scan every visible post and probe the matches instead.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return PublicPost.objects.none()
+
+    matches = SearchTerm.objects.filter(term__in=terms)
+    matching_post_ids = matches.values('post_id').annotate(
+        matched_terms=Count('post_id')
+    ).filter(matched_terms=len(terms)).values('post_id')
+    rank = matches.filter(post_id=OuterRef('pk')).values('post_id').annotate(rank=Sum('weight')).values('rank')
+
+    return PublicPost.objects.filter(pk__in=matching_post_ids).annotate(
+        rank=Subquery(rank, output_field=IntegerField())
+    ).select_related('song').order_by('-rank', '-published_on', '-pk')
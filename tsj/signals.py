@@ -0,0 +1,75 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from blurber.models import Song
+from writers.models import Writer
+from tsj.models import PublicPost, Comment, public_post_saved
+from tsj import archives, search
+from tsj import cache as page_cache
+
+
+def _affected_song_ids(post):
+    # A post's page and the pages linking to it as prev/next
+    return [post.song_id] + [neighbour.song_id for neighbour in post.neighbours() if neighbour]
+
+
+@receiver(public_post_saved)
+def refresh_saved_public_post(sender, post, created, affected_song_ids, **kwargs):
+    # Everything a saved post changes, with the neighbours PublicPost.save() already found
+    search.index_post(post, new=created)
+    page_cache.invalidate_single_posts(affected_song_ids)
+    page_cache.bump_version('feeds')
+    if created and post.visible:
+        archives.add_post(post.published_on)
+    else:
+        archives.refresh_archive_months()
+
+
+@receiver(post_delete, sender=PublicPost)
+def invalidate_public_post_pages(sender, instance, **kwargs):
+    page_cache.invalidate_single_posts(_affected_song_ids(instance))
+
+
+@receiver(post_delete, sender=PublicPost)
+def invalidate_feeds(sender, instance, **kwargs):
+    page_cache.bump_version('feeds')
+
+
+@receiver(post_delete, sender=PublicPost)
+def bump_posts_version(sender, instance, **kwargs):
+    # A deleted post leaves no last_modified behind to change the listings' ETags
+    page_cache.bump_version('posts')
+
+
+@receiver(post_delete, sender=PublicPost)
+def refresh_archive_months(sender, instance, **kwargs):
+    archives.refresh_archive_months()
+
+
+@receiver(post_save, sender=Song)
+def reindex_song_posts(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Artist/title/tagline are indexed with the post, so follow song edits
+    if update_fields is not None and not update_fields & {'artist', 'title', 'tagline'}:
+        return
+    if not raw and not created:
+        for post in instance.publicpost_set.filter(visible=True):
+            search.index_post(post)
+            page_cache.invalidate_single_posts(_affected_song_ids(post))
+            page_cache.bump_version('feeds')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_recent_comments(sender, instance, raw=False, **kwargs):
+    # Every page shows the recent comments, so this also invalidates the cached single posts
+    if not raw:
+        page_cache.bump_version('comments')
+
+
+@receiver(post_save, sender=Writer)
+@receiver(post_delete, sender=Writer)
+def invalidate_blogroll(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which isn't shown anywhere
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    page_cache.bump_version('blogroll')
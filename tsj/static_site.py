@@ -0,0 +1,185 @@
+"""
+Export of the public site as static HTML, to be served by a plain web server.
+
+Pages are rendered by calling the public views with a RequestFactory
+request, so they are the same as on the live site, and written as
+<path>/index.html:
+
+    /                                     home page
+    /page/<n>/                            older home pages
+    /s/<song id>/                         single posts
+    /archives/<yyyy>/<mm>/[page/<n>/]     month archives
+    /about/
+
+Pagination links, which use query strings on the live site, are rewritten
+to those paths. Search and comments still need the Django app, and pages
+fetch the CSRF token for the comment form from it.
+
+Rendering is spread over a process pool. Each run records when it started
+in the output directory, and the next run only re-renders the posts
+changed since then (and their prev/next neighbours), the home pages, and
+the archive pages for the months of the changed posts.
+"""
+import os
+import re
+import shutil
+from multiprocessing import Pool
+
+from django.core.urlresolvers import resolve, reverse
+from django.db import connections
+from django.db.models import Q
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from jukebox.settings import POSTS_PER_PAGE
+from tsj.archives import archive_months, month_range
+from tsj.models import PublicPost, Comment
+
+WATERMARK_FILE = '.last_static_export'
+
+PAGINATION_LINK_RE = re.compile(r'href="\?paged=(\d+)&amp;before=\d+"')
+# Pages that become directories, so plain web servers find their index.html
+PAGE_LINK_RE = re.compile(r'href="(/(?:s/\d+|about|archives/\d{4}/\d{2}))(#[^"]*)?"')
+# The token rendered for the export's request is no use to visitors, song.html fetches them their own
+CSRF_TOKEN_RE = re.compile(r"(name='csrfmiddlewaretoken' value=')[^']*'")
+
+
+def page_path(output, path):
+    return os.path.join(output, path.strip('/'), 'index.html')
+
+
+def static_links(html, listing_path):
+    html = PAGINATION_LINK_RE.sub(lambda m: 'href="%spage/%s/"' % (listing_path, m.group(1)), html)
+    html = CSRF_TOKEN_RE.sub(r"\1'", html)
+    return PAGE_LINK_RE.sub(lambda m: 'href="%s/%s"' % (m.group(1), m.group(2) or ''), html)
+
+
+def listing_jobs(path, url, posts):
+    """A (path, url, query, listing path) job for each page of a keyset-paginated listing."""
+    # Each page starts after the last post of the one before
+    ids = list(posts.newest_first().values_list('id', flat=True))
+    jobs = [(path, url, {}, path)]
+    for page in range(2, (len(ids) - 1) // POSTS_PER_PAGE + 2):
+        before = ids[(page - 1) * POSTS_PER_PAGE - 1]
+        jobs.append(('%spage/%s/' % (path, page), url, {'paged': page, 'before': before}, path))
+    return jobs
+
+
+def changed_song_ids(since):
+    """Songs whose post page changed since the given time, including the neighbours of changed posts."""
+    changed = PublicPost.objects.filter(
+        Q(last_modified__gte=since) | Q(song__last_modified__gte=since) |
+        Q(song_id__in=Comment.objects.filter(last_modified__gte=since).values('song_id'))
+    )
+    song_ids, neighbour_ids = set(), set()
+    for song_id, previous_id, next_id in changed.values_list('song_id', 'previous_post_id', 'next_post_id'):
+        song_ids.add(song_id)
+        neighbour_ids.update(i for i in (previous_id, next_id) if i)
+    song_ids.update(PublicPost.objects.filter(id__in=neighbour_ids).values_list('song_id', flat=True))
+    return song_ids
+
+
+def page_jobs(since=None):
+    """
+    The pages to render as (path, url, query, listing path) jobs, and the
+    post pages to remove because their song has no visible post any more.
+    """
+    visible = PublicPost.objects.filter(visible=True)
+    if since is None:
+        song_ids = set(visible.values_list('song_id', flat=True))
+        months = [(m.year, m.month) for m in archive_months()]
+        removed = set()
+    else:
+        song_ids = changed_song_ids(since)
+        removed = song_ids - set(visible.filter(song_id__in=song_ids).values_list('song_id', flat=True))
+        song_ids -= removed
+        months = set(
+            (timezone.localtime(published_on).year, timezone.localtime(published_on).month)
+            for published_on in PublicPost.objects.filter(song_id__in=song_ids | removed).
+            values_list('published_on', flat=True)
+        )
+
+    jobs = [(reverse('about') + '/', reverse('about'), {}, None)]
+    jobs.extend(listing_jobs('/', reverse('home_page'), visible))
+    for year, month in sorted(months, reverse=True):
+        url = reverse('archive_month', kwargs={'year': '%04d' % year, 'month': '%02d' % month})
+        start, end = month_range(year, month)
+        jobs.extend(listing_jobs(url + '/', url, visible.filter(published_on__gte=start, published_on__lt=end)))
+    jobs.extend(
+        (url + '/', url, {}, None)
+        for url in (reverse('single_post', kwargs={'song_id': song_id}) for song_id in sorted(song_ids))
+    )
+    removed_paths = [reverse('single_post', kwargs={'song_id': song_id}) + '/' for song_id in sorted(removed)]
+    return jobs, removed_paths
+
+
+def render_page(job, output):
+    """Render one page and write it out. Returns the path, or None if the view didn't return a page."""
+    path, url, query, listing_path = job
+    request = RequestFactory().get(url, query)
+    match = resolve(url)
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        return None
+
+    html = static_links(response.content.decode(response.charset), listing_path)
+    filename = page_path(output, path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    # Write alongside and move into place, so the web server never sees half a page
+    with open(filename + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(filename + '.tmp', filename)
+    return path
+
+
+def _render_in_worker(args):
+    return render_page(*args)
+
+
+def export_site(output, workers=1, full=False, progress=None):
+    """
+    Render the public site into the output directory. Returns (pages
+    written, pages skipped, pages removed).
+    """
+    watermark = os.path.join(output, WATERMARK_FILE)
+    since = None
+    if not full and os.path.exists(watermark):
+        with open(watermark) as f:
+            since = parse_datetime(f.read().strip())
+
+    # Anything changed while we export is picked up again next time
+    started = timezone.now()
+    jobs, removed_paths = page_jobs(since)
+    os.makedirs(output, exist_ok=True)
+
+    tasks = [(job, output) for job in jobs]
+    pool = None
+    if workers > 1:
+        # Don't share this process's database connection with the workers, they open their own
+        connections.close_all()
+        pool = Pool(workers)
+        results = pool.imap_unordered(_render_in_worker, tasks, chunksize=20)
+    else:
+        results = map(_render_in_worker, tasks)
+
+    written = skipped = 0
+    try:
+        for path in results:
+            if path is None:
+                skipped += 1
+                continue
+            written += 1
+            if progress and written % 1000 == 0:
+                progress(written)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for path in removed_paths:
+        shutil.rmtree(os.path.dirname(page_path(output, path)), ignore_errors=True)
+
+    with open(watermark, 'w') as f:
+        f.write(started.isoformat())
+    return written, skipped, len(removed_paths)
@@ -0,0 +1,27 @@
+from django import template
+
+from tsj import archives
+from tsj import cache as page_cache
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(name):
+    """
+    Current version of a shared part of the public pages, for use in
+    {% cache %} fragment keys: {% cache_version "blogroll" as version %}
+    """
+    return page_cache.get_version(name)
+
+
+@register.simple_tag
+def public_cache_alias():
+    # So {% cache ... using=alias %} fragments live alongside their versions
+    return page_cache.public_cache_alias()
+
+
+@register.simple_tag
+def archive_months():
+    # A tag rather than a context variable, so it's only read when the sidebar fragment is re-rendered
+    return archives.archive_months()
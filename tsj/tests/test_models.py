@@ -1,6 +1,15 @@
 from datetime import datetime, timezone
+import tempfile
+from io import BytesIO, StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
-from tsj.models import PublicPost, Song
+from blurber.models import Review
+from tsj.archives import month_range, month_rollup
+from tsj.models import Comment, ImportedPost, PublicPost, SearchTerm, Song, public_post_saved
+from tsj.search import rebuild_index, search
+from tsj.wordpress import import_wxr, parse_reviews, set_dates, split_title
+from writers.models import Writer
 
 
 class PublicPostTest(TestCase):
@@ -22,3 +31,276 @@ class PublicPostTest(TestCase):
 
         assert str(results[0]) == "Kate Bush - Washing Machine"
         assert results[0].html_content == "<h2>Title</h2><p>Body</p>"
+
+
+class SearchIndexTest(TestCase):
+
+    def setUp(self):
+        self.song = Song.objects.create(artist='Kate Bush', title='Washing Machine', tagline='Spin cycle')
+        self.pp = PublicPost.objects.create(
+            html_content="<h2 class='heading'>Title</h2><p>Sudsy &amp; clean</p>",
+            song=self.song,
+            published_on=datetime.now(timezone.utc)
+        )
+
+    def test_post_is_indexed_on_publish(self):
+        self.assertEqual(list(search('sudsy clean')), [self.pp])
+        self.assertEqual(list(search('spin')), [self.pp])
+        self.assertEqual(list(search('heading')), [])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(list(search('kate bush')), [self.pp])
+        self.assertEqual(list(search('kate moss')), [])
+
+    def test_editing_post_updates_index(self):
+        self.pp.html_content = "<p>Rinse and repeat</p>"
+        self.pp.save()
+
+        self.assertEqual(list(search('sudsy')), [])
+        self.assertEqual(list(search('rinse')), [self.pp])
+
+    def test_hidden_post_is_removed_from_index(self):
+        self.pp.visible = False
+        self.pp.save()
+
+        self.assertEqual(list(search('washing')), [])
+
+    def test_rebuild_index_restores_terms(self):
+        SearchTerm.objects.all().delete()
+
+        self.assertEqual(rebuild_index(), 1)
+        self.assertEqual(list(search('machine')), [self.pp])
+
+
+class PublicPostLinkTest(TestCase):
+
+    def publish(self, title, day, song=None):
+        song = song or Song.objects.create(artist='Artist', title=title, status='published')
+        return PublicPost.objects.create(
+            song=song, html_content=title, published_on=datetime(2018, 1, day, tzinfo=timezone.utc)
+        )
+
+    def assert_chain(self, *posts):
+        posts = [PublicPost.objects.get(id=pp.id) for pp in posts]
+        for i, pp in enumerate(posts):
+            self.assertEqual(pp.previous_post, posts[i - 1] if i > 0 else None)
+            self.assertEqual(pp.next_post, posts[i + 1] if i + 1 < len(posts) else None)
+            self.assertEqual(pp.position, i + 1)
+
+    def test_publishing_links_neighbours(self):
+        first = self.publish('First', 1)
+        third = self.publish('Third', 3)
+        second = self.publish('Second', 2)
+
+        self.assert_chain(first, second, third)
+
+    def test_hiding_post_joins_its_neighbours(self):
+        first, second, third = self.publish('First', 1), self.publish('Second', 2), self.publish('Third', 3)
+        second.visible = False
+        second.save()
+
+        self.assert_chain(first, third)
+        second.refresh_from_db()
+        self.assertIsNone(second.previous_post)
+        self.assertIsNone(second.next_post)
+        self.assertIsNone(second.position)
+
+    def test_deleting_post_joins_its_neighbours(self):
+        first, second, third = self.publish('First', 1), self.publish('Second', 2), self.publish('Third', 3)
+        second.delete()
+
+        self.assert_chain(first, third)
+
+    def test_republishing_hides_previous_version(self):
+        first, second = self.publish('First', 1), self.publish('Second', 2)
+        republished = self.publish('Second again', 3, song=second.song)
+
+        second.refresh_from_db()
+        self.assertFalse(second.visible)
+        self.assert_chain(first, republished)
+
+    def test_moving_post_joins_old_neighbours(self):
+        first, second, third, fourth = [self.publish(title, day) for day, title in enumerate(
+            ['First', 'Second', 'Third', 'Fourth'], 1
+        )]
+        affected = []
+
+        def record(sender, affected_song_ids, **kwargs):
+            affected.append(set(affected_song_ids))
+        public_post_saved.connect(record)
+        self.addCleanup(public_post_saved.disconnect, record)
+
+        second.published_on = datetime(2018, 1, 5, tzinfo=timezone.utc)
+        second.save()
+
+        self.assert_chain(first, third, fourth, second)
+        self.assertEqual(PublicPost.objects.relink(), 0)
+        # The pages of its old and new neighbours link to it
+        self.assertEqual(affected, [{pp.song_id for pp in (first, second, third, fourth)}])
+
+    def test_relink_repairs_stale_links(self):
+        first, second, third = self.publish('First', 1), self.publish('Second', 2), self.publish('Third', 3)
+        PublicPost.objects.filter(id=second.id).update(visible=False)
+
+        self.assertEqual(PublicPost.objects.relink(), 3)
+        self.assert_chain(first, third)
+
+    def test_relink_renumbers_posts(self):
+        first, second, third = self.publish('First', 1), self.publish('Second', 2), self.publish('Third', 3)
+        PublicPost.objects.update(position=None)
+
+        self.assertEqual(PublicPost.objects.relink(), 3)
+        self.assert_chain(first, second, third)
+
+
+WXR = """<?xml version="1.0" encoding="UTF-8" ?>
+<rss version="2.0" xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
+     xmlns:content="http://purl.org/rss/1.0/modules/content/"
+     xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:wp="http://wordpress.org/export/1.2/">
+<channel><title>The Singles Jukebox</title>
+<item><title>Kate Bush &#8211; Running Up That Hill</title>
+<pubDate>Mon, 05 Aug 1985 10:00:00 +0000</pubDate>
+<content:encoded><![CDATA[<img src="http://example.com/hill.jpg" />
+
+<strong><a href="http://example.com/anna">Anna Smith</a>:</strong> A deal with God.
+[9]
+
+<strong>Jo Bloggs:</strong> Too long.
+[4]
+
+<a href="http://youtube.com/hill">Video</a>]]></content:encoded>
+<excerpt:encoded><![CDATA[Swapping places]]></excerpt:encoded>
+<wp:post_id>1234</wp:post_id><wp:post_date_gmt>1985-08-05 10:00:00</wp:post_date_gmt>
+<wp:status>publish</wp:status><wp:post_type>post</wp:post_type>
+<wp:comment><wp:comment_author>Fan</wp:comment_author><wp:comment_author_email>fan@example.com</wp:comment_author_email>
+<wp:comment_content>Classic.</wp:comment_content><wp:comment_date_gmt>1985-08-06 09:00:00</wp:comment_date_gmt>
+<wp:comment_approved>1</wp:comment_approved><wp:comment_type></wp:comment_type></wp:comment>
+<wp:comment><wp:comment_author>Spammer</wp:comment_author><wp:comment_content>Buy now</wp:comment_content>
+<wp:comment_approved>spam</wp:comment_approved></wp:comment>
+</item>
+<item><title>Draft post</title><content:encoded><![CDATA[<strong>Jo Bloggs:</strong> Unfinished [5]]]></content:encoded>
+<wp:post_id>1235</wp:post_id><wp:status>draft</wp:status><wp:post_type>post</wp:post_type></item>
+<item><title>About</title><content:encoded><![CDATA[About us]]></content:encoded>
+<wp:post_id>2</wp:post_id><wp:status>publish</wp:status><wp:post_type>page</wp:post_type></item>
+</channel></rss>
+"""
+
+
+class WordPressImportTest(TestCase):
+
+    def import_wxr(self):
+        return import_wxr(BytesIO(WXR.encode('utf-8')))
+
+    def test_split_title(self):
+        self.assertEqual(split_title('Kate Bush &#8211; Hounds of Love'), ('Kate Bush', 'Hounds of Love'))
+        self.assertEqual(split_title('A-ha - Take On Me'), ('A-ha', 'Take On Me'))
+        self.assertEqual(split_title('Untitled'), ('', 'Untitled'))
+
+    def test_parse_reviews(self):
+        reviews = parse_reviews(
+            '<p><strong><a href="http://example.com/anna">Anna Smith</a>:</strong> Great.<br />\n[9]</p>'
+            '<p><strong>Jo Bloggs:</strong> Not for me. [2]</p><p>No score here.</p>'
+        )
+        self.assertEqual(reviews, [
+            ('Anna Smith', 'http://example.com/anna', 'Great.', 9),
+            ('Jo Bloggs', None, 'Not for me.', 2),
+        ])
+
+    def test_imports_published_posts_only(self):
+        self.assertEqual(self.import_wxr(), (1, 1, []))
+
+        song = Song.objects.get()
+        self.assertEqual(song.id, 1234)
+        self.assertEqual((song.artist, song.title), ('Kate Bush', 'Running Up That Hill'))
+        self.assertEqual(song.tagline, 'Swapping places')
+        self.assertEqual(song.image_url, 'http://example.com/hill.jpg')
+        self.assertEqual(song.youtube_link, 'http://youtube.com/hill')
+        self.assertEqual(song.status, 'published')
+        published = datetime(1985, 8, 5, 10, tzinfo=timezone.utc)
+        self.assertEqual((song.publish_date, song.upload_date), (published, published))
+        self.assertEqual(PublicPost.objects.get().published_on, published)
+
+    def test_imports_reviews_and_score_stats(self):
+        self.import_wxr()
+
+        reviews = Review.objects.order_by('sort_order')
+        self.assertEqual(
+            [(r.writer.first_name, r.writer.last_name, r.blurb, r.score, r.status) for r in reviews],
+            [('Anna', 'Smith', 'A deal with God.', 9, 'published'), ('Jo', 'Bloggs', 'Too long.', 4, 'published')]
+        )
+        self.assertEqual(reviews[0].create_date, datetime(1985, 8, 5, 10, tzinfo=timezone.utc))
+        song = Song.objects.get()
+        self.assertEqual((song.saved_blurb_count, song.score_total), song.live_score_stats()[:2])
+        self.assertEqual(song.score_deviation_total, song.live_score_stats()[2])
+
+    def test_creates_missing_writers_inactive(self):
+        existing = Writer.objects.create_user('jo', password='pw', first_name='Jo', last_name='Bloggs')
+        self.import_wxr()
+
+        self.assertEqual(Review.objects.get(score=4).writer, existing)
+        anna = Writer.objects.get(first_name='Anna')
+        self.assertEqual(anna.bio_link, 'http://example.com/anna')
+        self.assertFalse(anna.is_active)
+        self.assertFalse(anna.has_usable_password())
+
+    def test_imports_approved_comments(self):
+        self.import_wxr()
+
+        comment = Comment.objects.get()
+        self.assertEqual((comment.name, comment.comment_text), ('Fan', 'Classic.'))
+        self.assertEqual(comment.published_on, datetime(1985, 8, 6, 9, tzinfo=timezone.utc))
+
+    def test_imported_posts_are_searchable(self):
+        self.import_wxr()
+
+        self.assertEqual([pp.song_id for pp in search('deal god')], [1234])
+
+    def test_rerun_skips_imported_posts(self):
+        self.import_wxr()
+
+        self.assertEqual(self.import_wxr(), (1, 0, []))
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(Review.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(ImportedPost.objects.get().song_id, 1234)
+
+    def test_reports_posts_clashing_with_blurber_songs(self):
+        Song.objects.create(id=1234, artist='Blurber', title='Native song')
+
+        self.assertEqual(self.import_wxr(), (1, 0, [1234]))
+        self.assertEqual(Song.objects.get().artist, 'Blurber')
+        self.assertFalse(ImportedPost.objects.exists())
+
+        with self.assertRaisesRegex(CommandError, "already have their IDs: 1234"):
+            with tempfile.NamedTemporaryFile(suffix='.xml') as f:
+                f.write(WXR.encode('utf-8'))
+                f.flush()
+                call_command('import_wordpress', f.name, stdout=StringIO())
+
+    def test_set_dates_in_batches(self):
+        song = Song.objects.create(artist='Kate Bush', title='Cloudbusting')
+        comments = [Comment.objects.create(song=song, name=str(i), mail='-', comment_text='-') for i in range(3)]
+        dates = {comment.id: datetime(2000, 1, 1 + i, tzinfo=timezone.utc) for i, comment in enumerate(comments)}
+
+        set_dates(Comment, 'published_on', dates, batch_size=2)
+        self.assertEqual(dict(Comment.objects.values_list('id', 'published_on')), dates)
+
+
+class ArchiveMonthsTest(TestCase):
+
+    def publish(self, when):
+        song = Song.objects.create(artist='Artist', title=str(when), status='published')
+        return PublicPost.objects.create(song=song, html_content='Post', published_on=when)
+
+    def test_rollup_counts_visible_posts_by_month(self):
+        self.publish(datetime(2018, 3, 31, 23, tzinfo=timezone.utc))
+        self.publish(datetime(2018, 3, 1, tzinfo=timezone.utc))
+        self.publish(datetime(2018, 4, 1, tzinfo=timezone.utc))
+        hidden = self.publish(datetime(2017, 12, 1, tzinfo=timezone.utc))
+        hidden.visible = False
+        hidden.save()
+
+        self.assertEqual(month_rollup(), [(2018, 4, 1), (2018, 3, 2)])
+        self.assertEqual(month_range(2018, 12), (
+            datetime(2018, 12, 1, tzinfo=timezone.utc), datetime(2019, 1, 1, tzinfo=timezone.utc)
+        ))
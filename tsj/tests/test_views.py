@@ -1,8 +1,22 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.test import Client
 
 from writers.models import Writer
+from blurber.models import Song, Review
 from blurber.tests.test_models import SongTestBase
+from tsj.models import PublicPost, Comment
+from tsj import cache as page_cache
 from tsj.views import get_writers
+from tsj.static_site import export_site
 
 
 class HomePageTests(SongTestBase):
@@ -90,3 +104,541 @@ class HomePageTests(SongTestBase):
         self.assertEqual(resp.status_code, 200)
         self.assertTemplateUsed(resp, 'search_results.html')
         self.assertContains(resp, "Not Found")
+
+    def test_search_matches_words_not_html(self):
+        resp = self.client.get(reverse('home_page') + '?s=strong')
+
+        self.assertContains(resp, "Not Found")
+
+    def test_search_results_are_ranked_and_paginated(self):
+        for i in range(25):
+            song = Song.objects.create(artist='Band %s' % i, title='Filler', status='published')
+            PublicPost.objects.create(
+                song=song, html_content="<p>Mentions Monica in passing</p>",
+                published_on=datetime(2018, 1, 1, tzinfo=timezone.utc)
+            )
+
+        resp = self.client.get(reverse('home_page') + '?s=monica')
+        # Artist matches outrank body text matches
+        self.assertEqual(resp.context['results'][0], self.public_post)
+        self.assertEqual(len(resp.context['results']), 20)
+        self.assertContains(resp, "?s=monica&amp;paged=2")
+
+        resp = self.client.get(reverse('home_page') + '?s=monica&paged=2')
+        self.assertEqual(len(resp.context['results']), 6)
+
+    def test_search_finds_posts_by_writer_name(self):
+        Review.objects.create(
+            song=self.published_song, writer=self.writer, blurb='Yes', score=7, status='published'
+        )
+        self.public_post.save()
+
+        resp = self.client.get(reverse('home_page') + '?s=michelle+williams')
+        self.assertEqual(list(resp.context['results']), [self.public_post])
+
+
+class HomePagePaginationTests(SongTestBase):
+
+    def setUp(self):
+        super(HomePagePaginationTests, self).setUp()
+        # 12 posts, two of them published at the same moment
+        self.posts = [self.public_post]
+        for i in range(11):
+            song = Song.objects.create(artist='Band %s' % i, title='Song %s' % i, status='published')
+            self.posts.append(PublicPost.objects.create(
+                song=song, html_content='Post %s' % i,
+                published_on=datetime(2019, 1, 1 + min(i, 9), tzinfo=timezone.utc)
+            ))
+        self.posts.sort(key=lambda pp: (pp.published_on, pp.id), reverse=True)
+
+    def test_legacy_page_numbers_are_translated(self):
+        resp = self.client.get(reverse('home_page') + '?paged=2')
+
+        self.assertEqual(list(resp.context['recent_songs']), self.posts[5:10])
+        self.assertEqual(resp.context['next_cursor'], self.posts[9].id)
+
+    def test_before_cursor_continues_after_that_post(self):
+        resp = self.client.get(reverse('home_page'))
+        self.assertContains(resp, '?paged=2&amp;before={}'.format(self.posts[4].id))
+
+        resp = self.client.get(reverse('home_page') + '?paged=2&before={}'.format(self.posts[4].id))
+        self.assertEqual(list(resp.context['recent_songs']), self.posts[5:10])
+        self.assertEqual(resp.context['page_no'], 2)
+
+        resp = self.client.get(reverse('home_page') + '?paged=3&before={}'.format(self.posts[9].id))
+        self.assertEqual(list(resp.context['recent_songs']), self.posts[10:])
+        self.assertIsNone(resp.context['next_cursor'])
+
+    def test_page_past_the_end_is_empty(self):
+        resp = self.client.get(reverse('home_page') + '?paged=40')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context['recent_songs']), [])
+
+    def test_cursor_pages_only_add_a_primary_key_lookup(self):
+        # Warm up the cached sidebar fragments
+        self.client.get(reverse('home_page'))
+
+        # The Last-Modified lookup and the posts
+        with self.assertNumQueries(2):
+            self.client.get(reverse('home_page'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('home_page') + '?paged=3&before={}'.format(self.posts[9].id))
+
+    def test_legacy_page_numbers_are_found_by_position(self):
+        self.client.get(reverse('home_page'))
+
+        # The newest position and the post numbered where the page starts
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('home_page') + '?paged=3')
+        self.assertEqual(list(resp.context['recent_songs']), self.posts[10:])
+
+    def test_legacy_page_numbers_follow_hidden_posts(self):
+        self.posts[2].visible = False
+        self.posts[2].save()
+
+        resp = self.client.get(reverse('home_page') + '?paged=2')
+        self.assertEqual(list(resp.context['recent_songs']), self.posts[6:11])
+
+
+class SinglePostCacheTests(SongTestBase):
+
+    def setUp(self):
+        super(SinglePostCacheTests, self).setUp()
+        page_cache.public_cache().clear()
+        self.url = reverse('single_post', kwargs={'song_id': self.published_song.id})
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertContains(resp, "The Boy Is Mine")
+        self.assertNotContains(resp, page_cache.CSRF_PLACEHOLDER)
+        self.assertContains(resp, "csrfmiddlewaretoken")
+        self.assertEqual(page_cache.page_stats('single_post'), {'hits': 1, 'misses': 1})
+
+    def test_cached_page_accepts_comments(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.get(self.url)
+        resp = self.client.get(self.url)
+        token = re.search(r"name='csrfmiddlewaretoken' value='([^']+)'", resp.content.decode()).group(1)
+
+        resp = self.client.post(
+            reverse('post_comment', kwargs={'song_id': self.published_song.id}),
+            {'name': 'Brandy', 'mail': 'b@example.com', 'comment_text': 'It is mine', 'csrfmiddlewaretoken': token}
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.assertContains(self.client.get(self.url), "It is mine")
+
+    def test_editing_post_invalidates_cache(self):
+        self.client.get(self.url)
+        self.public_post.html_content = "Emergency edit"
+        self.public_post.save()
+
+        self.assertContains(self.client.get(self.url), "Emergency edit")
+
+    def test_publishing_next_post_invalidates_cache(self):
+        self.client.get(self.url)
+        song = Song.objects.create(artist='Monica', title='The First Night', status='published')
+        PublicPost.objects.create(song=song, html_content="Later", published_on=datetime(2019, 1, 1, tzinfo=timezone.utc))
+
+        self.assertContains(self.client.get(self.url), "Monica - The First Night")
+
+    def test_hiding_comment_invalidates_cache(self):
+        comment = Comment.objects.create(song=self.published_song, name='Troll', mail='t@example.com', comment_text='Total snoozefest')
+        self.assertContains(self.client.get(self.url), "Total snoozefest")
+
+        comment.visible = False
+        comment.save()
+        self.assertNotContains(self.client.get(self.url), "Total snoozefest")
+
+    def test_blogroll_change_invalidates_cache(self):
+        self.client.get(self.url)
+        Writer.objects.create(username='kelly', first_name='Kelly', last_name='Rowland', email='k@example.com')
+
+        self.assertContains(self.client.get(self.url), "Rowland, K.")
+
+    def test_cache_stats_command(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        out = StringIO()
+        call_command('public_cache_stats', reset=True, stdout=out)
+
+        self.assertIn("single_post: 1 hits, 1 misses (50.0% hit rate)", out.getvalue())
+        self.assertEqual(page_cache.page_stats('single_post'), {'hits': 0, 'misses': 0})
+
+    def test_per_process_cache_fails_system_check(self):
+        self.assertEqual(page_cache.check_public_cache(None), [])
+
+        local_memory = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with self.settings(CACHES={'default': local_memory, 'public_pages': local_memory}):
+            self.assertEqual([error.id for error in page_cache.check_public_cache(None)], ['tsj.E001'])
+
+
+class SidebarCacheTests(SongTestBase):
+
+    def test_sidebar_fragments_are_cached(self):
+        self.client.get(reverse('home_page'))
+
+        # Only the Last-Modified lookup and the posts themselves
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('home_page'))
+        self.assertContains(resp, "Williams, M.")
+
+    def test_writer_change_updates_blogroll(self):
+        self.client.get(reverse('home_page'))
+        self.writer.last_name = 'Kelly'
+        self.writer.save()
+
+        resp = self.client.get(reverse('home_page'))
+        self.assertContains(resp, "Kelly, M.")
+        self.assertNotContains(resp, "Williams, M.")
+
+    def test_logging_in_does_not_invalidate_blogroll(self):
+        self.writer.set_password('pass')
+        self.writer.save()
+        version = page_cache.get_version('blogroll')
+        self.client.login(username=self.writer.username, password='pass')
+
+        self.assertEqual(page_cache.get_version('blogroll'), version)
+
+    def test_new_comment_shows_in_recent_comments(self):
+        self.client.get(reverse('home_page'))
+        Comment.objects.create(song=self.published_song, name='Monica', mail='m@example.com',
+                               comment_text='The boy is mine')
+
+        resp = self.client.get(reverse('home_page'))
+        self.assertContains(resp, "<b>Monica</b>")
+        self.assertContains(resp, reverse('single_post', kwargs={'song_id': self.published_song.id}) + '#comments')
+
+
+class ArchiveTests(SongTestBase):
+
+    def setUp(self):
+        super(ArchiveTests, self).setUp()
+        page_cache.public_cache().clear()
+        # The December 2018 post from SongTestBase, and 7 in January 2019
+        self.january = []
+        for i in range(7):
+            song = Song.objects.create(artist='Band %s' % i, title='Song %s' % i, status='published')
+            self.january.append(PublicPost.objects.create(
+                song=song, html_content='Post %s' % i, published_on=datetime(2019, 1, 1 + i, tzinfo=timezone.utc)
+            ))
+        self.january.reverse()
+        self.url = reverse('archive_month', kwargs={'year': '2019', 'month': '01'})
+
+    def test_sidebar_lists_months_with_posts(self):
+        resp = self.client.get(reverse('home_page'))
+
+        self.assertContains(resp, '<a href="%s">Jan</a>' % self.url)
+        self.assertContains(resp, '<a href="%s">Dec</a>' % reverse('archive_month', kwargs={'year': '2018', 'month': '12'}))
+        self.assertNotContains(resp, "thesinglesjukebox.com/?m=")
+
+    def test_month_page_is_keyset_paginated(self):
+        resp = self.client.get(self.url)
+        self.assertContains(resp, "Archive for January 2019 (7 posts)")
+        self.assertEqual(list(resp.context['recent_songs']), self.january[:5])
+        self.assertContains(resp, '?paged=2&amp;before={}'.format(self.january[4].id))
+
+        resp = self.client.get(self.url + '?paged=2&before={}'.format(self.january[4].id))
+        self.assertEqual(list(resp.context['recent_songs']), self.january[5:])
+        self.assertIsNone(resp.context['next_cursor'])
+
+    def test_month_without_posts_404s(self):
+        resp = self.client.get(reverse('archive_month', kwargs={'year': '2019', 'month': '02'}))
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_legacy_month_link_redirects(self):
+        resp = self.client.get(reverse('home_page') + '?m=201901')
+
+        self.assertRedirects(resp, self.url)
+
+    def test_publishing_in_a_new_month_updates_sidebar(self):
+        self.client.get(reverse('home_page'))
+        song = Song.objects.create(artist='Monica', title='Angel Of Mine', status='published')
+        pp = PublicPost.objects.create(song=song, html_content='Angel',
+                                       published_on=datetime(2019, 3, 1, tzinfo=timezone.utc))
+
+        march = reverse('archive_month', kwargs={'year': '2019', 'month': '03'})
+        self.assertContains(self.client.get(reverse('home_page')), '<a href="%s">Mar</a>' % march)
+        self.assertEqual(list(self.client.get(march).context['recent_songs']), [pp])
+
+    def test_publishing_in_a_listed_month_keeps_cached_pages(self):
+        self.client.get(reverse('home_page'))
+        version = page_cache.get_version('archives')
+        song = Song.objects.create(artist='Monica', title='Angel Of Mine', status='published')
+        PublicPost.objects.create(song=song, html_content='Angel', published_on=datetime(2019, 1, 20, tzinfo=timezone.utc))
+
+        self.assertEqual(page_cache.get_version('archives'), version)
+        self.assertContains(self.client.get(self.url), "(8 posts)")
+
+    def test_hiding_the_last_post_of_a_month_removes_it(self):
+        self.public_post.visible = False
+        self.public_post.save()
+
+        december = reverse('archive_month', kwargs={'year': '2018', 'month': '12'})
+        self.assertNotContains(self.client.get(reverse('home_page')), december)
+        self.assertEqual(self.client.get(december).status_code, 404)
+
+    def test_cached_sidebar_adds_no_queries(self):
+        self.client.get(self.url)
+
+        # Only the Last-Modified lookup and the month's posts
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+
+class ConditionalGetTests(SongTestBase):
+
+    def setUp(self):
+        super(ConditionalGetTests, self).setUp()
+        page_cache.public_cache().clear()
+        self.url = reverse('single_post', kwargs={'song_id': self.published_song.id})
+
+    def revalidate(self, url, resp):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+
+    def test_single_post_revalidates_from_page_cache(self):
+        resp = self.client.get(self.url)
+        self.assertTrue(resp.has_header('ETag'))
+        self.assertTrue(resp.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(self.url, resp).status_code, 304)
+
+    def test_single_post_304_skips_rendering(self):
+        resp = self.client.get(self.url)
+        page_cache.invalidate_single_posts([self.published_song.id])
+
+        with self.assertTemplateNotUsed('single_post.html'):
+            not_modified = self.revalidate(self.url, resp)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], resp['ETag'])
+
+    def test_single_post_if_modified_since(self):
+        resp = self.client.get(self.url)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2018 00:00:00 GMT').status_code, 200
+        )
+
+    def test_single_post_changes_with_post_and_comments(self):
+        resp = self.client.get(self.url)
+        self.public_post.html_content = "Emergency edit"
+        self.public_post.save()
+        self.assertEqual(self.revalidate(self.url, resp).status_code, 200)
+
+        resp = self.client.get(self.url)
+        comment = Comment.objects.create(song=self.published_song, name='Troll', mail='t@example.com',
+                                         comment_text='Total snoozefest')
+        self.assertEqual(self.revalidate(self.url, resp).status_code, 200)
+
+        resp = self.client.get(self.url)
+        comment.visible = False
+        comment.save()
+        self.assertEqual(self.revalidate(self.url, resp).status_code, 200)
+
+    def test_blogroll_change_changes_every_page(self):
+        resp = self.client.get(self.url)
+        home = self.client.get(reverse('home_page'))
+        Writer.objects.create(username='kelly', first_name='Kelly', last_name='Rowland', email='k@example.com')
+
+        self.assertEqual(self.revalidate(self.url, resp).status_code, 200)
+        self.assertEqual(self.revalidate(reverse('home_page'), home).status_code, 200)
+
+    def test_blogroll_change_moves_last_modified(self):
+        resp = self.client.get(self.url)
+        home = self.client.get(reverse('home_page'))
+        # Versions are times in milliseconds: bump this one a minute on
+        with patch('tsj.cache._initial_version', return_value=int(time.time() * 1000) + 60000):
+            Writer.objects.create(username='kelly', first_name='Kelly', last_name='Rowland', email='k@example.com')
+
+        for url, page in ((self.url, resp), (reverse('home_page'), home)):
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=page['Last-Modified']).status_code, 200)
+
+    def test_home_page_revalidates_with_one_query(self):
+        resp = self.client.get(reverse('home_page'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(reverse('home_page'), resp).status_code, 304)
+
+    def test_home_page_changes_when_posts_change(self):
+        resp = self.client.get(reverse('home_page'))
+        song = Song.objects.create(artist='Monica', title='The First Night', status='published')
+        newest = PublicPost.objects.create(song=song, html_content="Later",
+                                           published_on=datetime(2019, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.revalidate(reverse('home_page'), resp).status_code, 200)
+
+        # Deleting an older post leaves the newest last_modified as it was
+        resp = self.client.get(reverse('home_page'))
+        self.public_post.delete()
+        self.assertEqual(PublicPost.objects.get(), newest)
+        self.assertEqual(self.revalidate(reverse('home_page'), resp).status_code, 200)
+
+    def test_search_results_revalidate(self):
+        url = reverse('home_page') + '?s=boy'
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidate(url, resp).status_code, 304)
+
+        self.published_song.tagline = 'A new tagline'
+        self.published_song.save()
+        self.assertEqual(self.revalidate(url, resp).status_code, 200)
+
+
+class FeedTests(SongTestBase):
+
+    def setUp(self):
+        super(FeedTests, self).setUp()
+        page_cache.public_cache().clear()
+
+    def test_feed_lists_latest_posts(self):
+        resp = self.client.get(reverse('feed'))
+
+        self.assertEqual(resp['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertContains(resp, "<title>Brandy &amp; Monica - The Boy Is Mine</title>")
+        self.assertContains(resp, "some more content")
+        self.assertContains(resp, "http://testserver" + reverse('single_post', kwargs={'song_id': self.published_song.id}))
+
+    def test_atom_feed(self):
+        resp = self.client.get(reverse('atom_feed'))
+
+        self.assertEqual(resp['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertContains(resp, "<title>Brandy &amp; Monica - The Boy Is Mine</title>")
+
+    def test_cached_feed_does_not_touch_the_database(self):
+        first = self.client.get(reverse('feed'))
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(reverse('feed'))
+            not_modified = self.client.get(reverse('feed'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse('feed'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304
+        )
+
+    def test_publishing_updates_feed(self):
+        first = self.client.get(reverse('feed'))
+        song = Song.objects.create(artist='Monica', title='The First Night', status='published')
+        PublicPost.objects.create(song=song, html_content="Later", published_on=datetime(2019, 1, 1, tzinfo=timezone.utc))
+
+        resp = self.client.get(reverse('feed'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Monica - The First Night")
+
+    def test_editing_song_updates_feed(self):
+        self.client.get(reverse('feed'))
+        self.published_song.title = 'The Girl Is Mine'
+        self.published_song.save()
+
+        self.assertContains(self.client.get(reverse('feed')), "Brandy &amp; Monica - The Girl Is Mine")
+
+    def test_writer_feed_lists_posts_with_their_published_blurbs(self):
+        Review.objects.create(song=self.published_song, writer=self.writer, status='published', score=8, blurb='Mine')
+        other = Song.objects.create(artist='Monica', title='The First Night', status='published')
+        PublicPost.objects.create(song=other, html_content="Later", published_on=datetime(2019, 1, 1, tzinfo=timezone.utc))
+
+        resp = self.client.get(reverse('writer_feed', kwargs={'writer_id': self.writer.id}))
+        self.assertContains(resp, "<title>The Singles Jukebox: Michelle Williams</title>")
+        self.assertContains(resp, "The Boy Is Mine")
+        self.assertNotContains(resp, "The First Night")
+
+        resp = self.client.get(reverse('writer_atom_feed', kwargs={'writer_id': self.writer.id}))
+        self.assertContains(resp, "The Boy Is Mine")
+
+    def test_writer_feed_404s_for_unknown_writer(self):
+        resp = self.client.get(reverse('writer_feed', kwargs={'writer_id': self.writer.id + 100}))
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_legacy_feed_link_redirects(self):
+        self.assertRedirects(self.client.get(reverse('home_page') + '?feed=rss2'), reverse('feed'), status_code=301)
+
+
+class StaticSiteExportTests(SongTestBase):
+
+    def setUp(self):
+        super(StaticSiteExportTests, self).setUp()
+        page_cache.public_cache().clear()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        self.posts = [self.public_post]
+        for i in range(6):
+            song = Song.objects.create(artist='Band %s' % i, title='Song %s' % i, status='published')
+            self.posts.append(PublicPost.objects.create(
+                song=song, html_content='Post %s' % i, published_on=datetime(2019, 1, 1 + i, tzinfo=timezone.utc)
+            ))
+
+    def read(self, path):
+        with open(os.path.join(self.output, path, 'index.html'), encoding='utf-8') as f:
+            return f.read()
+
+    def test_exports_posts_listings_and_about(self):
+        self.assertEqual(export_site(self.output), (13, 0, 0))
+
+        self.assertIn("The Boy Is Mine, some more content", self.read('s/%s' % self.published_song.id))
+        home = self.read('')
+        self.assertIn('Post 5', home)
+        self.assertIn('href="/page/2/"', home)
+        self.assertIn('href="/s/%s/#respond"' % self.posts[-1].song_id, home)
+        self.assertIn('href="/archives/2019/01/"', home)
+        self.assertIn('Post 0', self.read('page/2'))
+        self.assertIn('href="/archives/2019/01/page/2/"', self.read('archives/2019/01'))
+        self.assertIn('Post 0', self.read('archives/2019/01/page/2'))
+        self.assertIn('some more content', self.read('archives/2018/12'))
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'about', 'index.html')))
+
+    def test_incremental_export_only_renders_changed_posts(self):
+        export_site(self.output)
+        self.posts[3].html_content = 'Edited'
+        self.posts[3].save()
+
+        # The edited post and its two neighbours, plus about, home and the January pages
+        self.assertEqual(export_site(self.output), (8, 0, 0))
+        self.assertIn('Edited', self.read('s/%s' % self.posts[3].song_id))
+
+    def test_incremental_export_removes_hidden_posts(self):
+        export_site(self.output)
+        self.posts[3].visible = False
+        self.posts[3].save()
+
+        written, skipped, removed = export_site(self.output)
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.output, 's', str(self.posts[3].song_id))))
+        # Its neighbours now link to each other
+        self.assertIn('href="/s/%s/"' % self.posts[4].song_id, self.read('s/%s' % self.posts[2].song_id))
+        for neighbour in (self.posts[2], self.posts[4]):
+            self.assertNotIn('href="/s/%s/"' % self.posts[3].song_id, self.read('s/%s' % neighbour.song_id))
+
+    def test_static_page_accepts_comments(self):
+        export_site(self.output)
+        page = self.read('s/%s' % self.published_song.id)
+        form = re.search(r'<form action="([^"]+)" method="post" id="commentform" data-token-url="([^"]+)">', page)
+        action, token_url = form.groups()
+        self.assertIn("name='csrfmiddlewaretoken' value=''", page)
+        # A browser on the static site has no CSRF cookie until it fetches a token
+        client = Client(enforce_csrf_checks=True)
+        comment = {'name': 'Brandy', 'mail': 'b@example.com', 'comment_text': 'Static', 'url': ''}
+        self.assertEqual(client.post(action, comment).status_code, 403)
+
+        comment['csrfmiddlewaretoken'] = client.get(token_url).json()['token']
+        resp = client.post(action, comment)
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(Comment.objects.filter(comment_text='Static').exists())
+
+        client.post(action, dict(comment, comment_text='Buy', url='http://spam'))
+        self.assertFalse(Comment.objects.filter(comment_text='Buy').exists())
+
+    def test_full_export_ignores_watermark(self):
+        export_site(self.output)
+
+        self.assertEqual(export_site(self.output, full=True)[0], 13)
+
+    def test_export_command_reports_pages_per_second(self):
+        out = StringIO()
+        call_command('export_static_site', self.output, workers=1, stdout=out)
+
+        self.assertRegex(out.getvalue(), r"Rendered 13 pages in [\d.]+s \(\d+ pages/s\)")
@@ -1,12 +1,19 @@
 from django.conf.urls import url
 
 from tsj.views import (
-    home, single_post, about, post_comment
+    home, single_post, about, post_comment, comment_token, archive_month
 )
+from tsj.feeds import latest_posts_rss, latest_posts_atom, writer_posts_rss, writer_posts_atom
 
 urlpatterns = [
     url(r'^$', home, name='home_page'),
     url(r'^s/(?P<song_id>\d+)/comment$', post_comment, name='post_comment'),
+    url(r'^comment-token$', comment_token, name='comment_token'),
     url(r'^s/(?P<song_id>\d+)$', single_post, name='single_post'),
     url(r'^about$', about, name='about'),
+    url(r'^archives/(?P<year>\d{4})/(?P<month>\d{2})$', archive_month, name='archive_month'),
+    url(r'^feed$', latest_posts_rss, name='feed'),
+    url(r'^feed/atom$', latest_posts_atom, name='atom_feed'),
+    url(r'^feed/writer/(?P<writer_id>\d+)$', writer_posts_rss, name='writer_feed'),
+    url(r'^feed/writer/(?P<writer_id>\d+)/atom$', writer_posts_atom, name='writer_atom_feed'),
 ]
@@ -1,18 +1,77 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.exceptions import ObjectDoesNotExist
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.core.paginator import Paginator, EmptyPage
+from django.db.models import Max
+from django.http import HttpResponse, Http404, JsonResponse
 from blurber.models import Song
 from writers.models import Writer
 from tsj.models import PublicPost, Comment
 from tsj.forms import CommentForm
+from tsj.search import search
+from tsj.archives import get_archive_month, month_range
+from tsj import cache as page_cache
 
 from jukebox.settings import POSTS_PER_PAGE
 
+SEARCH_RESULTS_PER_PAGE = 20
+RECENT_COMMENTS = 12
+
 # Public-facing pages
 
 def get_writers():
     return Writer.objects.filter(is_active=True, public=True).order_by('last_name', 'first_name')
 
 
+def get_recent_comments():
+    return Comment.objects.filter(visible=True).select_related('song').order_by('-published_on')[:RECENT_COMMENTS]
+
+
+def public_context(**context):
+    # The sidebar querysets are lazy: blogroll.html only evaluates them
+    # when its cached fragments need re-rendering
+    context.update({
+        'writers': get_writers(),
+        'recent_comments': get_recent_comments()
+    })
+    return context
+
+
+def listing_validators(*models):
+    """
+    ETag and Last-Modified for a page listing posts, from the newest
+    last_modified of the given models (one indexed lookup each).
+    """
+    times = [model.objects.aggregate(latest=Max('last_modified'))['latest'] for model in models]
+    return page_cache.page_validators(times)
+
+
+def get_page_no(request):
+    try:
+        return max(int(request.GET.get('paged', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def get_cursor(request):
+    # Keyset pagination: each page starts after the last post of the previous
+    # one, given by ?before=<PublicPost id>, so deep pages cost the same as page 1
+    try:
+        return PublicPost.objects.values_list('published_on', 'id').get(id=int(request.GET['before']))
+    except (KeyError, ValueError, PublicPost.DoesNotExist):
+        return None
+
+
+def keyset_page(posts, cursor):
+    """A page of posts (newest first) starting after cursor, and the cursor for the next page if there is one."""
+    if cursor:
+        posts = posts.published_before(*cursor)
+    # Fetch one extra post to find out whether there is a next page
+    page = list(posts.newest_first().select_related('song')[:POSTS_PER_PAGE + 1])
+    next_cursor = page[POSTS_PER_PAGE - 1].id if len(page) > POSTS_PER_PAGE else None
+    return page[:POSTS_PER_PAGE], next_cursor
+
+
 def home(request):
     # Legacy redirect: ?p=123 goes to single_post with that Song ID
     if request.GET.get('p'):
@@ -23,75 +82,142 @@ def home(request):
             # Ignore silently
             pass
 
+    # Legacy redirect: ?feed=rss2 (or atom) goes to the feed
+    if request.GET.get('feed'):
+        return redirect('atom_feed' if request.GET['feed'] == 'atom' else 'feed', permanent=True)
+
+    # Legacy redirect: ?m=201803 goes to that month's archive
+    if request.GET.get('m'):
+        m = request.GET['m']
+        if len(m) == 6 and m.isdigit():
+            return redirect('archive_month', year=m[:4], month=m[4:])
+
+    page = get_page_no(request)
     if request.GET.get('s'):
-        results = PublicPost.objects.filter(
-            html_content__icontains=request.GET['s'],
-            include_in_search_results=True,
-            visible=True
-        )
-        return render(
+        # Results follow edits to the posts and to their songs' artist, title and tagline
+        etag, last_modified = listing_validators(PublicPost, Song)
+        response = page_cache.conditional_response(request, etag, last_modified)
+        if response:
+            return page_cache.set_validators(response, etag, last_modified)
+
+        paginator = Paginator(search(request.GET['s']), SEARCH_RESULTS_PER_PAGE)
+        try:
+            results = paginator.page(page)
+        except EmptyPage:
+            results = []
+        return page_cache.set_validators(render(
             request,
             template_name="search_results.html",
-            context={
-                'results': results,
-                'page_no': 1,  # TODO: pagination
-                'writers': get_writers()
-            }
+            context=public_context(
+                results=results,
+                query=request.GET['s'],
+                page_no=page
+            )
+        ), etag, last_modified)
+
+    etag, last_modified = listing_validators(PublicPost)
+    response = page_cache.conditional_response(request, etag, last_modified)
+    if response:
+        return page_cache.set_validators(response, etag, last_modified)
+
+    recent_posts = PublicPost.objects.filter(visible=True)
+    cursor = None
+    if request.GET.get('before'):
+        cursor = get_cursor(request)
+    elif page > 1:
+        # Legacy ?paged=N link: page N starts after the post numbered N - 1
+        # pages back from the newest, both found from the position index
+        newest = recent_posts.aggregate(newest=Max('position'))['newest'] or 0
+        cursor = recent_posts.filter(position=newest - (page - 1) * POSTS_PER_PAGE + 1).\
+            values_list('published_on', 'id').first()
+        if not cursor:
+            recent_posts = recent_posts.none()
+    recent_songs, next_cursor = keyset_page(recent_posts, cursor)
+
+    return page_cache.set_validators(render(
+        request,
+        template_name="home_page.html",
+        context=public_context(
+            recent_songs=recent_songs,
+            page_no=page,
+            next_cursor=next_cursor
         )
+    ), etag, last_modified)
 
-    # Pagination
-    page = 1
-    if request.GET.get('paged'):
-        try:
-            page = int(request.GET['paged'])
-        except ValueError:
-            pass
 
-    # Get last X songs (X determined by setting) offset by <page>
-    start, end = 0, POSTS_PER_PAGE
-    if page > 1:
-        end = page*5
-        start = end - POSTS_PER_PAGE
-    recent_songs = PublicPost.objects.filter(visible=True).order_by('-published_on')[start:end]
+def archive_month(request, year, month):
+    # The cached month list doubles as the check that the month has posts
+    archive = get_archive_month(int(year), int(month))
+    if archive is None:
+        raise Http404("No posts in %s/%s" % (year, month))
+
+    etag, last_modified = listing_validators(PublicPost)
+    response = page_cache.conditional_response(request, etag, last_modified)
+    if response:
+        return page_cache.set_validators(response, etag, last_modified)
 
-    return render(
+    start, end = month_range(archive.year, archive.month)
+    posts = PublicPost.objects.filter(visible=True, published_on__gte=start, published_on__lt=end)
+    month_posts, next_cursor = keyset_page(posts, get_cursor(request))
+
+    return page_cache.set_validators(render(
         request,
-        template_name="home_page.html",
-        context={
-            'recent_songs': recent_songs,
-            'page_no': page,
-            'writers': get_writers()
-        }
-    )
+        template_name="archive_month.html",
+        context=public_context(
+            archive=archive,
+            recent_songs=month_posts,
+            page_no=get_page_no(request),
+            next_cursor=next_cursor
+        )
+    ), etag, last_modified)
 
 
 def single_post(request, song_id):
-    song = get_object_or_404(Song, id=song_id)
-    comments = Comment.objects.filter(visible=True, song=song).order_by('published_on')
-    pp = get_object_or_404(PublicPost, song=song, visible=True)
-    # Get prev and next public posts (not Songs)
-    try:
-        next_song = pp.get_next_by_published_on(visible=True)
-    except ObjectDoesNotExist:
-        next_song = None
-    try:
-        prev_song = pp.get_previous_by_published_on(visible=True)
-    except ObjectDoesNotExist:
-        prev_song = None
+    # Serve the whole page from the cache if we can, see tsj.signals for invalidation
+    page = page_cache.get_single_post(song_id)
+    if page is not None:
+        html, etag, last_modified = page
+        response = page_cache.conditional_response(request, etag, last_modified) or \
+            HttpResponse(page_cache.with_csrf_token(request, html))
+        return page_cache.set_validators(response, etag, last_modified)
+
+    # Prev and next public posts (not Songs) are stored on the post itself
+    pp = get_object_or_404(
+        PublicPost.objects.select_related('song', 'previous_post__song', 'next_post__song'),
+        song_id=song_id, visible=True
+    )
+    comments = Comment.objects.filter(visible=True, song_id=song_id).order_by('published_on')
+
+    # Hidden comments count too, so that hiding one is a change
+    latest_comment = Comment.objects.filter(song_id=song_id).aggregate(latest=Max('last_modified'))['latest']
+    # Prev/next links show the neighbouring songs
+    neighbours = (pp.previous_post, pp.next_post)
+    etag, last_modified = page_cache.page_validators(
+        [pp.last_modified, pp.song.last_modified, latest_comment] +
+        [post.song.last_modified if post else None for post in neighbours],
+        pp.id, [post.id if post else None for post in neighbours]
+    )
+    response = page_cache.conditional_response(request, etag, last_modified)
+    if response:
+        return page_cache.set_validators(response, etag, last_modified)
 
-    return render(
+    response = render(
         request,
         template_name="single_post.html",
-        context={
-            'pp': pp,
-            'writers': get_writers(),
-            'form': CommentForm,
-            'comments': comments,
-            'comment_count': comments.count(),
-            'prev_song': prev_song,
-            'next_song': next_song
-        }
+        context=public_context(
+            pp=pp,
+            form=CommentForm,
+            comments=comments,
+            comment_count=comments.count(),
+            prev_song=pp.previous_post,
+            next_song=pp.next_post,
+            csrf_token=page_cache.CSRF_PLACEHOLDER
+        )
     )
+    html = response.content.decode(response.charset)
+    page_cache.set_single_post(song_id, html, etag, last_modified)
+    response.content = page_cache.with_csrf_token(request, html)
+    return page_cache.set_validators(response, etag, last_modified)
 
 
 def post_comment(request, song_id):
@@ -107,5 +233,12 @@ def post_comment(request, song_id):
     return redirect('single_post', song_id)
 
 
+@never_cache
+def comment_token(request):
+    # Static export pages have no token of their own: song.html fetches one
+    # from here (which also sets the CSRF cookie) before a comment is posted
+    return JsonResponse({'token': get_token(request)})
+
+
 def about(request):
     return render(request, template_name='about.html')
@@ -0,0 +1,320 @@
+"""
+Import of the old WordPress archive from a WXR export file.
+
+The file is parsed incrementally, one <item> at a time, and published
+posts are imported in batches: each batch creates its writers, songs,
+reviews, public posts and comments with bulk_create inside a single
+transaction. Songs keep their WordPress post IDs, so the legacy ?p=<id>
+links keep working. Imported songs are recorded as ImportedPosts and
+skipped on later runs, so an interrupted import can simply be run again;
+posts whose ID already belongs to a song created in the blurber are
+reported and left out.
+
+Reviews are read back out of the post HTML, which uses the same
+"<p><strong>Writer:</strong> blurb [score]</p>" layout as
+preview_source.html.
+"""
+import re
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from xml.etree import ElementTree
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.core.management.color import no_style
+from django.utils import timezone
+from django.utils.html import linebreaks, strip_tags
+from django.utils.text import slugify
+
+from blurber.models import Song, Review
+from tsj.models import PublicPost, Comment, ImportedPost
+from tsj.search import rebuild_index
+from writers.models import Writer
+
+# Namespace URIs by the prefix WordPress uses for them (the export
+# version in the URI changes between WordPress releases)
+NAMESPACES = (
+    ('excerpt', re.compile(r'^http://wordpress\.org/export/[\d.]+/excerpt/$')),
+    ('wp', re.compile(r'^http://wordpress\.org/export/[\d.]+/$')),
+    ('content', re.compile(r'^http://purl\.org/rss/1\.0/modules/content/$')),
+    ('dc', re.compile(r'^http://purl\.org/dc/elements/1\.1/$')),
+)
+
+REVIEW_RE = re.compile(
+    r'<p>\s*<strong>(?P<writer>.+?)</strong>\s*(?P<blurb>.*?)\[(?P<score>\d{1,2})\]\s*</p>',
+    re.DOTALL
+)
+LINK_RE = re.compile(r'<a\s[^>]*href="(?P<href>[^"]+)"[^>]*>(?P<text>.*?)</a>', re.DOTALL)
+IMAGE_RE = re.compile(r'<img\s[^>]*src="(?P<src>[^"]+)"')
+TITLE_SEPARATORS = (' – ', ' &#8211; ', ' - ', ' — ')
+
+
+def _tag(element):
+    # 'wp:post_id' rather than '{http://wordpress.org/export/1.2/}post_id'
+    if not element.tag.startswith('{'):
+        return element.tag
+    uri, name = element.tag[1:].split('}', 1)
+    for prefix, pattern in NAMESPACES:
+        if pattern.match(uri):
+            return '%s:%s' % (prefix, name)
+    return name
+
+
+def _children(element):
+    return {_tag(child): (child.text or '').strip() for child in element}
+
+
+def _parse_date(gmt_date, pub_date=''):
+    if gmt_date and not gmt_date.startswith('0000'):
+        return datetime.strptime(gmt_date, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    if pub_date:
+        return parsedate_to_datetime(pub_date)
+    return None
+
+
+def iter_items(source):
+    """
+    Yield a dict for each published post in a WXR file (a path or file
+    object), clearing each <item> once read so memory use stays flat.
+    """
+    channel = None
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if _tag(element) == 'channel':
+                channel = element
+            continue
+        if _tag(element) != 'item':
+            continue
+
+        fields = _children(element)
+        if fields.get('wp:post_type') == 'post' and fields.get('wp:status') == 'publish':
+            yield {
+                'id': int(fields['wp:post_id']),
+                'title': fields.get('title', ''),
+                'content': fields.get('content:encoded', ''),
+                'excerpt': fields.get('excerpt:encoded', ''),
+                'published_on': _parse_date(fields.get('wp:post_date_gmt'), fields.get('pubDate')),
+                'comments': [
+                    _children(comment) for comment in element
+                    if _tag(comment) == 'wp:comment'
+                ],
+            }
+        # Drop the item and everything read before it
+        element.clear()
+        if channel is not None:
+            channel.clear()
+
+
+def split_title(title):
+    """'Artist - Title' into (artist, title)."""
+    for separator in TITLE_SEPARATORS:
+        if separator in title:
+            artist, song_title = title.split(separator, 1)
+            return artist.strip(), song_title.strip()
+    return '', title.strip()
+
+
+def post_html(content):
+    # WordPress stores posts without paragraph tags and adds them on display
+    if '<p' not in content:
+        return linebreaks(content)
+    return content
+
+
+def parse_reviews(html):
+    """(writer name, bio link or None, blurb html, score) for each review in a post."""
+    reviews = []
+    for match in REVIEW_RE.finditer(html):
+        link = LINK_RE.search(match.group('writer'))
+        name = strip_tags(match.group('writer')).strip().rstrip(':').strip()
+        blurb = re.sub(r'(\s|<br\s*/?>)+$', '', match.group('blurb').strip().lstrip(':').strip())
+        if name:
+            reviews.append((name, link.group('href') if link else None, blurb, int(match.group('score'))))
+    return reviews
+
+
+def song_for_item(item, html):
+    artist, title = split_title(strip_tags(item['title']))
+    image = IMAGE_RE.search(html)
+    video = next((link.group('href') for link in LINK_RE.finditer(html)
+                  if strip_tags(link.group('text')).strip().lower() == 'video'), None)
+    return Song(
+        id=item['id'],
+        artist=artist[:256],
+        title=title[:400],
+        status='published',
+        tagline=strip_tags(item['excerpt'])[:255] or None,
+        image_url=image.group('src') if image else None,
+        youtube_link=video,
+        publish_date=item['published_on'],
+    )
+
+
+class WriterCache(object):
+    """Writers by full name, creating missing ones in bulk (inactive, with no usable password)."""
+
+    def __init__(self):
+        self.ids = {}
+        self.usernames = set(Writer.objects.values_list('username', flat=True))
+        for writer_id, first_name, last_name in Writer.objects.values_list('id', 'first_name', 'last_name'):
+            self.ids.setdefault(self.key("%s %s" % (first_name, last_name)), writer_id)
+
+    @staticmethod
+    def key(name):
+        return " ".join(name.lower().split())
+
+    def username_for(self, name):
+        base = slugify(name)[:240] or 'writer'
+        username, suffix = base, 1
+        while username in self.usernames:
+            suffix += 1
+            username = '%s-%s' % (base, suffix)
+        self.usernames.add(username)
+        return username
+
+    def ensure(self, writers):
+        """Create any of the given {name: bio link} writers that don't exist yet."""
+        new_writers = {}
+        for name, bio_link in writers.items():
+            if self.key(name) not in self.ids and self.key(name) not in new_writers:
+                first_name, _, last_name = name.rpartition(' ')
+                new_writers[self.key(name)] = Writer(
+                    username=self.username_for(name),
+                    first_name=(first_name or last_name)[:50],
+                    last_name=(last_name if first_name else '')[:50],
+                    password=make_password(None),
+                    bio_link=bio_link,
+                    is_active=False,
+                )
+        if new_writers:
+            Writer.objects.bulk_create(new_writers.values())
+            usernames = {writer.username: key for key, writer in new_writers.items()}
+            for writer_id, username in Writer.objects.filter(username__in=usernames).values_list('id', 'username'):
+                self.ids[usernames[username]] = writer_id
+
+    def __getitem__(self, name):
+        return self.ids[self.key(name)]
+
+
+def set_dates(model, field, dates, key='pk', batch_size=300):
+    """
+    Set a date field from {key value: date}, e.g. to put back the original
+    dates after bulk_create() overwrote auto_now_add fields with the current
+    time. One UPDATE per batch, each row taking three query parameters, to
+    stay within SQLite's limit of 999.
+    """
+    dates = list(dates.items())
+    for start in range(0, len(dates), batch_size):
+        batch = dates[start:start + batch_size]
+        model.objects.filter(**{key + '__in': [value for value, date in batch]}).update(**{field: Case(
+            *[When(then=Value(date), **{key: value}) for value, date in batch],
+            output_field=DateTimeField()
+        )})
+
+
+def import_batch(items, writers):
+    """
+    Import a batch of posts in one transaction. Returns the number imported
+    and the IDs of posts left out because a blurber song already has them.
+    """
+    with transaction.atomic():
+        taken = set(Song.objects.filter(id__in=[item['id'] for item in items]).values_list('id', flat=True))
+        imported = set(ImportedPost.objects.filter(song_id__in=taken).values_list('song_id', flat=True))
+        clashes = sorted(taken - imported)
+        items = [item for item in items if item['id'] not in taken and item['published_on']]
+        if not items:
+            return 0, clashes
+
+        parsed = []
+        for item in items:
+            html = post_html(item['content'])
+            parsed.append((item, html, parse_reviews(html)))
+        writers.ensure({name: bio_link for item, html, reviews in parsed for name, bio_link, blurb, score in reviews})
+
+        songs, review_rows, posts, comments = [], [], [], []
+        for item, html, reviews in parsed:
+            song = song_for_item(item, html)
+            # Score stats are worked out here, as the reviews skip Review.save()
+            song.saved_blurb_count, song.score_total, song.score_deviation_total = \
+                Song.score_stats([score for name, bio_link, blurb, score in reviews])
+            songs.append(song)
+            review_rows.extend(
+                Review(song_id=song.id, writer_id=writers[name], blurb=blurb, blurb_backup=blurb,
+                       score=score, sort_order=i + 1, status='published')
+                for i, (name, bio_link, blurb, score) in enumerate(reviews)
+            )
+            posts.append(PublicPost(song_id=song.id, html_content=html, published_on=item['published_on']))
+            comments.extend(
+                Comment(
+                    song_id=song.id,
+                    name=comment.get('wp:comment_author', '')[:100],
+                    mail=comment.get('wp:comment_author_email', '')[:100],
+                    website=comment.get('wp:comment_author_url', '')[:100] or None,
+                    comment_text=comment.get('wp:comment_content', ''),
+                    published_on=_parse_date(comment.get('wp:comment_date_gmt')) or item['published_on'],
+                )
+                for comment in item['comments']
+                if comment.get('wp:comment_approved') == '1' and comment.get('wp:comment_type', '') in ('', 'comment')
+            )
+
+        Song.objects.bulk_create(songs)
+        ImportedPost.objects.bulk_create(ImportedPost(song_id=song.id) for song in songs)
+        Review.objects.bulk_create(review_rows)
+        PublicPost.objects.bulk_create(posts)
+        # Taken before the insert, which sets them all to now
+        comment_dates = [comment.published_on for comment in comments]
+        Comment.objects.bulk_create(comments)
+        set_dates(Song, 'upload_date', {song.id: song.publish_date for song in songs})
+        # The batch's songs are new, so their comments are the ones just inserted, in order
+        comment_ids = Comment.objects.filter(song_id__in=[song.id for song in songs]).\
+            order_by('id').values_list('id', flat=True)
+        set_dates(Comment, 'published_on', {
+            comment_id: date for comment_id, date in zip(comment_ids, comment_dates)
+        })
+        # Reviews don't keep their own IDs, but share their post's date
+        set_dates(Review, 'create_date', {song.id: song.publish_date for song in songs}, key='song_id')
+
+        rebuild_index(PublicPost.objects.filter(song_id__in=[song.id for song in songs]))
+    return len(items), clashes
+
+
+def reset_sequences():
+    # Songs were inserted with explicit IDs; make sure new songs
+    # don't collide with them on backends with sequences
+    statements = connection.ops.sequence_reset_sql(no_style(), [Song])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def import_wxr(source, batch_size=500, progress=None):
+    """
+    Import the published posts from a WXR file. Returns (posts seen,
+    posts imported, IDs of posts clashing with blurber songs); already
+    imported posts are skipped. Prev/next links, writer stats and cached
+    pages are refreshed by the import_wordpress command once all batches
+    are in.
+    """
+    writers = WriterCache()
+    seen = imported = 0
+    clashes = []
+    batch = []
+    for item in iter_items(source):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            batch_imported, batch_clashes = import_batch(batch, writers)
+            seen, imported = seen + len(batch), imported + batch_imported
+            clashes.extend(batch_clashes)
+            batch = []
+            if progress:
+                progress(seen, imported)
+    if batch:
+        batch_imported, batch_clashes = import_batch(batch, writers)
+        seen, imported = seen + len(batch), imported + batch_imported
+        clashes.extend(batch_clashes)
+        if progress:
+            progress(seen, imported)
+    reset_sequences()
+    return seen, imported, clashes
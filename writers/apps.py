@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class WritersConfig(AppConfig):
     name = 'writers'
+
+    def ready(self):
+        import writers.signals  # noqa: F401
@@ -0,0 +1,100 @@
+import random
+import time
+from datetime import datetime
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blurber.models import Song, Review
+from writers.models import Writer
+
+
+class Command(BaseCommand):
+    help = "Time the editors' \"all writers by most recent blurb\" listing against generated writers and reviews. " \
+           "The fixture is created inside a transaction that is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=500)
+        parser.add_argument('--reviews', type=int, default=200000)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--legacy-runs', type=int, default=1, dest='legacy_runs',
+                            help="How many times to also time the old sort-in-Python listing.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            self.build_fixture(rng, options['writers'], options['reviews'])
+            self.stdout.write("Created %s writers and %s reviews in %.1fs" % (
+                options['writers'], options['reviews'], time.perf_counter() - start
+            ))
+
+            annotated = self.time_runs(
+                options['runs'],
+                lambda: [writer.last_blurb_on for writer in Writer.objects.by_most_recent_blurb()]
+            )
+            legacy = self.time_runs(
+                options['legacy_runs'],
+                lambda: sorted(Writer.objects.all(), key=self.legacy_last_blurb_date, reverse=True)
+            )
+
+            transaction.set_rollback(True)
+
+        self.report("Annotated query", annotated)
+        self.report("Legacy sort in Python", legacy)
+
+    @staticmethod
+    def legacy_last_blurb_date(writer):
+        # What Writer.last_blurb_date() used to do for every writer on the page
+        blurbs = writer.blurb_history()
+        if blurbs:
+            return blurbs[0].create_date
+        return datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    @staticmethod
+    def time_runs(runs, run):
+        timings = []
+        for i in range(runs):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)
+
+    def report(self, label, timings):
+        if not timings:
+            return
+        self.stdout.write(
+            "%s, %s runs: median %.1fms, max %.1fms" % (
+                label, len(timings), timings[len(timings) // 2] * 1000, timings[-1] * 1000
+            )
+        )
+
+    @staticmethod
+    def build_fixture(rng, writer_count, review_count, batch_size=5000):
+        Writer.objects.bulk_create([
+            Writer(username='benchmark-writer-%s' % i, first_name='Writer', last_name=str(i), password='!')
+            for i in range(writer_count)
+        ])
+        writer_ids = list(Writer.objects.filter(username__startswith='benchmark-writer-').values_list('pk', flat=True))
+
+        # About 20 blurbs per song, as on a busy week
+        Song.objects.bulk_create([
+            Song(artist='Artist %s' % i, title='Title %s' % i, status='published')
+            for i in range(max(1, review_count // 20))
+        ])
+        song_ids = list(Song.objects.filter(artist__startswith='Artist ').values_list('pk', flat=True))
+
+        # Review.save() maintains the song stats, which don't matter here, so insert in bulk
+        for start in range(0, review_count, batch_size):
+            Review.objects.bulk_create([
+                Review(
+                    writer_id=rng.choice(writer_ids),
+                    song_id=rng.choice(song_ids),
+                    blurb='Benchmark blurb',
+                    score=rng.randint(0, 10),
+                    status='published',
+                ) for i in range(start, min(start + batch_size, review_count))
+            ])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blurber.models import Review
+from writers.models import WriterMonthStats
+from writers.stats import REVIEW_FIELDS, compute_stats, rebuild_stats, stats_differ
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per writer, per month blurb statistics from the reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true', dest='check',
+            help="Only report writer months whose stored stats are out of date, don't rebuild them."
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = rebuild_stats()
+            self.stdout.write("Rebuilt stats for %s writer months." % rows)
+            return
+
+        computed = compute_stats(Review.objects.order_by().values_list(*REVIEW_FIELDS).iterator())
+        stored = {(row.writer_id, row.month): row for row in WriterMonthStats.objects.iterator()}
+        stale = 0
+        for key in sorted(set(computed) | set(stored)):
+            if key not in computed or key not in stored or stats_differ(stored[key], computed[key]):
+                stale += 1
+                self.stdout.write("Stale stats for writer %s, %s" % (key[0], key[1].strftime("%b %Y")))
+
+        self.stdout.write("Checked %s writer months, %s had stale stats." % (len(computed), stale))
+        if stale:
+            raise CommandError("%s writer months have stale stats." % stale)
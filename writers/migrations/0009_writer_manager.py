@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:44
+from __future__ import unicode_literals
+
+from django.db import migrations
+import writers.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('writers', '0008_auto_20180401_1435'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='writer',
+            managers=[
+                ('objects', writers.models.WriterManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 16:53
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('writers', '0009_writer_manager'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WriterMonthStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('blurbs_written', models.IntegerField(default=0)),
+                ('blurbs_published', models.IntegerField(default=0)),
+                ('blurbs_removed', models.IntegerField(default=0)),
+                ('scored_blurbs', models.IntegerField(default=0)),
+                ('score_total', models.IntegerField(default=0)),
+                ('deviation_total', models.FloatField(default=0)),
+                ('writer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'writer month stats',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='writermonthstats',
+            unique_together=set([('writer', 'month')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 18:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_month_stats(apps, schema_editor):
+    # Fills the table for existing reviews (it was created empty), and the new counts
+    from writers.stats import REVIEW_FIELDS, compute_stats
+    Review = apps.get_model('blurber', 'Review')
+    WriterMonthStats = apps.get_model('writers', 'WriterMonthStats')
+
+    computed = compute_stats(Review.objects.order_by().values_list(*REVIEW_FIELDS).iterator(), WriterMonthStats)
+    WriterMonthStats.objects.all().delete()
+    WriterMonthStats.objects.bulk_create(computed.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blurber', '0014_last_modified'),
+        ('writers', '0011_writer_last_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='writermonthstats',
+            name='blurbs_on_pending_songs',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='writermonthstats',
+            name='blurbs_on_published_songs',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_month_stats, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,35 @@ from django.contrib.auth.models import AbstractBaseUser, UserManager, Permission
 from django.utils import timezone
 
 
+class WriterQuerySet(models.QuerySet):
+
+    def with_last_blurb_date(self):
+        # A correlated subquery reads each writer's newest blurb straight off the
+        # (writer, create_date) index, where Max() would group every review
+        from blurber.models import Review
+        newest_blurb = Review.objects.filter(writer=models.OuterRef('pk')).order_by('-create_date')
+        return self.annotate(last_blurb_on=models.Subquery(newest_blurb.values('create_date')[:1]))
+
+    def by_most_recent_blurb(self):
+        # Writers with no blurbs go last, in the order they joined
+        return self.with_last_blurb_date().order_by(models.F('last_blurb_on').desc(nulls_last=True), 'id')
+
+    def with_recent_activity(self, since):
+        # Blurbs written since the given month, from the monthly stats table
+        recent_stats = WriterMonthStats.objects.filter(writer=models.OuterRef('pk'), month__gte=since).\
+            order_by().values('writer')
+        return self.annotate(
+            recent_blurbs=models.Subquery(
+                recent_stats.annotate(total=models.Sum('blurbs_written')).values('total'),
+                output_field=models.IntegerField()
+            )
+        )
+
+
+class WriterManager(UserManager.from_queryset(WriterQuerySet)):
+    pass
+
+
 class Writer(AbstractBaseUser, PermissionsMixin):
 
     username = models.CharField(max_length=254, unique=True)
@@ -22,8 +51,9 @@ class Writer(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
 
-    objects = UserManager()
+    objects = WriterManager()
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'email']
 
@@ -53,9 +83,12 @@ class Writer(AbstractBaseUser, PermissionsMixin):
 
     def last_blurb_date(self):
         # Return the date of their most recent blurb
-        blurbs = self.blurb_history()
-        if blurbs:
-            return blurbs[0].create_date
+        if hasattr(self, 'last_blurb_on'):
+            last_blurb_on = self.last_blurb_on
+        else:
+            last_blurb_on = self.review_set.aggregate(last=models.Max('create_date'))['last']
+        if last_blurb_on:
+            return last_blurb_on
         # No blurbs - return an old date
         return datetime(1970, 1, 1, tzinfo=timezone.utc)
 
@@ -65,3 +98,53 @@ class Writer(AbstractBaseUser, PermissionsMixin):
 
     def show_bio_link_in_blogroll(self):
         return self.public
+
+
+class WriterMonthStats(models.Model):
+    """
+    A writer's blurbs for one calendar month, so editors can see who is
+    active without counting reviews. Maintained by writers.stats.
+    """
+    writer = models.ForeignKey(Writer, related_name='month_stats', on_delete=models.CASCADE)
+    month = models.DateField(help_text="First day of the month")
+
+    blurbs_written = models.IntegerField(default=0)
+    blurbs_published = models.IntegerField(default=0)
+    blurbs_removed = models.IntegerField(default=0)
+    # Blurbs (not removed) by the status of their song, as the my_blurbs
+    # "pending" and "published" listings pick them
+    blurbs_on_pending_songs = models.IntegerField(default=0)
+    blurbs_on_published_songs = models.IntegerField(default=0)
+
+    # Over saved and published blurbs, the ones that count towards song scores
+    scored_blurbs = models.IntegerField(default=0)
+    score_total = models.IntegerField(default=0)
+    deviation_total = models.FloatField(default=0)
+
+    COUNT_FIELDS = (
+        'blurbs_written', 'blurbs_published', 'blurbs_removed', 'blurbs_on_pending_songs', 'blurbs_on_published_songs',
+        'scored_blurbs', 'score_total', 'deviation_total'
+    )
+
+    def __str__(self):
+        return "%s: %s" % (self.writer, self.month.strftime("%b %Y"))
+
+    @property
+    def blurbs_pending(self):
+        return self.blurbs_written - self.blurbs_published - self.blurbs_removed
+
+    def average_score(self):
+        if self.scored_blurbs > 0:
+            return round(self.score_total / self.scored_blurbs, 2)
+        return 0
+
+    def average_deviation(self):
+        # How far from the song's average score this writer's scores are
+        if self.scored_blurbs > 0:
+            return round(self.deviation_total / self.scored_blurbs, 2)
+        return 0
+
+    class Meta:
+        ordering = ['-month']
+        unique_together = ('writer', 'month')
+        verbose_name_plural = 'writer month stats'
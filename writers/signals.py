@@ -0,0 +1,39 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from blurber.models import Review, Song
+from blurber.signals import song_reviews_changed
+from writers import stats
+
+
+@receiver(song_reviews_changed)
+def refresh_song_writer_stats(sender, song, **kwargs):
+    # The song's average may have moved, which changes every reviewer's deviation
+    stats.refresh_stats(stats.review_months(song.review_set.all()))
+
+
+@receiver(post_save, sender=Song)
+def refresh_song_status_writer_stats(sender, instance, created=False, raw=False, **kwargs):
+    # Blurbs count as pending or published by their song's status
+    if raw or created:
+        return
+    if stats.song_listing(getattr(instance, '_loaded_status', instance.status)) == stats.song_listing(instance.status):
+        return
+    stats.refresh_stats(stats.review_months(instance.review_set.all()))
+
+
+@receiver(post_save, sender=Review)
+def refresh_previous_review_month(sender, instance, raw=False, **kwargs):
+    # Scripts and tests sometimes move a review to another writer or date.
+    # Review.from_db() remembers where it was, so there's nothing to look up
+    writer_id, create_date = getattr(instance, '_loaded_writer_id', None), getattr(instance, '_loaded_create_date', None)
+    if raw or writer_id is None or create_date is None:
+        return
+    previous = (writer_id, stats.month_start(create_date))
+    if previous != (instance.writer_id, stats.month_start(instance.create_date)):
+        stats.refresh_stats([previous])
+
+
+@receiver(post_delete, sender=Review)
+def refresh_deleted_review_month(sender, instance, **kwargs):
+    stats.refresh_stats([(instance.writer_id, stats.month_start(instance.create_date))])
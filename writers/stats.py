@@ -0,0 +1,145 @@
+"""
+Per writer, per month blurb statistics (WriterMonthStats).
+
+Rows are recomputed from the reviews table when a song's reviews or
+status change (see writers.signals); a review's deviation depends on the
+song's average, so every writer who blurbed the song is refreshed. rebuild_stats() and the
+rebuild_writer_stats command recompute the whole table.
+"""
+from datetime import date, datetime
+from functools import reduce
+from math import isclose
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+from blurber.models import Review, Song
+from writers.models import WriterMonthStats
+
+REVIEW_FIELDS = (
+    'writer_id', 'create_date', 'status', 'score', 'song__status', 'song__saved_blurb_count', 'song__score_total'
+)
+
+
+def month_start(when):
+    return timezone.localtime(when).date().replace(day=1)
+
+
+def month_range(month):
+    # Half-open [first of the month, first of the next month) in the current time zone
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return tuple(timezone.make_aware(datetime(d.year, d.month, 1)) for d in (month, next_month))
+
+
+def review_months(reviews):
+    """The (writer id, month) rows that the given reviews count towards."""
+    return {
+        (writer_id, month_start(create_date))
+        for writer_id, create_date in reviews.values_list('writer_id', 'create_date')
+    }
+
+
+def song_listing(song_status):
+    """Which of a writer's blurb listings, 'pending' or 'published', shows blurbs of a song with this status."""
+    if song_status in Song.IN_PROGRESS_STATUSES:
+        return 'pending'
+    if song_status == 'published':
+        return 'published'
+    return None
+
+
+def compute_stats(review_rows, stats_model=WriterMonthStats):
+    """
+    Build unsaved WriterMonthStats from REVIEW_FIELDS rows, keyed by (writer
+    id, month). Migrations pass in their historical stats model.
+    """
+    stats = {}
+    for writer_id, create_date, status, score, song_status, song_blurb_count, song_score_total in review_rows:
+        month = month_start(create_date)
+        row = stats.get((writer_id, month))
+        if row is None:
+            row = stats[writer_id, month] = stats_model(writer_id=writer_id, month=month)
+
+        row.blurbs_written += 1
+        if status == 'published':
+            row.blurbs_published += 1
+        elif status == 'removed':
+            row.blurbs_removed += 1
+
+        if status != 'removed':
+            listing = song_listing(song_status)
+            if listing == 'pending':
+                row.blurbs_on_pending_songs += 1
+            elif listing == 'published':
+                row.blurbs_on_published_songs += 1
+
+        if status in ('saved', 'published') and song_blurb_count:
+            # Compare against the song's average as shown on the post (see Song.average_score)
+            row.scored_blurbs += 1
+            row.score_total += score
+            row.deviation_total += abs(score - round(song_score_total / song_blurb_count, 2))
+    return stats
+
+
+def refresh_stats(writer_months):
+    """Recompute the given (writer id, month) rows from their reviews."""
+    writer_months = set(writer_months)
+    if not writer_months:
+        return
+
+    review_filter = reduce(or_, [
+        Q(writer_id=writer_id, create_date__gte=start, create_date__lt=end)
+        for writer_id, (start, end) in ((writer_id, month_range(month)) for writer_id, month in writer_months)
+    ])
+    computed = compute_stats(Review.objects.filter(review_filter).values_list(*REVIEW_FIELDS))
+
+    # Usually inside a review save or publish, so no savepoint of its own
+    with transaction.atomic(savepoint=False):
+        existing = {
+            (row.writer_id, row.month): row for row in WriterMonthStats.objects.select_for_update().filter(
+                reduce(or_, [Q(writer_id=writer_id, month=month) for writer_id, month in writer_months])
+            )
+        }
+        removed, added, changed = [], [], []
+        for key in writer_months:
+            new, old = computed.get(key), existing.get(key)
+            if new is None:
+                if old is not None:
+                    removed.append(old.id)
+            elif old is None:
+                added.append(new)
+            elif stats_differ(old, new):
+                new.id = old.id
+                changed.append(new)
+
+        # Publishing touches a row for every reviewer, so write them in a few statements rather than one each
+        if removed:
+            WriterMonthStats.objects.filter(id__in=removed).delete()
+        if added:
+            WriterMonthStats.objects.bulk_create(added)
+        if changed:
+            WriterMonthStats.objects.filter(id__in=[row.id for row in changed]).update(**{
+                field: Case(
+                    *[When(id=row.id, then=Value(getattr(row, field))) for row in changed],
+                    output_field=WriterMonthStats._meta.get_field(field)
+                ) for field in WriterMonthStats.COUNT_FIELDS
+            })
+
+
+def stats_differ(old, new):
+    # Deviation totals are floats summed in whatever order the reviews came back
+    return any(
+        not isclose(getattr(old, field), getattr(new, field), abs_tol=1e-9) for field in WriterMonthStats.COUNT_FIELDS
+    )
+
+
+def rebuild_stats():
+    """Replace the whole table with stats computed from every review. Returns the number of rows."""
+    computed = compute_stats(Review.objects.order_by().values_list(*REVIEW_FIELDS).iterator())
+    with transaction.atomic():
+        WriterMonthStats.objects.all().delete()
+        # No batch_size: the backend picks one within its limit on query parameters
+        WriterMonthStats.objects.bulk_create(computed.values())
+    return len(computed)
@@ -1,9 +1,15 @@
-from datetime import datetime
+import random
+from datetime import date, datetime
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 from django.utils import timezone
 
-from writers.models import Writer
+from writers.models import Writer, WriterMonthStats
+from writers.stats import rebuild_stats
 from blurber.models import Song, Review
+from blurber import publishing
 
 
 class WriterTests(TestCase):
@@ -89,3 +95,112 @@ class WriterTests(TestCase):
             self.writer.last_blurb_date(),
             datetime(2016, 1, 7, tzinfo=timezone.utc)
         )
+
+
+class WriterMonthStatsTests(TestCase):
+
+    def setUp(self):
+        self.kelly = Writer.objects.create(username='kelly', first_name='Kelly', last_name='Rowland')
+        self.michelle = Writer.objects.create(username='michelle', first_name='Michelle', last_name='Williams')
+        self.song = Song.objects.create(artist='Destiny\'s Child', title='Say My Name', status='closed')
+
+    def review(self, writer, score, status='saved', when=datetime(2016, 3, 10, tzinfo=timezone.utc), song=None):
+        review = Review.objects.create(song=song or self.song, writer=writer, score=score, blurb='-', status=status)
+        review.create_date = when
+        review.save()
+        return review
+
+    def stats(self, writer, month=date(2016, 3, 1)):
+        return WriterMonthStats.objects.get(writer=writer, month=month)
+
+    def assert_matches_rebuild(self):
+        stored = {
+            (row.writer_id, row.month): [getattr(row, field) for field in WriterMonthStats.COUNT_FIELDS]
+            for row in WriterMonthStats.objects.all()
+        }
+        rebuild_stats()
+        rebuilt = {
+            (row.writer_id, row.month): [getattr(row, field) for field in WriterMonthStats.COUNT_FIELDS]
+            for row in WriterMonthStats.objects.all()
+        }
+        self.assertEqual(stored.keys(), rebuilt.keys())
+        for key in stored:
+            for old, new in zip(stored[key], rebuilt[key]):
+                self.assertAlmostEqual(old, new, places=6)
+
+    def test_review_counts_towards_its_month(self):
+        self.review(self.kelly, 8)
+        self.review(self.kelly, 2, status='removed')
+        self.review(self.kelly, 5, status='draft')
+
+        stats = self.stats(self.kelly)
+        self.assertEqual(
+            (stats.blurbs_written, stats.blurbs_published, stats.blurbs_removed, stats.blurbs_pending),
+            (3, 0, 1, 2)
+        )
+        self.assertEqual(stats.average_score(), 8)
+        self.assertEqual(stats.average_deviation(), 0)
+
+    def test_moved_review_leaves_its_old_month(self):
+        review = self.review(self.kelly, 8)
+        review.create_date = datetime(2016, 4, 1, tzinfo=timezone.utc)
+        review.save()
+
+        self.assertFalse(WriterMonthStats.objects.filter(writer=self.kelly, month=date(2016, 3, 1)).exists())
+        self.assertEqual(self.stats(self.kelly, date(2016, 4, 1)).blurbs_written, 1)
+
+    def test_other_reviews_move_the_song_average(self):
+        self.review(self.kelly, 8, when=datetime(2016, 2, 28, tzinfo=timezone.utc))
+        michelles = self.review(self.michelle, 2)
+
+        self.assertEqual(self.stats(self.kelly, date(2016, 2, 1)).average_deviation(), 3)
+        self.assertEqual(self.stats(self.michelle).average_deviation(), 3)
+
+        michelles.delete()
+
+        self.assertEqual(self.stats(self.kelly, date(2016, 2, 1)).average_deviation(), 0)
+        self.assertFalse(WriterMonthStats.objects.filter(writer=self.michelle).exists())
+
+    def test_publishing_updates_published_counts(self):
+        self.review(self.kelly, 8)
+        self.review(self.michelle, 6)
+
+        publishing.run_job(publishing.enqueue_publish(self.song))
+
+        self.assertEqual(self.stats(self.kelly).blurbs_published, 1)
+        self.assertEqual(self.stats(self.michelle).blurbs_published, 1)
+        self.assert_matches_rebuild()
+
+    def test_incremental_stats_match_a_rebuild(self):
+        rng = random.Random(2001)
+        writers = [Writer.objects.create(username=str(i), first_name=str(i), last_name=str(i)) for i in range(6)]
+        songs = [Song.objects.create(artist=str(i), title=str(i)) for i in range(8)]
+        reviews = []
+        for i in range(60):
+            action = rng.random()
+            if action < 0.6 or not reviews:
+                when = datetime(2016, rng.randint(1, 3), rng.randint(1, 28), tzinfo=timezone.utc)
+                reviews.append(self.review(
+                    rng.choice(writers), rng.randint(0, 10), rng.choice(['draft', 'saved', 'published', 'removed']),
+                    when=when, song=rng.choice(songs)
+                ))
+            elif action < 0.85:
+                review = rng.choice(reviews)
+                review.score = rng.randint(0, 10)
+                review.status = rng.choice(['saved', 'published', 'removed'])
+                review.save()
+            else:
+                reviews.pop(rng.randrange(len(reviews))).delete()
+
+        self.assert_matches_rebuild()
+
+    def test_rebuild_command_fixes_stale_stats(self):
+        self.review(self.kelly, 8)
+        WriterMonthStats.objects.update(blurbs_written=99)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_writer_stats', check=True, stdout=StringIO())
+        call_command('rebuild_writer_stats', stdout=StringIO())
+        call_command('rebuild_writer_stats', check=True, stdout=StringIO())
+
+        self.assertEqual(self.stats(self.kelly).blurbs_written, 1)
@@ -1,11 +1,12 @@
-from datetime import datetime
+from datetime import date, datetime
 from django.utils import timezone
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 from writers.models import Writer
+from writers.views import current_year
 from blurber.models import Song, Review, ScheduledWeek
 
 
@@ -75,7 +76,7 @@ class WriterBaseViewTests(TestCase):
         self.assertContains(resp, "Your account doesn't have access to this page.")
 
 
-@patch('writers.views.CURRENT_YEAR', 2015)
+@patch('writers.views.current_year', Mock(return_value=2015))
 class WriterViewTests(WriterBaseViewTests):
 
     def test_my_blurbs_redirects_for_anon_user(self):
@@ -119,7 +120,83 @@ class WriterViewTests(WriterBaseViewTests):
             set(resp.context['reviews'])
         )
 
-    # TODO: Test coverage for blurbs listed by year
+    def test_pending_blurbs_match_year_index_counts(self):
+        removed_song = Song.objects.create(artist='Kendrick Lemar', title='Untitled', status='removed')
+        review = Review.objects.create(song=removed_song, writer=self.writer, score=2, blurb='Lost', status='saved')
+        review.create_date = datetime(2015, 4, 4, tzinfo=timezone.utc)
+        review.save()
+        r = self.client.force_login(self.writer)
+
+        resp = self.client.get(reverse('my_blurbs_by_year_and_status', kwargs={'year': 2015, 'status': 'saved'}))
+
+        # Pending means the song is still in progress, in the listing and the year links alike
+        self.assertEqual({self.saved_review}, set(resp.context['reviews']))
+        self.assertEqual(resp.context['year_index'][0]['saved'], 1)
+
+        removed_song.status = 'open'
+        removed_song.save()
+        resp = self.client.get(reverse('my_blurbs_by_year_and_status', kwargs={'year': 2015, 'status': 'saved'}))
+        self.assertEqual({self.saved_review, review}, set(resp.context['reviews']))
+        self.assertEqual(resp.context['year_index'][0]['saved'], 2)
+
+    def test_my_blurbs_by_year(self):
+        older_review = Review.objects.create(
+            song=self.song2,
+            writer=self.writer,
+            score=4,
+            blurb='Vintage',
+            status='saved'
+        )
+        older_review.create_date = datetime(2014, 12, 31, 23, 59, tzinfo=timezone.utc)
+        older_review.save()
+        r = self.client.force_login(self.writer)
+
+        resp = self.client.get(reverse('my_blurbs_by_year', kwargs={'year': 2014}))
+
+        self.assertEqual(resp.context['year'], 2014)
+        self.assertEqual([older_review], list(resp.context['reviews']))
+        self.assertEqual(
+            list(resp.context['year_index']),
+            [
+                {'year': 2015, 'total': 2, 'saved': 1, 'published': 1},
+                {'year': 2014, 'total': 1, 'saved': 1, 'published': 0},
+            ]
+        )
+        self.assertContains(resp, '<a href="%s">2015</a>' % reverse('my_blurbs_by_year', kwargs={'year': 2015}))
+
+        resp = self.client.get(
+            reverse('my_blurbs_by_year_and_status', kwargs={'year': 2015, 'status': 'published'})
+        )
+        self.assertEqual([self.published_review], list(resp.context['reviews']))
+
+    def test_my_blurbs_year_boundaries_are_half_open(self):
+        new_year_review = Review.objects.create(
+            song=self.song2,
+            writer=self.writer,
+            score=4,
+            blurb='Happy new year',
+            status='saved'
+        )
+        new_year_review.create_date = datetime(2016, 1, 1, tzinfo=timezone.utc)
+        new_year_review.save()
+        r = self.client.force_login(self.writer)
+
+        resp = self.client.get(reverse('my_blurbs'))
+        self.assertNotIn(new_year_review, resp.context['reviews'])
+
+        resp = self.client.get(reverse('my_blurbs_by_year', kwargs={'year': 2016}))
+        self.assertEqual([new_year_review], list(resp.context['reviews']))
+
+    def test_my_blurbs_query_count_does_not_grow_with_reviews(self):
+        for i in range(5):
+            Review.objects.create(song=self.song2, writer=self.writer, score=i, blurb='More', status='saved')
+        Review.objects.filter(blurb='More').update(create_date=datetime(2015, 6, 1, tzinfo=timezone.utc))
+        r = self.client.force_login(self.writer)
+
+        # Session, user, reviews with their songs and the year index
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('my_blurbs_by_year', kwargs={'year': 2015}))
+        self.assertEqual(len(resp.context['reviews']), 7)
 
     def test_writer_blurbs_hidden_for_writer(self):
         # Either for the writer themselves, or any other writer
@@ -165,6 +242,31 @@ class WriterViewTests(WriterBaseViewTests):
         self.assertTrue(resp.context['order_text'], "By Most Recent Blurb")
         self.assertContains(resp, "Sort alphabetically")
 
+    def test_writer_list_query_count_does_not_grow_with_writers(self):
+        for i in range(5):
+            writer = self.generate_writer('writer%s@example.com' % i)
+            Review.objects.create(song=self.song2, writer=writer, score=i, blurb='Fine', status='saved')
+        self.client.force_login(self.editor)
+
+        # Session, user and the annotated writers query
+        with self.assertNumQueries(3):
+            self.client.get(reverse('all_writers'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('all_writers_alphabetical'))
+
+    def test_writer_list_by_most_recent_orders_in_database(self):
+        newer = self.generate_writer('newer@example.com', first_name="Geri")
+        review = Review.objects.create(song=self.song2, writer=newer, score=3, blurb='Spicy', status='saved')
+        review.create_date = datetime(2015, 4, 4, tzinfo=timezone.utc)
+        review.save()
+        self.client.force_login(self.editor)
+
+        resp = self.client.get(reverse('all_writers'))
+
+        self.assertEqual(list(resp.context['writers']), [newer, self.writer, self.editor])
+        self.assertEqual(resp.context['writers'][0].last_blurb_on, datetime(2015, 4, 4, tzinfo=timezone.utc))
+        self.assertContains(resp, "Sat 04 Apr 2015")
+
     def test_writer_list_by_name_visible_for_editor(self):
         r = self.client.force_login(self.editor)
         resp = self.client.get(
@@ -197,6 +299,40 @@ class WriterViewTests(WriterBaseViewTests):
         self.assertContains(resp, "Andy Williams")
         self.assertContains(resp, "No blurbs yet")
 
+    def test_writer_stats_hidden_for_writer(self):
+        self.assert_view_hidden_for_writer(reverse('writer_stats', kwargs={'writer_id': self.writer.id}))
+
+    def test_writer_stats_reads_monthly_stats(self):
+        r = self.client.force_login(self.editor)
+
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('writer_stats', kwargs={'writer_id': self.writer.id}))
+
+        self.assertEqual(
+            [(m.month, m.blurbs_written, m.blurbs_published) for m in resp.context['months']],
+            [(date(2015, 3, 1), 1, 0), (date(2015, 2, 1), 1, 1)]
+        )
+        self.assertContains(resp, "Mar 2015")
+
+    @patch('writers.views.activity_since', Mock(return_value=date(2015, 3, 1)))
+    def test_writer_list_shows_recent_blurbs_from_stats(self):
+        r = self.client.force_login(self.editor)
+
+        resp = self.client.get(reverse('all_writers'))
+
+        self.assertEqual(resp.context['writers'][0].recent_blurbs, 1)
+        self.assertIsNone(resp.context['writers'][1].recent_blurbs)
+        self.assertContains(resp, reverse('writer_stats', kwargs={'writer_id': self.writer.id}))
+
+
+class CurrentYearTests(TestCase):
+
+    def test_current_year_is_looked_up_each_time(self):
+        with patch('writers.views.timezone.now', return_value=datetime(2018, 12, 31, 23, 59, tzinfo=timezone.utc)):
+            self.assertEqual(current_year(), 2018)
+        with patch('writers.views.timezone.now', return_value=datetime(2019, 1, 1, 0, 1, tzinfo=timezone.utc)):
+            self.assertEqual(current_year(), 2019)
+
 
 class RegistrationTests(WriterBaseViewTests):
 
@@ -1,33 +1,69 @@
 from datetime import datetime
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractYear
 from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
 
-from blurber.models import Review
-from writers.models import Writer
+from blurber.models import Review, Song
+from writers.models import Writer, WriterMonthStats
 
 
-CURRENT_YEAR = datetime.now().year
+def current_year():
+    # Looked up per request, so long-running processes move on at New Year
+    return timezone.localtime(timezone.now()).year
+
+
+def year_range(year):
+    # Half-open [1 Jan, next 1 Jan) in the current time zone, which can use
+    # the (writer, create_date) index where __year lookups might not
+    tz = timezone.get_current_timezone()
+    return timezone.make_aware(datetime(year, 1, 1), tz), timezone.make_aware(datetime(year + 1, 1, 1), tz)
 
 
 def get_reviews_by_status_and_year(writer, status, year):
 
+    year_start, year_end = year_range(int(year))
     reviews = Review.objects.filter(writer=writer).\
                 exclude(status='removed').\
-                filter(create_date__year=year)
+                filter(create_date__gte=year_start, create_date__lt=year_end).\
+                for_display()
 
     if status == 'saved':
-        reviews = reviews.filter(song__status__in=['open', 'closed'])
+        reviews = reviews.filter(song__status__in=Song.IN_PROGRESS_STATUSES)
     elif status == 'published':
         reviews = reviews.filter(song__status='published')
 
     return reviews
 
 
+def get_year_index(writer):
+    # Years with blurbs, newest first, with pending/published counts
+    # for the year links, from the monthly stats table
+    return WriterMonthStats.objects.filter(writer=writer).\
+        annotate(year=ExtractYear('month')).\
+        values('year').\
+        annotate(
+            total=Sum(F('blurbs_written') - F('blurbs_removed')),
+            # Counted by song status, like the listings filtered by them
+            saved=Sum('blurbs_on_pending_songs'),
+            published=Sum('blurbs_on_published_songs')
+        ).\
+        filter(total__gt=0).\
+        order_by('-year')
+
+
+def activity_since():
+    # The start of the month a year ago, for the writer list's recent activity
+    this_month = timezone.localtime(timezone.now()).date().replace(day=1)
+    return this_month.replace(year=this_month.year - 1)
+
+
 @login_required()
 def my_blurbs(request, status=None, year=None):
 
-    filter_year = year if year else CURRENT_YEAR
+    filter_year = int(year) if year else current_year()
     reviews = get_reviews_by_status_and_year(request.user, status, filter_year)
 
     return render(
@@ -37,6 +73,7 @@ def my_blurbs(request, status=None, year=None):
             'reviews': reviews,
             'status': status,
             'year': filter_year,
+            'year_index': get_year_index(request.user),
             'writer': request.user,
             'editor_view': False
         }
@@ -46,13 +83,13 @@ def my_blurbs(request, status=None, year=None):
 @staff_member_required(login_url='login')
 def all_writers(request, order='recent'):
     if order == 'name':
-        writers = Writer.objects.all().order_by('last_name', 'first_name')
+        writers = Writer.objects.with_last_blurb_date().order_by('last_name', 'first_name')
         order_text = 'By Name'
     else:
         # Default view: who's written most recently
-        ws = Writer.objects.all()
-        writers = sorted(ws, key=lambda x: x.last_blurb_date(), reverse=True)
+        writers = Writer.objects.by_most_recent_blurb()
         order_text = 'By Most Recent Blurb'
+    writers = writers.with_recent_activity(activity_since())
 
     return render(
         request,
@@ -72,7 +109,7 @@ def writer_blurbs(request, writer_id, status=None, year=None):
     # TODO: restrict editors admin privileges to blurb only
     writer = get_object_or_404(Writer, id=writer_id)
 
-    filter_year = year if year else CURRENT_YEAR
+    filter_year = int(year) if year else current_year()
     reviews = get_reviews_by_status_and_year(writer, status, filter_year)
 
     return render(
@@ -82,7 +119,24 @@ def writer_blurbs(request, writer_id, status=None, year=None):
             'reviews': reviews,
             'status': status,
             'year': filter_year,
+            'year_index': get_year_index(writer),
+            'writer': writer,
+            'editor_view': True
+        }
+    )
+
+
+@staff_member_required(login_url='login')
+def writer_stats(request, writer_id):
+    # Month by month activity for a writer, from the monthly stats table
+    writer = get_object_or_404(Writer, id=writer_id)
+
+    return render(
+        request,
+        'writer_stats.html',
+        {
             'writer': writer,
+            'months': writer.month_stats.all(),
             'editor_view': True
         }
     )